@@ -0,0 +1,287 @@
+"""Local stand-ins for the services the download pipeline talks to.
+
+Nothing here touches the network beyond 127.0.0.1, so benchmark runs are
+reproducible and can run offline.
+"""
+import json
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+from urllib.parse import urlparse, parse_qsl
+
+import httpx
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes = b'', content_type: str = 'application/json', headers: Optional[Dict[str, str]] = None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self.wfile.write(body)
+
+class _Server:
+    handler: type = _QuietHandler
+
+    def __init__(self):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), self.handler)
+        self.httpd.daemon_threads = True
+        self.httpd.owner = self
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class _MediaHandler(_QuietHandler):
+    def do_GET(self):
+        # /media/<bytes>/<name>: deterministic payload of the requested size
+        parts = urlparse(self.path).path.strip('/').split('/')
+        if len(parts) < 2 or parts[0] != 'media' or not parts[1].isdigit():
+            return self._send(404)
+        size = int(parts[1])
+        owner: FakeMediaServer = self.server.owner
+        if owner.latency:
+            time.sleep(owner.latency)
+        chunk = owner.chunk[:min(len(owner.chunk), size)]
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        remaining = size
+        while remaining > 0:
+            piece = chunk[:remaining]
+            self.wfile.write(piece)
+            remaining -= len(piece)
+
+class FakeMediaServer(_Server):
+    """Serves fixed-size media files at /media/<bytes>/<name>"""
+    handler = _MediaHandler
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.chunk = bytes(range(256)) * 256
+
+    def media_url(self, size: int, name: str = 'file.bin') -> str:
+        return f"{self.url}/media/{size}/{name}"
+
+def _matches(row: Dict[str, Any], column: str, expression: str) -> bool:
+    operator, _, value = expression.partition('.')
+    current = row.get(column)
+    if operator == 'in':
+        values = [v.strip('"') for v in value.strip('()').split(',')]
+        return str(current) in values
+    if operator == 'is':
+        return current is None if value == 'null' else str(current).lower() == value
+    if current is None:
+        return False
+    if operator == 'eq':
+        return str(current) == value
+    if operator == 'neq':
+        return str(current) != value
+    if operator in ('lt', 'lte', 'gt', 'gte'):
+        if isinstance(current, (int, float)):
+            value = float(value)
+        return {'lt': current < value, 'lte': current <= value, 'gt': current > value, 'gte': current >= value}[operator]
+    raise ValueError(f"Unsupported operator {operator}")
+
+class _PostgrestHandler(_QuietHandler):
+    def _table_and_filters(self):
+        parsed = urlparse(self.path)
+        path = parsed.path[len('/rest/v1/'):] if parsed.path.startswith('/rest/v1/') else None
+        params = parse_qsl(parsed.query, keep_blank_values=True)
+        return path, params
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else None
+
+    def _filtered(self, table: str, params) -> List[Dict[str, Any]]:
+        rows = self.server.owner.tables.setdefault(table, [])
+        for column, expression in params:
+            if column in ('select', 'order', 'limit', 'offset', 'or'):
+                continue
+            rows = [row for row in rows if _matches(row, column, expression)]
+        return rows
+
+    def _delay(self):
+        latency = self.server.owner.latency
+        if latency:
+            time.sleep(latency)
+
+    def do_GET(self):
+        self._delay()
+        table, params = self._table_and_filters()
+        owner: FakePostgrest = self.server.owner
+        with owner.lock:
+            rows = list(self._filtered(table, params))
+        options = dict(params)
+        if 'order' in options:
+            column, _, direction = options['order'].partition('.')
+            rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=direction == 'desc')
+        offset = int(options.get('offset', 0))
+        rows = rows[offset:]
+        if 'limit' in options:
+            rows = rows[:int(options['limit'])]
+        columns = options.get('select', '*')
+        if columns != '*':
+            names = [c.strip() for c in columns.split(',')]
+            rows = [{name: row.get(name) for name in names} for row in rows]
+        self._send(200, json.dumps(rows).encode())
+
+    def do_POST(self):
+        self._delay()
+        table, _ = self._table_and_filters()
+        body = self._body()
+        owner: FakePostgrest = self.server.owner
+        if table.startswith('rpc/'):
+            if table == 'rpc/bulk_update_download_records':
+                with owner.lock:
+                    by_id = {row['id']: row for row in owner.tables.setdefault('download_records', [])}
+                    for update in body['updates']:
+                        row = by_id.get(update['id'])
+                        if row is not None:
+                            row.update({k: v for k, v in update.items() if k != 'id'})
+                return self._send(204)
+            return self._send(404, json.dumps({'message': f"Unknown function {table}"}).encode())
+
+        rows = body if isinstance(body, list) else [body]
+        now = datetime.now(timezone.utc).isoformat()
+        with owner.lock:
+            for row in rows:
+                owner.tables.setdefault(table, []).append({'id': str(uuid.uuid4()), 'created_at': now, **row})
+        self._send(201)
+
+    def do_PATCH(self):
+        self._delay()
+        table, params = self._table_and_filters()
+        body = self._body()
+        with self.server.owner.lock:
+            for row in self._filtered(table, params):
+                row.update(body)
+        self._send(204)
+
+    def do_DELETE(self):
+        self._delay()
+        table, params = self._table_and_filters()
+        owner: FakePostgrest = self.server.owner
+        with owner.lock:
+            doomed = {id(row) for row in self._filtered(table, params)}
+            owner.tables[table] = [row for row in owner.tables.get(table, []) if id(row) not in doomed]
+        self._send(204)
+
+class FakePostgrest(_Server):
+    """In-memory PostgREST with the filters and RPCs the backend uses"""
+    handler = _PostgrestHandler
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.tables: Dict[str, List[Dict[str, Any]]] = {'download_records': [], 'subscriptions': []}
+
+    def records(self, **filters) -> List[Dict[str, Any]]:
+        with self.lock:
+            return [
+                dict(row) for row in self.tables['download_records']
+                if all(row.get(k) == v for k, v in filters.items())
+            ]
+
+class FakeYoutubeDL:
+    """Drop-in for yt_dlp.YoutubeDL that fetches a fixed-size file from the fake media server"""
+
+    media_server: FakeMediaServer = None
+    media_size = 1024 * 1024
+    extract_latency = 0.0
+
+    def __init__(self, params: Optional[Dict[str, Any]] = None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @staticmethod
+    def sanitize_info(info: Dict[str, Any]) -> Dict[str, Any]:
+        return info
+
+    def extract_info(self, url: str, download: bool = False, process: bool = True) -> Dict[str, Any]:
+        if self.extract_latency:
+            time.sleep(self.extract_latency)
+        video_id = url.rsplit('=', 1)[-1]
+        return {
+            'id': video_id,
+            'title': f"video {video_id}",
+            'duration': 60,
+            'formats': [{
+                'format_id': '18', 'ext': 'mp4', 'height': 360,
+                'url': self.media_server.media_url(self.media_size), 'filesize': self.media_size,
+            }],
+        }
+
+    def process_ie_result(self, info: Dict[str, Any], download: bool = True) -> Dict[str, Any]:
+        fmt = info['formats'][0]
+        if not download:
+            # Format selection only, as used by the size pre-flight
+            return {**info, **fmt}
+        target = Path(self.params['outtmpl'].replace('%(title)s', info['title']).replace('%(ext)s', fmt['ext']))
+        hooks = self.params.get('progress_hooks') or []
+        downloaded = 0
+        with httpx.stream('GET', fmt['url']) as response, open(target, 'wb') as out:
+            for chunk in response.iter_bytes(256 * 1024):
+                out.write(chunk)
+                downloaded += len(chunk)
+                for hook in hooks:
+                    hook({'status': 'downloading', 'downloaded_bytes': downloaded, 'total_bytes': fmt['filesize']})
+        for hook in hooks:
+            hook({'status': 'finished', 'downloaded_bytes': downloaded})
+        return info
+
+def fake_probe(path: Path) -> Dict[str, Any]:
+    """Stand-in for ffprobe: stub media is H.264/AAC, so the MP4 preset passes it through"""
+    return {'video_codec': 'h264', 'audio_codec': 'aac', 'audio_bitrate': 128000}
+
+class FakePost:
+    def __init__(self, shortcode: str, mediacount: int):
+        self.shortcode = shortcode
+        self.mediacount = mediacount
+
+class FakeInstaloader:
+    """Drop-in for instaloader.Instaloader that writes a carousel from the fake media server"""
+
+    media_server: FakeMediaServer = None
+    media_size = 256 * 1024
+    mediacount = 3
+
+    def __init__(self, **kwargs):
+        self.dirname_pattern = kwargs.get('dirname_pattern')
+        self.context = None
+
+    def download_post(self, post: FakePost, target: str):
+        for index in range(1, post.mediacount + 1):
+            response = httpx.get(self.media_server.media_url(self.media_size))
+            (Path(target) / f"{post.shortcode}_{index}.jpg").write_bytes(response.content)
+        return True
@@ -0,0 +1,341 @@
+"""Offline benchmark of the download pipeline.
+
+Starts the API under uvicorn against a fake PostgREST and a fake media
+server, with yt-dlp and instaloader replaced by stubs that fetch from the
+media server, then measures:
+
+- request latency and throughput of the download endpoints
+- jobs/sec of a download worker, and memory per job
+- file-serving throughput
+- event-loop blocking in the API process
+
+Results are printed (or written with --output) as JSON so runs can be
+compared. Run from the backend directory:
+
+    python -m benchmarks.run --requests 200 --concurrency 20
+
+With --server production the API runs as serve.py does in deployment
+(one process per --api-workers, uvloop, httptools) instead of a single
+in-process uvicorn; the download worker stays in the benchmark process.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import socket
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+from pathlib import Path
+from typing import Dict, Any, List
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000,
+        'p50_ms': pick(0.50) * 1000,
+        'p95_ms': pick(0.95) * 1000,
+        'p99_ms': pick(0.99) * 1000,
+        'max_ms': ordered[-1] * 1000,
+    }
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def max_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+class LoopProbe:
+    """Samples how late the API event loop runs a callback scheduled every ``interval``"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, loop.time() - expected))
+
+    def start(self):
+        asyncio.get_running_loop().create_task(self.run())
+
+    def report(self) -> Dict[str, Any]:
+        result = percentiles(self.lags)
+        result['blocked_over_50ms'] = sum(1 for lag in self.lags if lag > 0.05)
+        return result
+
+async def fire(client: httpx.AsyncClient, requests: List[Dict[str, Any]], concurrency: int) -> Dict[str, Any]:
+    """Send requests with bounded concurrency, returning latencies and responses"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    responses: List[httpx.Response] = []
+
+    async def one(spec: Dict[str, Any]):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.request(**spec)
+            await response.aread()
+            latencies.append(time.perf_counter() - started)
+            responses.append(response)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(spec) for spec in requests))
+    elapsed = time.perf_counter() - started
+    return {'latencies': latencies, 'responses': responses, 'elapsed': elapsed}
+
+def process_rss_mb(pid: int) -> float:
+    """Resident memory of a process and its children, from /proc (0 where unavailable)"""
+    try:
+        children = Path(f"/proc/{pid}/task/{pid}/children").read_text().split()
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024 + sum(process_rss_mb(int(child)) for child in children)
+    except (OSError, ValueError):
+        pass
+    return 0.0
+
+def start_production_server(args, port: int) -> subprocess.Popen:
+    """Run serve.py with the benchmark environment and wait until it answers"""
+    env = {**os.environ, 'API_WORKERS': str(args.api_workers)}
+    server = subprocess.Popen([sys.executable, str(BACKEND_DIR / 'serve.py')], env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"serve.py exited with {server.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.05)
+    server.terminate()
+    raise RuntimeError("serve.py did not start within 60s")
+
+def configure_environment(args, workdir: Path, postgrest_url: str, port: int):
+    os.chdir(workdir)
+    os.environ.update({
+        'HOST': '127.0.0.1',
+        # Also names this node in stored records, so the API serves the worker's files itself
+        'PORT': str(port),
+        'SUPABASE_URL': postgrest_url,
+        'SUPABASE_SERVICE_ROLE_KEY': 'benchmark',
+        'YOUTUBE_WORKERS': str(args.workers),
+        'INSTAGRAM_WORKERS': str(max(1, args.workers // 2)),
+        'MAX_QUEUED_DOWNLOADS': str(args.requests * 2),
+        'MAX_CONCURRENT_JOBS_PER_USER': '0',
+        'RATE_LIMIT_FREE_PER_MINUTE': '0',
+        'RATE_LIMIT_YOUTUBE_PER_MINUTE': '0',
+        'RATE_LIMIT_INSTAGRAM_PER_MINUTE': '0',
+        'CLEANUP_INTERVAL_SECONDS': '0',
+        'EMBEDDED_WORKER': 'False',
+        'FILE_SERVING_MODE': 'python',
+        'WORKER_POLL_INTERVAL': '0.05',
+        # The stub extractor has no separate video/audio streams
+        'YTDLP_PARALLEL_STREAMS': 'False',
+    })
+    sys.path.insert(0, str(BACKEND_DIR))
+
+def run(args) -> Dict[str, Any]:
+    from benchmarks.fakes import FakeMediaServer, FakePostgrest, FakeYoutubeDL, FakeInstaloader, FakePost, fake_probe
+
+    media_server = FakeMediaServer(latency=args.media_latency_ms / 1000).start()
+    postgrest = FakePostgrest(latency=args.db_latency_ms / 1000).start()
+    workdir = Path(tempfile.mkdtemp(prefix='medigrabber-bench-'))
+    port = free_port()
+    configure_environment(args, workdir, postgrest.url, port)
+
+    import uvicorn
+    import yt_dlp
+    import instaloader
+    FakeYoutubeDL.media_server = media_server
+    FakeYoutubeDL.media_size = args.media_kb * 1024
+    FakeYoutubeDL.extract_latency = args.extract_latency_ms / 1000
+    FakeInstaloader.media_server = media_server
+    FakeInstaloader.media_size = args.media_kb * 1024
+    yt_dlp.YoutubeDL = FakeYoutubeDL
+    instaloader.Instaloader = FakeInstaloader
+    # Stub media is not decodable; report codecs that need no post-processing
+    import utils.transcode
+    utils.transcode.probe = fake_probe
+
+    import main
+    from worker import Worker
+    # Per-request client logs would dominate the run
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    main.get_instagram_post = lambda context, shortcode: FakePost(shortcode, FakeInstaloader.mediacount)
+
+    results: Dict[str, Any] = {}
+    started = time.perf_counter()
+    if args.server == 'production':
+        # The API processes import the real extractors lazily; only the in-process worker uses the stubs
+        production_server = start_production_server(args, port)
+    else:
+        probe = LoopProbe()
+        main.app.router.on_startup.append(probe.start)
+        server = uvicorn.Server(uvicorn.Config(main.app, host='127.0.0.1', port=port, log_level='warning', lifespan='on'))
+        server_thread = threading.Thread(target=server.run, daemon=True)
+        server_thread.start()
+        while not server.started:
+            time.sleep(0.01)
+    results['startup_seconds'] = time.perf_counter() - started
+    base_url = f"http://127.0.0.1:{port}"
+    instagram_every = int(1 / args.instagram_ratio) if args.instagram_ratio else 0
+    download_requests = []
+    for i in range(args.requests):
+        # download_records.user_id references auth.users, so ids must be UUIDs
+        user_id = str(uuid.UUID(int=i % args.users + 1))
+        if instagram_every and i % instagram_every == 0:
+            download_requests.append({'method': 'POST', 'url': '/api/instagram/download', 'json': {
+                'url': f"https://www.instagram.com/p/BENCH{i:06d}/", 'media_type': 'post', 'user_id': user_id
+            }})
+        else:
+            download_requests.append({'method': 'POST', 'url': '/api/youtube/download', 'json': {
+                'url': f"https://www.youtube.com/watch?v=bench{i:06d}", 'media_type': 'video', 'user_id': user_id
+            }})
+
+    async def enqueue_phase():
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+            return await fire(client, download_requests, args.concurrency)
+
+    outcome = asyncio.run(enqueue_phase())
+    errors = sum(1 for r in outcome['responses'] if r.status_code >= 400)
+    results['enqueue'] = {
+        **percentiles(outcome['latencies']),
+        'requests_per_second': len(download_requests) / outcome['elapsed'],
+        'errors': errors,
+    }
+
+    # Jobs: drain the queue with one worker process' worth of threads
+    tracemalloc.start()
+    rss_before = max_rss_mb()
+    worker = Worker(main.job_queue, worker_id='benchmark')
+    worker_thread = threading.Thread(target=worker.run, daemon=True)
+    started = time.perf_counter()
+    worker_thread.start()
+    expected = len(download_requests) - errors
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        main.record_writer.flush()
+        finished = len(postgrest.records(status='completed')) + len(postgrest.records(status='failed'))
+        if finished >= expected:
+            break
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    worker.stop()
+    worker_thread.join(timeout=args.timeout)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    completed = postgrest.records(status='completed')
+    results['jobs'] = {
+        'completed': len(completed),
+        'failed': len(postgrest.records(status='failed')),
+        'seconds': elapsed,
+        'jobs_per_second': len(completed) / elapsed if elapsed else 0.0,
+        'timed_out': finished < expected,
+    }
+    results['memory'] = {
+        'traced_peak_mb': peak / (1024 * 1024),
+        'traced_peak_kb_per_job': peak / 1024 / max(1, len(completed)),
+        'max_rss_mb': max_rss_mb(),
+        'max_rss_growth_mb': max_rss_mb() - rss_before,
+    }
+
+    # File serving: fetch finished downloads concurrently
+    serve_requests = [
+        {'method': 'GET', 'url': f"/api/download/{record['id']}/file", 'params': {'user_id': record['user_id']}}
+        for record in (completed * (args.serve_requests // max(1, len(completed)) + 1))[:args.serve_requests]
+    ]
+
+    async def serve_phase():
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+            return await fire(client, serve_requests, args.concurrency)
+
+    if serve_requests:
+        outcome = asyncio.run(serve_phase())
+        served = sum(len(r.content) for r in outcome['responses'] if r.status_code == 200)
+        results['serve'] = {
+            **percentiles(outcome['latencies']),
+            'megabytes_per_second': served / (1024 * 1024) / outcome['elapsed'],
+            'errors': sum(1 for r in outcome['responses'] if r.status_code >= 400),
+        }
+
+    if args.server == 'production':
+        # Event-loop lag cannot be sampled in other processes
+        results['api_rss_mb'] = process_rss_mb(production_server.pid)
+        production_server.send_signal(signal.SIGTERM)
+        production_server.wait(timeout=30)
+    else:
+        results['event_loop'] = probe.report()
+        server.should_exit = True
+        server_thread.join(timeout=10)
+    media_server.stop()
+    postgrest.stop()
+
+    return {
+        'config': vars(args),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'timestamp': time.time(),
+        },
+        'results': results,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100, help="download requests to send")
+    parser.add_argument('--concurrency', type=int, default=10, help="concurrent client connections")
+    parser.add_argument('--users', type=int, default=10, help="distinct users the requests are spread over")
+    parser.add_argument('--workers', type=int, default=4, help="YouTube download threads of the worker")
+    parser.add_argument('--instagram-ratio', type=float, default=0.2, help="share of Instagram requests")
+    parser.add_argument('--media-kb', type=int, default=1024, help="size of each fake media file")
+    parser.add_argument('--media-latency-ms', type=float, default=0, help="latency of the fake media server")
+    parser.add_argument('--db-latency-ms', type=float, default=2, help="latency of the fake PostgREST")
+    parser.add_argument('--extract-latency-ms', type=float, default=50, help="time the stub extractor takes")
+    parser.add_argument('--serve-requests', type=int, default=100, help="file downloads to measure")
+    parser.add_argument('--timeout', type=float, default=300, help="seconds to wait for the jobs to finish")
+    parser.add_argument('--server', choices=('inprocess', 'production'), default='inprocess',
+                        help="run the API in the benchmark process or as serve.py does in deployment")
+    parser.add_argument('--api-workers', type=int, default=0,
+                        help="API processes with --server production (0 = one per CPU core)")
+    parser.add_argument('--output', help="write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        Path(args.output).write_text(report)
+    else:
+        print(report)
+
+if __name__ == "__main__":
+    main()
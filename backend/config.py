@@ -1,25 +1,153 @@
 import os
 from pathlib import Path
-from typing import Optional
+from typing import Optional, List, Tuple
 
 class Settings:
     # Supabase
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_SERVICE_KEY: str = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
     
+    # Database connection pools (per process)
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "20"))
+    DB_TIMEOUT_SECONDS: float = float(os.getenv("DB_TIMEOUT_SECONDS", "10"))
+    DB_CONNECT_TIMEOUT_SECONDS: float = float(os.getenv("DB_CONNECT_TIMEOUT_SECONDS", "5"))
+    
     # Server
     HOST: str = os.getenv("HOST", "0.0.0.0")
     PORT: int = int(os.getenv("PORT", "8000"))
     DEBUG: bool = os.getenv("DEBUG", "True").lower() == "true"
     
+    # Production server (serve.py; 0 workers = one per CPU core)
+    API_WORKERS: int = int(os.getenv("API_WORKERS", "0"))
+    KEEPALIVE_TIMEOUT_SECONDS: int = int(os.getenv("KEEPALIVE_TIMEOUT_SECONDS", "75"))
+    SHUTDOWN_GRACE_SECONDS: float = float(os.getenv("SHUTDOWN_GRACE_SECONDS", "30"))
+    
     # Downloads
-    DOWNLOADS_DIR: Path = Path("downloads")
+    DOWNLOADS_DIR: Path = Path(os.getenv("DOWNLOADS_DIR", "downloads"))
     MAX_FILE_SIZE_MB: int = int(os.getenv("MAX_FILE_SIZE_MB", "500"))
+    MAX_FILE_SIZE_MB_BY_PLAN = {
+        'free': MAX_FILE_SIZE_MB,
+        'pro': int(os.getenv("PRO_MAX_FILE_SIZE_MB", "4096")),
+    }
     CLEANUP_AFTER_DAYS: int = int(os.getenv("CLEANUP_AFTER_DAYS", "7"))
+    CLEANUP_INTERVAL_SECONDS: int = int(os.getenv("CLEANUP_INTERVAL_SECONDS", "600"))
+    CLEANUP_BATCH_SIZE: int = int(os.getenv("CLEANUP_BATCH_SIZE", "500"))
+    CLEANUP_MAX_BATCHES: int = int(os.getenv("CLEANUP_MAX_BATCHES", "20"))
+    CLEANUP_MAX_DISK_MB: int = int(os.getenv("CLEANUP_MAX_DISK_MB", "0"))
+    CLEANUP_ORPHAN_GRACE_SECONDS: int = int(os.getenv("CLEANUP_ORPHAN_GRACE_SECONDS", "3600"))
+    CLEANUP_INDEX_PATH: Path = Path(os.getenv("CLEANUP_INDEX_PATH", "data/disk_usage.db"))
+    CLEANUP_LOCK_PATH: Path = Path(os.getenv("CLEANUP_LOCK_PATH", "data/cleanup.lock"))
+    MEDIA_CACHE_DIR: Path = Path(os.getenv("MEDIA_CACHE_DIR", "downloads/.cache"))
+    MEDIA_CACHE_MAX_MB: int = int(os.getenv("MEDIA_CACHE_MAX_MB", "10240"))
+    PARTIAL_DOWNLOAD_MAX_AGE_HOURS: float = float(os.getenv("PARTIAL_DOWNLOAD_MAX_AGE_HOURS", "24"))
+    INFO_CACHE_PATH: Path = Path(os.getenv("INFO_CACHE_PATH", "data/info_cache.db"))
+    INFO_CACHE_TTL_SECONDS: int = int(os.getenv("INFO_CACHE_TTL_SECONDS", "1800"))
+    
+    # yt-dlp transfer tuning
+    YTDLP_CONCURRENT_FRAGMENTS: int = int(os.getenv("YTDLP_CONCURRENT_FRAGMENTS", "4"))
+    YTDLP_HTTP_CHUNK_SIZE_MB: int = int(os.getenv("YTDLP_HTTP_CHUNK_SIZE_MB", "10"))
+    YTDLP_ARIA2C_CONNECTIONS: int = int(os.getenv("YTDLP_ARIA2C_CONNECTIONS", "0"))
+    YTDLP_PARALLEL_STREAMS: bool = os.getenv("YTDLP_PARALLEL_STREAMS", "True").lower() == "true"
+    
+    # ffmpeg post-processing (0 workers = one per CPU core)
+    TRANSCODE_WORKERS: int = int(os.getenv("TRANSCODE_WORKERS", "0"))
+    TRANSCODE_FFMPEG_THREADS: int = int(os.getenv("TRANSCODE_FFMPEG_THREADS", "1"))
+    TRANSCODE_SLOTS_DIR: Path = Path(os.getenv("TRANSCODE_SLOTS_DIR", "data/transcode-slots"))
+    
+    # Storage of completed downloads ('local', 'shared' or 's3')
+    STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "local")
+    NODE_URL: str = os.getenv("NODE_URL", "")
+    NODE_PROXY_TIMEOUT_SECONDS: float = float(os.getenv("NODE_PROXY_TIMEOUT_SECONDS", "10"))
+    S3_BUCKET: str = os.getenv("S3_BUCKET", "medigrabber-downloads")
+    S3_ENDPOINT_URL: Optional[str] = os.getenv("S3_ENDPOINT_URL") or None
+    S3_PUBLIC_ENDPOINT_URL: Optional[str] = os.getenv("S3_PUBLIC_ENDPOINT_URL") or None
+    S3_REGION: Optional[str] = os.getenv("S3_REGION") or None
+    S3_ACCESS_KEY_ID: Optional[str] = os.getenv("S3_ACCESS_KEY_ID") or None
+    S3_SECRET_ACCESS_KEY: Optional[str] = os.getenv("S3_SECRET_ACCESS_KEY") or None
+    S3_PRESIGN_EXPIRES_SECONDS: int = int(os.getenv("S3_PRESIGN_EXPIRES_SECONDS", "3600"))
+    S3_MULTIPART_CHUNK_MB: int = int(os.getenv("S3_MULTIPART_CHUNK_MB", "16"))
+    S3_UPLOAD_CONCURRENCY: int = int(os.getenv("S3_UPLOAD_CONCURRENCY", "4"))
+    S3_SERVE_MODE: str = os.getenv("S3_SERVE_MODE", "redirect")
+    
+    # File serving ('python' streams from the API, 'x-accel' hands off to nginx)
+    FILE_SERVING_MODE: str = os.getenv("FILE_SERVING_MODE", "python")
+    X_ACCEL_PREFIX: str = os.getenv("X_ACCEL_PREFIX", "/_protected_downloads/")
+    
+    # Download record write-behind
+    RECORD_WRITER_BATCH_SIZE: int = int(os.getenv("RECORD_WRITER_BATCH_SIZE", "100"))
+    RECORD_WRITER_FLUSH_INTERVAL: float = float(os.getenv("RECORD_WRITER_FLUSH_INTERVAL", "0.05"))
+    RECORD_WRITER_INSERT_TIMEOUT: float = float(os.getenv("RECORD_WRITER_INSERT_TIMEOUT", "10"))
+    
+    # Subscription cache
+    SUBSCRIPTION_CACHE_PATH: Path = Path(os.getenv("SUBSCRIPTION_CACHE_PATH", "data/subscriptions.db"))
+    SUBSCRIPTION_CACHE_TTL_SECONDS: int = int(os.getenv("SUBSCRIPTION_CACHE_TTL_SECONDS", "300"))
+    SUBSCRIPTION_CACHE_NEGATIVE_TTL_SECONDS: int = int(os.getenv("SUBSCRIPTION_CACHE_NEGATIVE_TTL_SECONDS", "300"))
+    SUBSCRIPTION_CACHE_MAX_ENTRIES: int = int(os.getenv("SUBSCRIPTION_CACHE_MAX_ENTRIES", "10000"))
+    SUBSCRIPTION_CHANGE_POLL_SECONDS: float = float(os.getenv("SUBSCRIPTION_CHANGE_POLL_SECONDS", "5"))
+    
+    # Live progress
+    PROGRESS_DB_PATH: Path = Path(os.getenv("PROGRESS_DB_PATH", "data/progress.db"))
+    PROGRESS_MIN_INTERVAL: float = float(os.getenv("PROGRESS_MIN_INTERVAL", "1.0"))
+    PROGRESS_POLL_INTERVAL: float = float(os.getenv("PROGRESS_POLL_INTERVAL", "0.5"))
+    SSE_KEEPALIVE_SECONDS: float = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+    
+    # Download workers
+    YOUTUBE_WORKERS: int = int(os.getenv("YOUTUBE_WORKERS", "4"))
+    INSTAGRAM_WORKERS: int = int(os.getenv("INSTAGRAM_WORKERS", "2"))
+    MAX_QUEUED_DOWNLOADS: int = int(os.getenv("MAX_QUEUED_DOWNLOADS", "50"))
+    
+    # Job queue
+    JOB_QUEUE_PATH: Path = Path(os.getenv("JOB_QUEUE_PATH", "data/jobs.db"))
+    JOB_LEASE_SECONDS: int = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_RETRY_BACKOFF_SECONDS: float = float(os.getenv("JOB_RETRY_BACKOFF_SECONDS", "30"))
+    WORKER_POLL_INTERVAL: float = float(os.getenv("WORKER_POLL_INTERVAL", "1.0"))
+    WORKER_HEARTBEAT_TIMEOUT: float = float(os.getenv("WORKER_HEARTBEAT_TIMEOUT", "30"))
+    # Keep below supervisord's stopwaitsecs, which in turn stays below JOB_LEASE_SECONDS
+    WORKER_SHUTDOWN_GRACE_SECONDS: float = float(os.getenv("WORKER_SHUTDOWN_GRACE_SECONDS", "240"))
+    READINESS_TIMEOUT_SECONDS: float = float(os.getenv("READINESS_TIMEOUT_SECONDS", "2"))
+    EMBEDDED_WORKER: bool = os.getenv("EMBEDDED_WORKER", "False").lower() == "true"
+    MAX_CONCURRENT_JOBS_PER_USER: int = int(os.getenv("MAX_CONCURRENT_JOBS_PER_USER", "3"))
+    PRO_SCHEDULING_WEIGHT: float = float(os.getenv("PRO_SCHEDULING_WEIGHT", "3"))
+    SCHEDULER_AGING_SECONDS: float = float(os.getenv("SCHEDULER_AGING_SECONDS", "60"))
+    
+    # Rate limits (downloads per minute, 0 disables)
+    RATE_LIMIT_PATH: Path = Path(os.getenv("RATE_LIMIT_PATH", "data/rate_limits.db"))
+    RATE_LIMIT_FREE_PER_MINUTE: int = int(os.getenv("RATE_LIMIT_FREE_PER_MINUTE", "10"))
+    RATE_LIMIT_PRO_PER_MINUTE: int = int(os.getenv("RATE_LIMIT_PRO_PER_MINUTE", "30"))
+    PLATFORM_RATE_LIMITS = {
+        'YouTube': int(os.getenv("RATE_LIMIT_YOUTUBE_PER_MINUTE", "300")),
+        'Instagram': int(os.getenv("RATE_LIMIT_INSTAGRAM_PER_MINUTE", "60")),
+    }
+    
+    # Batch downloads
+    BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "50"))
+    BATCH_MAX_PLAYLIST_ITEMS: int = int(os.getenv("BATCH_MAX_PLAYLIST_ITEMS", "50"))
+    BATCH_MAX_PROFILE_POSTS: int = int(os.getenv("BATCH_MAX_PROFILE_POSTS", "24"))
     
     # Instagram (optional)
     INSTAGRAM_USERNAME: Optional[str] = os.getenv("INSTAGRAM_USERNAME")
     INSTAGRAM_PASSWORD: Optional[str] = os.getenv("INSTAGRAM_PASSWORD")
+    # Further accounts to rotate across, as "user:password,user:password"
+    INSTAGRAM_ACCOUNTS: str = os.getenv("INSTAGRAM_ACCOUNTS", "")
+    INSTAGRAM_SESSION_DIR: Path = Path(os.getenv("INSTAGRAM_SESSION_DIR", "data/instagram_sessions"))
+    INSTAGRAM_ANONYMOUS_SESSIONS: int = int(os.getenv("INSTAGRAM_ANONYMOUS_SESSIONS", "2"))
+    INSTAGRAM_SESSION_JOBS_PER_MINUTE: float = float(os.getenv("INSTAGRAM_SESSION_JOBS_PER_MINUTE", "20"))
+    INSTAGRAM_SESSION_BACKOFF_SECONDS: float = float(os.getenv("INSTAGRAM_SESSION_BACKOFF_SECONDS", "300"))
+    INSTAGRAM_SESSION_MAX_BACKOFF_SECONDS: float = float(os.getenv("INSTAGRAM_SESSION_MAX_BACKOFF_SECONDS", "3600"))
+    INSTAGRAM_SESSION_WAIT_SECONDS: float = float(os.getenv("INSTAGRAM_SESSION_WAIT_SECONDS", "30"))
+    
+    @property
+    def instagram_accounts(self) -> List[Tuple[str, str]]:
+        """(username, password) of every configured Instagram account"""
+        accounts = []
+        if self.INSTAGRAM_USERNAME and self.INSTAGRAM_PASSWORD:
+            accounts.append((self.INSTAGRAM_USERNAME, self.INSTAGRAM_PASSWORD))
+        for entry in self.INSTAGRAM_ACCOUNTS.split(','):
+            username, _, password = entry.strip().partition(':')
+            if username and password:
+                accounts.append((username, password))
+        return accounts
     
     # Quality settings
     YOUTUBE_QUALITY_LIMITS = {
@@ -1,33 +1,82 @@
 import os
+import json
+import base64
+import hashlib
+import hmac
+import shutil
+import uuid
 import asyncio
 import logging
+import math
+import time
+from itertools import islice
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Literal, Tuple
 from urllib.parse import urlparse, parse_qs
 
+import httpx
 import uvicorn
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, Request, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, RedirectResponse, Response, StreamingResponse
 from pydantic import BaseModel, HttpUrl
-import yt_dlp
-import instaloader
-from supabase import create_client, Client
 from dotenv import load_dotenv
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Load environment variables from .env file
 load_dotenv()
 
+from config import settings
+from utils.lazy import lazy_import
+from utils.db import PostgrestClient, AsyncPostgrestClient
+from utils.job_queue import JobQueue
+from utils.executor import download_slot_released
+from utils.media_cache import MediaCache
+from utils.parallel_download import download_options, fetch_streams_concurrently
+from utils.info_cache import InfoCache
+from utils.transcode import PRESETS, TranscodePreset, Transcoder
+from utils.instagram_sessions import InstagramSessionPool
+from utils.size_limit import FileTooLargeError, SizeGuard, estimate_size
+from utils.validators import (
+    extract_instagram_shortcode, extract_instagram_profile, extract_youtube_playlist_id,
+    get_instagram_media_type, get_platform
+)
+from utils.archive import ARCHIVE_FORMATS
+from utils.file_serving import (
+    FORWARDED_HEADER, accel_redirect_response, content_disposition, object_response, proxied_response,
+    ranged_file_response
+)
+from utils.storage import StoredFile, create_storage, node_url
+from utils.progress import ProgressStore, ProgressReporter, ProgressBroker, TERMINAL_STATES
+from utils.record_writer import RecordWriter
+from utils.subscription_cache import SubscriptionCache, SubscriptionChangeFeed, watch_subscription_changes
+from utils.cleanup import create_cleaner, run_periodically
+from utils.rate_limit import RateLimiter
+from utils.metrics import (
+    BYTES_DOWNLOADED, BYTES_SERVED, FILE_SERVE_SECONDS, StatsCollector, YtdlpStageTimer,
+    monitor_event_loop, render_metrics, stage_timer
+)
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Only download jobs need these; API processes skip their import cost until then
+yt_dlp = lazy_import('yt_dlp')
+instaloader = lazy_import('instaloader')
+
 # Initialize FastAPI app
 app = FastAPI(
     title="MediaGrabber API",
     description="Backend API for YouTube and Instagram media downloads",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse if orjson else JSONResponse
 )
 
 # CORS middleware
@@ -37,83 +86,245 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Environment variables
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-DOWNLOADS_DIR = Path("downloads")
+DOWNLOADS_DIR = settings.DOWNLOADS_DIR
 
 # Create downloads directory
-DOWNLOADS_DIR.mkdir(exist_ok=True)
+DOWNLOADS_DIR.mkdir(parents=True, exist_ok=True)
 
-# Initialize Supabase client
+# Initialize pooled Supabase (PostgREST) clients: blocking for worker threads, async for routes
 if SUPABASE_URL and SUPABASE_SERVICE_KEY:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    db_options = dict(
+        pool_size=settings.DB_POOL_SIZE,
+        timeout=settings.DB_TIMEOUT_SECONDS,
+        connect_timeout=settings.DB_CONNECT_TIMEOUT_SECONDS
+    )
+    db = PostgrestClient(SUPABASE_URL, SUPABASE_SERVICE_KEY, **db_options)
+    async_db = AsyncPostgrestClient(SUPABASE_URL, SUPABASE_SERVICE_KEY, **db_options)
 else:
     logger.warning("Supabase credentials not found. Some features may not work.")
-    supabase = None
+    db = None
+    async_db = None
+
+# Batches download_records writes into bulk round trips
+record_writer = RecordWriter(
+    db,
+    max_batch=settings.RECORD_WRITER_BATCH_SIZE,
+    flush_interval=settings.RECORD_WRITER_FLUSH_INTERVAL
+) if db else None
+
+# Durable job queue consumed by the download workers (see worker.py)
+job_queue = JobQueue(
+    settings.JOB_QUEUE_PATH,
+    lease_seconds=settings.JOB_LEASE_SECONDS,
+    max_attempts=settings.JOB_MAX_ATTEMPTS,
+    retry_backoff=settings.JOB_RETRY_BACKOFF_SECONDS,
+    per_user_limit=settings.MAX_CONCURRENT_JOBS_PER_USER,
+    aging_seconds=settings.SCHEDULER_AGING_SECONDS
+)
+embedded_worker = None
+embedded_worker_thread = None
+
+# Token buckets limiting how fast users (and everyone together) can start downloads
+rate_limiter = RateLimiter(settings.RATE_LIMIT_PATH)
+
+# Shared cache of downloaded media, handed out to users as hardlinks
+media_cache = MediaCache(
+    settings.MEDIA_CACHE_DIR,
+    max_bytes=settings.MEDIA_CACHE_MAX_MB * 1024 * 1024,
+    partial_max_age=settings.PARTIAL_DOWNLOAD_MAX_AGE_HOURS * 3600
+)
+ytdlp_download_options = download_options(
+    settings.YTDLP_CONCURRENT_FRAGMENTS, settings.YTDLP_HTTP_CHUNK_SIZE_MB, settings.YTDLP_ARIA2C_CONNECTIONS
+)
+
+# ffmpeg post-processing on its own CPU-sized pool, apart from the network-bound download pools
+transcoder = Transcoder(settings.TRANSCODE_WORKERS, settings.TRANSCODE_FFMPEG_THREADS, settings.TRANSCODE_SLOTS_DIR)
+
+# Long-lived Instaloader contexts, logged in once and rotated across accounts
+instagram_sessions = InstagramSessionPool(
+    settings.instagram_accounts,
+    settings.INSTAGRAM_SESSION_DIR,
+    anonymous=settings.INSTAGRAM_ANONYMOUS_SESSIONS,
+    jobs_per_minute=settings.INSTAGRAM_SESSION_JOBS_PER_MINUTE,
+    backoff_seconds=settings.INSTAGRAM_SESSION_BACKOFF_SECONDS,
+    max_backoff=settings.INSTAGRAM_SESSION_MAX_BACKOFF_SECONDS,
+    loader_options={
+        'download_videos': True,
+        'download_video_thumbnails': False,
+        'download_geotags': False,
+        'download_comments': False,
+        'save_metadata': False,
+        'post_metadata_txt_pattern': '',
+    }
+)
+
+# Extracted metadata reused between the info endpoint and download jobs
+info_cache = InfoCache(settings.INFO_CACHE_PATH, ttl_seconds=settings.INFO_CACHE_TTL_SECONDS)
+
+# Plan lookups cached across downloads, invalidated when a subscription changes
+subscription_cache = SubscriptionCache(
+    settings.SUBSCRIPTION_CACHE_PATH,
+    ttl_seconds=settings.SUBSCRIPTION_CACHE_TTL_SECONDS,
+    negative_ttl_seconds=settings.SUBSCRIPTION_CACHE_NEGATIVE_TTL_SECONDS,
+    max_entries=settings.SUBSCRIPTION_CACHE_MAX_ENTRIES
+)
+subscription_feed = SubscriptionChangeFeed(db, subscription_cache) if db else None
+subscription_watch_task = None
+
+# Live job progress written by workers and pushed to clients over SSE
+progress_store = ProgressStore(settings.PROGRESS_DB_PATH)
+progress_broker = ProgressBroker(progress_store, poll_interval=settings.PROGRESS_POLL_INTERVAL)
+
+# Where completed downloads are kept: this node's disk, a shared mount or an S3 bucket
+storage = create_storage()
+# Relays file requests to the node holding a download when storage is node-local
+node_client = httpx.AsyncClient(timeout=httpx.Timeout(settings.NODE_PROXY_TIMEOUT_SECONDS, read=None))
+
+# Removes expired, orphaned and over-quota downloads in the background
+download_cleaner = create_cleaner(db, storage)
+cleanup_task = None
+event_loop_monitor = None
 
 # Pydantic models
 class YouTubeDownloadRequest(BaseModel):
     url: HttpUrl
-    media_type: str  # 'video' or 'audio'
+    media_type: Literal['video', 'audio']
     quality: str = 'standard'
     user_id: str
 
 class InstagramDownloadRequest(BaseModel):
     url: HttpUrl
-    media_type: str  # 'post', 'reel', 'story'
+    media_type: Literal['post', 'reel', 'story']
     user_id: str
 
 class DownloadResponse(BaseModel):
     success: bool
     download_id: str
+    status: Optional[str] = None
     filename: Optional[str] = None
     file_size: Optional[int] = None
     message: Optional[str] = None
 
+class BatchItem(BaseModel):
+    url: HttpUrl  # single video/post, YouTube playlist or Instagram profile
+    media_type: Literal['video', 'audio'] = 'video'
+    quality: str = 'standard'
+
+class BatchDownloadRequest(BaseModel):
+    user_id: str
+    items: List[BatchItem]
+
+class BatchDownloadResponse(BaseModel):
+    success: bool
+    batch_id: str
+    download_ids: List[str]
+    skipped: List[Dict[str, str]] = []
+    archive_url: Optional[str] = None
+    message: Optional[str] = None
+
 # Helper functions
+def fetch_user_subscription(user_id: str) -> Optional[Dict[str, Any]]:
+    """Fetch the user's active subscription, or None if there is none"""
+    response = db.table('subscriptions').select('*').eq('user_id', user_id).eq('status', 'active').maybe_single().execute()
+    return response.data
+
 def get_user_subscription(user_id: str) -> Dict[str, Any]:
     """Get user's subscription details"""
-    if not supabase:
+    if not db:
         return {'plan_type': 'free'}
     
     try:
-        response = supabase.table('subscriptions').select('*').eq('user_id', user_id).eq('status', 'active').single().execute()
-        return response.data if response.data else {'plan_type': 'free'}
+        subscription = subscription_cache.get(user_id, fetch_user_subscription)
+        return subscription if subscription else {'plan_type': 'free'}
     except Exception as e:
         logger.error(f"Error fetching subscription: {e}")
         return {'plan_type': 'free'}
 
-def create_download_record(user_id: str, platform: str, url: str, media_type: str, quality: str = 'standard') -> str:
-    """Create a download record in the database"""
-    if not supabase:
-        return f"demo_{datetime.now().timestamp()}"
+def new_download_record(user_id: str, platform: str, url: str, media_type: str, quality: str = 'standard',
+                        batch_id: Optional[str] = None, media_key: Optional[str] = None,
+                        weight: float = 1) -> Dict[str, Any]:
+    """Build a pending download_records row"""
+    return {
+        'id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'platform': platform,
+        'url': str(url),
+        'media_type': media_type,
+        'quality': quality,
+        'batch_id': batch_id,
+        'status': 'pending',
+        # Jobs live in this node's queue; only its workers may recover the record
+        'queue_node': node_url(),
+        # Lets a recovered job coalesce and keep its plan's share like the original
+        'media_key': media_key,
+        'job_weight': weight
+    }
+
+# Values the download_records CHECK constraints accept
+RECORD_PLATFORMS = ('YouTube', 'Instagram')
+RECORD_MEDIA_TYPES = ('video', 'audio', 'image', 'reel', 'post', 'story')
+
+def validate_download_record(record: Dict[str, Any]):
+    """Reject rows the database would refuse, before they join other users' bulk inserts"""
+    if record['platform'] not in RECORD_PLATFORMS:
+        raise HTTPException(status_code=400, detail=f"Unsupported platform {record['platform']!r}")
+    if record['media_type'] not in RECORD_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail=f"Unsupported media type {record['media_type']!r}")
+    try:
+        uuid.UUID(record['user_id'])
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid user id")
+
+def create_download_records(records: List[Dict[str, Any]]) -> List[str]:
+    """Create download records in the database, returning their ids"""
+    for record in records:
+        validate_download_record(record)
+    if not db:
+        return [f"demo_{datetime.now().timestamp()}_{i}" for i in range(len(records))]
     
     try:
-        response = supabase.table('download_records').insert({
-            'user_id': user_id,
-            'platform': platform,
-            'url': str(url),
-            'media_type': media_type,
-            'quality': quality,
-            'status': 'pending'
-        }).execute()
-        return response.data[0]['id']
+        # Blocks until the rows are committed as part of the writer's bulk inserts
+        futures = [record_writer.insert(record) for record in records]
+        for future in futures:
+            future.result(timeout=settings.RECORD_WRITER_INSERT_TIMEOUT)
+        return [record['id'] for record in records]
     except Exception as e:
-        logger.error(f"Error creating download record: {e}")
+        logger.error(f"Error creating download records: {e}")
         raise HTTPException(status_code=500, detail="Failed to create download record")
 
+def create_download_record(user_id: str, platform: str, url: str, media_type: str, quality: str = 'standard',
+                           media_key: Optional[str] = None, weight: float = 1) -> str:
+    """Create a download record in the database"""
+    record = new_download_record(user_id, platform, url, media_type, quality, media_key=media_key, weight=weight)
+    return create_download_records([record])[0]
+
 def update_download_record(download_id: str, **kwargs):
-    """Update download record with new information"""
-    if not supabase:
+    """Queue an update of a download record; written in the writer's next bulk flush"""
+    if not record_writer:
         return
     
+    record_writer.update(download_id, **kwargs)
+
+def publish_progress(download_id: str, user_id: str, status: str, **fields):
+    """Publish a state change for a single download (best effort)"""
     try:
-        supabase.table('download_records').update(kwargs).eq('id', download_id).execute()
+        progress_store.publish([(download_id, user_id)], {'status': status, **fields})
     except Exception as e:
-        logger.error(f"Error updating download record: {e}")
+        logger.warning(f"Error publishing progress: {e}")
+
+def make_progress_reporter(download_id: str, user_id: str) -> ProgressReporter:
+    return ProgressReporter(progress_store, lambda: [(download_id, user_id)], settings.PROGRESS_MIN_INTERVAL)
+
+def mark_download_failed(download_id: str, user_id: str, error: str):
+    """Record a terminal failure in the database and notify listeners"""
+    update_download_record(download_id, status='failed', error_message=error)
+    publish_progress(download_id, user_id, 'failed', error=error)
 
 def get_youtube_video_id(url: str) -> str:
     """Extract video ID from YouTube URL"""
@@ -150,138 +361,418 @@ def get_quality_format(media_type: str, quality: str, is_pro: bool) -> str:
         else:
             return 'bestaudio[abr<=128]/bestaudio'
 
-async def download_youtube_video(request: YouTubeDownloadRequest, download_id: str):
-    """Download YouTube video/audio using yt-dlp"""
+def get_transcode_preset(media_type: str, quality: str, is_pro: bool) -> TranscodePreset:
+    """Post-processing preset matching the tiers of get_quality_format"""
+    if media_type == 'video':
+        return PRESETS['mp4']
+    if quality == '320kbps' and is_pro:
+        return PRESETS['mp3-320']
+    elif quality == '256kbps' and is_pro:
+        return PRESETS['mp3-256']
+    else:
+        return PRESETS['mp3-128']
+
+def youtube_variant(media_type: str, quality: str, is_pro: bool) -> str:
+    """Media cache variant of a finished YouTube download: source format and preset"""
+    preset = get_transcode_preset(media_type, quality, is_pro)
+    return f"{get_quality_format(media_type, quality, is_pro)}|{preset.name}"
+
+def get_max_file_size(plan_type: str) -> int:
+    """Largest download a plan may produce, in bytes (0 = unlimited)"""
+    limits = settings.MAX_FILE_SIZE_MB_BY_PLAN
+    return limits.get(plan_type, limits['free']) * 1024 * 1024
+
+def choose_quality_within_limit(info: Dict[str, Any], media_type: str, quality: str, plan_type: str,
+                                max_bytes: int) -> str:
+    """Requested quality, or the best lower tier of the plan whose estimated size fits max_bytes.
+    
+    Formats without a size estimate are let through; the download is then
+    guarded while it streams.
+    """
+    is_pro = plan_type == 'pro'
+    tiers = settings.YOUTUBE_QUALITY_LIMITS.get(plan_type, settings.YOUTUBE_QUALITY_LIMITS['free'])[media_type]
+    ladder = tiers[tiers.index(quality):] if quality in tiers else [quality]
+    smallest = None
+    for candidate in ladder:
+        size = estimate_size(info, get_quality_format(media_type, candidate, is_pro))
+        if size is None or size <= max_bytes:
+            return candidate
+        smallest = size
+    raise FileTooLargeError(smallest, max_bytes)
+
+def get_youtube_info(url: str, video_id: str, ydl: Optional["yt_dlp.YoutubeDL"] = None) -> Dict[str, Any]:
+    """Get the unprocessed yt-dlp info dict for a video, extracting it only on a cache miss"""
+    cache_key = f"YouTube:{video_id}"
+    info = info_cache.get(cache_key)
+    if info is not None:
+        return info
+    
+    if ydl is None:
+        with yt_dlp.YoutubeDL({'noplaylist': True, 'quiet': True}) as info_ydl:
+            info = info_ydl.extract_info(url, download=False, process=False)
+    else:
+        info = ydl.extract_info(url, download=False, process=False)
+    
+    info = yt_dlp.YoutubeDL.sanitize_info(info)
+    info_cache.set(cache_key, info)
+    return info
+
+def get_instagram_post(context: "instaloader.InstaloaderContext", shortcode: str) -> "instaloader.Post":
+    """Get an Instagram post, reusing cached post metadata when available"""
+    cache_key = f"Instagram:{shortcode}"
+    structure = info_cache.get(cache_key)
+    if structure is not None:
+        return instaloader.load_structure(context, structure)
+    
+    post = instaloader.Post.from_shortcode(context, shortcode)
+    info_cache.set(cache_key, instaloader.get_json_structure(post))
+    return post
+
+def expand_youtube_playlist(url: str, limit: int) -> List[str]:
+    """List the video URLs of a YouTube playlist without resolving each video"""
+    ydl_opts = {'extract_flat': 'in_playlist', 'playlistend': limit, 'quiet': True}
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    
+    video_ids = [entry.get('id') for entry in info.get('entries') or [] if entry and entry.get('id')]
+    return [f"https://www.youtube.com/watch?v={video_id}" for video_id in video_ids[:limit]]
+
+def expand_instagram_profile(username: str, limit: int) -> List[str]:
+    """List the URLs of the most recent posts of a public Instagram profile"""
+    with instagram_sessions.checkout(timeout=settings.INSTAGRAM_SESSION_WAIT_SECONDS) as L:
+        profile = instaloader.Profile.from_username(L.context, username)
+        return [f"https://www.instagram.com/p/{post.shortcode}/" for post in islice(profile.get_posts(), limit)]
+
+def expand_batch_item(item: BatchItem, user_id: str) -> List[Tuple[str, BaseModel]]:
+    """Resolve a batch item into (platform, request) pairs, expanding playlists and profiles"""
+    url = str(item.url)
+    platform = get_platform(url)
+    if platform == 'YouTube':
+        urls = [url]
+        if extract_youtube_playlist_id(url):
+            urls = expand_youtube_playlist(url, settings.BATCH_MAX_PLAYLIST_ITEMS)
+        return [
+            ('YouTube', YouTubeDownloadRequest(url=u, media_type=item.media_type, quality=item.quality, user_id=user_id))
+            for u in urls
+        ]
+    
+    if platform == 'Instagram':
+        urls = [url]
+        username = extract_instagram_profile(url)
+        if username:
+            urls = expand_instagram_profile(username, settings.BATCH_MAX_PROFILE_POSTS)
+        return [
+            ('Instagram', InstagramDownloadRequest(url=u, media_type=get_instagram_media_type(u) or 'post', user_id=user_id))
+            for u in urls
+        ]
+    
+    raise HTTPException(status_code=400, detail="Unsupported URL")
+
+def check_quality_access(request: YouTubeDownloadRequest, plan_type: str):
+    """Reject qualities the user's plan does not include, per settings.YOUTUBE_QUALITY_LIMITS"""
+    limits = settings.YOUTUBE_QUALITY_LIMITS
+    media_type = 'audio' if request.media_type == 'audio' else 'video'
+    known_qualities = {quality for plan in limits.values() for quality in plan[media_type]}
+    allowed = limits.get(plan_type, limits['free'])[media_type]
+    
+    # Qualities outside the tier lists (e.g. 'standard') fall back to the default format
+    if request.quality in known_qualities and request.quality not in allowed:
+        if media_type == 'video':
+            raise HTTPException(status_code=403, detail=f"{request.quality} quality requires Pro subscription")
+        raise HTTPException(status_code=403, detail="High quality audio requires Pro subscription")
+
+# Columns of the download history view; served from the (user_id, created_at, id) covering index
+HISTORY_COLUMNS = 'id,platform,media_type,status,filename,file_path,file_size,error_message,created_at'
+
+def encode_history_cursor(record: Dict[str, Any]) -> str:
+    """Opaque cursor pointing after the last record of a history page"""
+    return base64.urlsafe_b64encode(json.dumps([record['created_at'], record['id']]).encode()).decode().rstrip('=')
+
+def decode_history_cursor(cursor: str) -> Tuple[str, str]:
+    """Validated (created_at, id) of a history cursor"""
+    try:
+        created_at, last_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        datetime.fromisoformat(created_at)
+        return created_at, str(uuid.UUID(last_id))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def history_etag(user_id: str, *page: Any) -> str:
+    """ETag of a history page from the user's record count and latest change, without reading the page"""
+    response = await async_db.rpc('download_history_version', {'p_user_id': user_id}).execute()
+    version = (response.data or [{}])[0]
+    key = json.dumps([user_id, version.get('total'), version.get('last_change'), HISTORY_COLUMNS, *page])
+    return f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+# Sidecar files that are not part of the media itself
+METADATA_SUFFIXES = ('.txt', '.json', '.xz')
+
+def archive_basename(files: List[Path]) -> str:
+    """Shared name prefix of a multi-file result, e.g. the timestamp of a carousel post"""
+    return os.path.commonprefix([f.stem for f in files]).rstrip('_- ')
+
+def directory_size(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob('*') if f.is_file())
+
+def media_files(file_path: str) -> List[StoredFile]:
+    """Stored files of a completed download: the file itself, or every file of a multi-file result"""
+    return [f for f in storage.files(file_path) if Path(f.name).suffix not in METADATA_SUFFIXES]
+
+def archive_response(entries: List[Tuple[StoredFile, str]], basename: str, archive_format: str) -> StreamingResponse:
+    """Stream (path, name in archive) entries as a ZIP or tar archive built on the fly"""
+    if archive_format not in ARCHIVE_FORMATS:
+        raise HTTPException(status_code=400, detail="Unsupported archive format")
+    
+    iter_archive, media_type = ARCHIVE_FORMATS[archive_format]
+    return StreamingResponse(
+        iter_archive(entries),
+        media_type=media_type,
+        headers={'Content-Disposition': content_disposition(f"{basename}.{archive_format}")}
+    )
+
+def get_media_key(platform: str, request: BaseModel, is_pro: bool = False) -> Optional[str]:
+    """Normalized key of the media a request resolves to, shared with the media cache"""
+    url = str(request.url)
+    if platform == 'YouTube':
+        video_id = get_youtube_video_id(url)
+        if not video_id:
+            return None
+        # Plans with different size limits may end up with different downloads of the same request
+        variant = f"{youtube_variant(request.media_type, request.quality, is_pro)}|{get_max_file_size('pro' if is_pro else 'free')}"
+        return media_cache.make_key('YouTube', video_id, variant)
+    
+    shortcode = extract_instagram_shortcode(url)
+    if not shortcode:
+        return None
+    return media_cache.make_key('Instagram', shortcode, 'story' if '/stories/' in url else 'post')
+
+def finalize_download(user_id: str, download_id: str, cached_dir: Path) -> str:
+    """Put a cached media entry into storage under the user's download and complete the record.
+    
+    Multi-file results (e.g. Instagram carousels) are recorded as their
+    key prefix and served as a streamed archive of all files. Returns the
+    stored file path.
+    """
+    downloaded_files = sorted(
+        f for f in cached_dir.iterdir() if f.is_file() and f.suffix not in METADATA_SUFFIXES
+    )
+    if not downloaded_files:
+        raise Exception("No files were downloaded")
+    
+    prefix = f"{user_id}/{download_id}"
+    storage.put(prefix, downloaded_files)
+    
+    if len(downloaded_files) == 1:
+        file_path = f"{prefix}/{downloaded_files[0].name}"
+        filename = downloaded_files[0].name
+    else:
+        file_path = prefix
+        filename = archive_basename(downloaded_files) or download_id
+    file_size = sum(f.stat().st_size for f in downloaded_files)
+    
+    # Update download record; storage_node routes file requests when storage is node-local
+    update_download_record(
+        download_id,
+        status='completed',
+        filename=filename,
+        file_path=file_path,
+        file_size=file_size,
+        storage_node=storage.node
+    )
+    
+    publish_progress(
+        download_id, user_id, 'completed', filename=filename, file_size=file_size, files=len(downloaded_files)
+    )
+    
+    logger.info(f"Successfully downloaded: {filename} ({len(downloaded_files)} files)")
+    return file_path
+
+def lookup_within_limit(key: str, max_bytes: int) -> Optional[Path]:
+    """Media cache entry for a key, unless it is larger than max_bytes (cached for a plan with a higher limit)"""
+    cached_dir = media_cache.lookup(key)
+    if cached_dir is not None and max_bytes and directory_size(cached_dir) > max_bytes:
+        return None
+    return cached_dir
+
+def download_youtube_video(request: YouTubeDownloadRequest, download_id: str, progress: Optional[ProgressReporter] = None) -> Path:
+    """Download YouTube video/audio using yt-dlp, returning the media cache entry"""
+    progress = progress or make_progress_reporter(download_id, request.user_id)
     try:
         # Get user subscription
-        subscription = get_user_subscription(request.user_id)
-        is_pro = subscription.get('plan_type') == 'pro'
+        with stage_timer('YouTube', 'plan_check'):
+            subscription = get_user_subscription(request.user_id)
+        plan_type = subscription.get('plan_type', 'free')
+        is_pro = plan_type == 'pro'
         
         # Check quality restrictions
-        if not is_pro:
-            if request.media_type == 'video' and request.quality in ['4K']:
-                raise HTTPException(status_code=403, detail="4K quality requires Pro subscription")
-            if request.media_type == 'audio' and request.quality in ['320kbps', '256kbps']:
-                raise HTTPException(status_code=403, detail="High quality audio requires Pro subscription")
-        
-        # Create user-specific download directory
-        user_dir = DOWNLOADS_DIR / request.user_id / download_id
-        user_dir.mkdir(parents=True, exist_ok=True)
+        check_quality_access(request, plan_type)
         
         # Configure yt-dlp options
         video_id = get_youtube_video_id(str(request.url))
         if not video_id:
             raise HTTPException(status_code=400, detail="Invalid YouTube URL")
         
-        format_selector = get_quality_format(request.media_type, request.quality, is_pro)
+        max_bytes = get_max_file_size(plan_type)
+        media_type = 'audio' if request.media_type == 'audio' else 'video'
+        quality = request.quality
         
-        ydl_opts = {
-            'format': format_selector,
-            'outtmpl': str(user_dir / '%(title)s.%(ext)s'),
-            'noplaylist': True,
-            'extractaudio': request.media_type == 'audio',
-            'audioformat': 'mp3' if request.media_type == 'audio' else None,
-            'audioquality': '0' if is_pro else '5',  # 0 = best, 9 = worst
-        }
+        # Reuse a finished (post-processed) copy if another job already produced it within this plan's limit
+        output_key = media_cache.make_key('YouTube', video_id, youtube_variant(request.media_type, quality, is_pro))
+        cached_dir = lookup_within_limit(output_key, max_bytes)
+        if cached_dir is None and max_bytes:
+            # Pre-flight: estimate the size from the extracted formats before fetching any media
+            with stage_timer('YouTube', 'extract'):
+                info = get_youtube_info(str(request.url), video_id)
+            try:
+                quality = choose_quality_within_limit(info, media_type, request.quality, plan_type, max_bytes)
+            except FileTooLargeError as e:
+                raise HTTPException(status_code=413, detail=f"{e}; choose a lower quality")
+            if quality != request.quality:
+                logger.info(f"Downgrading {video_id} from {request.quality} to {quality} to stay within {max_bytes} bytes")
+                progress('downgraded', quality=quality)
+                output_key = media_cache.make_key('YouTube', video_id, youtube_variant(request.media_type, quality, is_pro))
+                cached_dir = lookup_within_limit(output_key, max_bytes)
         
-        # Download the media
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            # Get video info first
-            info = ydl.extract_info(str(request.url), download=False)
-            title = info.get('title', 'Unknown')
-            duration = info.get('duration', 0)
-            
-            # Download the video
-            ydl.download([str(request.url)])
-            
-            # Find the downloaded file
-            downloaded_files = list(user_dir.glob('*'))
-            if not downloaded_files:
-                raise Exception("No files were downloaded")
-            
-            downloaded_file = downloaded_files[0]
-            file_size = downloaded_file.stat().st_size
-            
-            # Update download record
-            update_download_record(
-                download_id,
-                status='completed',
-                filename=downloaded_file.name,
-                file_path=str(downloaded_file.relative_to(DOWNLOADS_DIR)),
-                file_size=file_size
-            )
-            
-            logger.info(f"Successfully downloaded: {downloaded_file.name}")
+        format_selector = get_quality_format(request.media_type, quality, is_pro)
+        preset = get_transcode_preset(request.media_type, quality, is_pro)
+        variant = youtube_variant(request.media_type, quality, is_pro)
+        if cached_dir is None:
+            # The downloaded source is cached too, so other presets of the same format skip the fetch
+            cache_key = media_cache.make_key('YouTube', video_id, format_selector)
+            source_dir = media_cache.lookup(cache_key)
+            if source_dir is None:
+                # Partial files are kept per cache key, so a retried job resumes instead of starting over
+                with media_cache.partial_dir(cache_key) as staging_dir:
+                    source_dir = fetch_youtube_media(
+                        request, video_id, format_selector, staging_dir, cache_key, progress, max_bytes, preset
+                    )
             
+            progress('transcoding', preset=preset.name)
+            with stage_timer('YouTube', 'transcode'):
+                cached_dir = transcode_media(source_dir, preset, output_key, video_id, variant)
+            if max_bytes and directory_size(cached_dir) > max_bytes:
+                raise HTTPException(status_code=413, detail=str(FileTooLargeError(directory_size(cached_dir), max_bytes)))
+        
+        with stage_timer('YouTube', 'finalize'):
+            finalize_download(request.user_id, download_id, cached_dir)
+        return cached_dir
+        
     except Exception as e:
+        # The worker marks the record failed once retries are exhausted
         logger.error(f"YouTube download failed: {e}")
-        update_download_record(
-            download_id,
-            status='failed',
-            error_message=str(e)
-        )
         raise
 
-async def download_instagram_media(request: InstagramDownloadRequest, download_id: str):
-    """Download Instagram media using instaloader"""
+def fetch_youtube_media(request: YouTubeDownloadRequest, video_id: str, format_selector: str,
+                        staging_dir: Path, cache_key: str, progress: ProgressReporter, max_bytes: int = 0,
+                        preset: Optional[TranscodePreset] = None) -> Path:
+    """Download a video into a staging directory and move it into the media cache"""
+    timer = YtdlpStageTimer('YouTube')
+    ydl_opts = {
+        **ytdlp_download_options,
+        'format': format_selector,
+        'outtmpl': str(staging_dir / '%(title)s.%(ext)s'),
+        'noplaylist': True,
+        # SizeGuard aborts the transfer as soon as it grows past the plan's limit
+        'progress_hooks': [progress.ytdlp_hook, SizeGuard(max_bytes)],
+        'postprocessor_hooks': [timer.postprocessor_hook],
+    }
+    if preset and preset.video:
+        # Merge separate streams straight into the preset's container so the transcode is a no-op
+        ydl_opts['merge_output_format'] = '/'.join(filter(None, (preset.container, preset.fallback_container)))
+    
+    # Download the media
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        # Resolve formats from the cached extraction instead of fetching the page again
+        progress('extracting')
+        with stage_timer('YouTube', 'extract'):
+            info = get_youtube_info(str(request.url), video_id, ydl)
+        try:
+            with timer.download():
+                if settings.YTDLP_PARALLEL_STREAMS:
+                    # Fetch video and audio side by side; the pass below then only merges them
+                    fetch_streams_concurrently(ydl, info)
+                ydl.process_ie_result(info, download=True)
+        except FileTooLargeError as e:
+            # A retry would hit the limit again, so its partial files are of no use
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            raise HTTPException(status_code=413, detail=str(e))
+    
+    if not any(staging_dir.iterdir()):
+        raise Exception("No files were downloaded")
+    BYTES_DOWNLOADED.labels('YouTube').inc(directory_size(staging_dir))
+    with stage_timer('YouTube', 'store'):
+        return media_cache.store(cache_key, 'YouTube', video_id, format_selector, staging_dir)
+
+def transcode_media(source_dir: Path, preset: TranscodePreset, output_key: str, video_id: str, variant: str) -> Path:
+    """Post-process a cached source on the transcode pool and cache the result under its own key"""
+    sources = sorted(f for f in source_dir.iterdir() if f.is_file() and f.suffix not in METADATA_SUFFIXES)
+    if not sources:
+        raise Exception("No files were downloaded")
+    
+    staging_dir = media_cache.staging_dir(output_key)
     try:
-        # Create user-specific download directory
-        user_dir = DOWNLOADS_DIR / request.user_id / download_id
-        user_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Initialize instaloader
-        L = instaloader.Instaloader(
-            download_videos=True,
-            download_video_thumbnails=False,
-            download_geotags=False,
-            download_comments=False,
-            save_metadata=False,
-            dirname_pattern=str(user_dir)
-        )
-        
-        # Extract shortcode from URL
+        with download_slot_released():
+            outputs = [transcoder.transcode(source, preset, staging_dir) for source in sources]
+        if not any(outputs):
+            # Already in the preset's format; serve the source entry as is
+            return source_dir
+        for source, output in zip(sources, outputs):
+            if output is None:
+                os.link(source, staging_dir / source.name)
+        return media_cache.store(output_key, 'YouTube', video_id, variant, staging_dir)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+def download_instagram_media(request: InstagramDownloadRequest, download_id: str, progress: Optional[ProgressReporter] = None) -> Path:
+    """Download Instagram media using instaloader, returning the media cache entry"""
+    progress = progress or make_progress_reporter(download_id, request.user_id)
+    try:
+        # Extract shortcode (or story media ID) from URL
         url_str = str(request.url)
-        if '/p/' in url_str:
-            shortcode = url_str.split('/p/')[1].split('/')[0]
-        elif '/reel/' in url_str:
-            shortcode = url_str.split('/reel/')[1].split('/')[0]
-        elif '/stories/' in url_str:
-            # Stories require authentication
-            raise HTTPException(status_code=403, detail="Story downloads require Instagram authentication")
-        else:
+        shortcode = extract_instagram_shortcode(url_str)
+        is_story = '/stories/' in url_str
+        if not shortcode or (is_story and not shortcode.isdigit()):
             raise HTTPException(status_code=400, detail="Invalid Instagram URL")
+        if is_story and not instagram_sessions.has_login():
+            raise HTTPException(status_code=403, detail="Story downloads require Instagram authentication")
+        variant = 'story' if is_story else 'post'
         
-        # Download the post
-        post = instaloader.Post.from_shortcode(L.context, shortcode)
-        L.download_post(post, target=str(user_dir))
-        
-        # Find downloaded files
-        downloaded_files = list(user_dir.glob('*'))
-        if not downloaded_files:
-            raise Exception("No files were downloaded")
-        
-        # Get the main media file (usually the largest)
-        main_file = max(downloaded_files, key=lambda f: f.stat().st_size)
-        file_size = main_file.stat().st_size
-        
-        # Update download record
-        update_download_record(
-            download_id,
-            status='completed',
-            filename=main_file.name,
-            file_path=str(main_file.relative_to(DOWNLOADS_DIR)),
-            file_size=file_size
-        )
+        # Reuse a cached copy of this post if another job already fetched it
+        cache_key = media_cache.make_key('Instagram', shortcode, variant)
+        cached_dir = media_cache.lookup(cache_key)
+        if cached_dir is None:
+            staging_dir = media_cache.staging_dir(cache_key)
+            try:
+                # Borrow a pooled Instaloader; stories need a logged-in one
+                with instagram_sessions.checkout(login_required=is_story, timeout=settings.INSTAGRAM_SESSION_WAIT_SECONDS) as L:
+                    progress('extracting')
+                    with stage_timer('Instagram', 'extract'):
+                        if is_story:
+                            item = instaloader.StoryItem.from_mediaid(L.context, int(shortcode))
+                        else:
+                            post = get_instagram_post(L.context, shortcode)
+                    progress('downloading', items=1 if is_story else post.mediacount)
+                    with stage_timer('Instagram', 'download'):
+                        if is_story:
+                            L.download_storyitem(item, target=str(staging_dir))
+                        else:
+                            L.download_post(post, target=str(staging_dir))
+                
+                if not any(staging_dir.iterdir()):
+                    raise Exception("No files were downloaded")
+                BYTES_DOWNLOADED.labels('Instagram').inc(directory_size(staging_dir))
+                with stage_timer('Instagram', 'store'):
+                    cached_dir = media_cache.store(cache_key, 'Instagram', shortcode, variant, staging_dir)
+            finally:
+                shutil.rmtree(staging_dir, ignore_errors=True)
         
-        logger.info(f"Successfully downloaded: {main_file.name}")
+        with stage_timer('Instagram', 'finalize'):
+            finalize_download(request.user_id, download_id, cached_dir)
+        return cached_dir
         
     except Exception as e:
+        # The worker marks the record failed once retries are exhausted
         logger.error(f"Instagram download failed: {e}")
-        update_download_record(
-            download_id,
-            status='failed',
-            error_message=str(e)
-        )
         raise
 
 # API Routes
@@ -291,156 +782,723 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "jobs": await run_in_threadpool(job_queue.stats)
+    }
+
+@app.get("/ready")
+async def readiness_check():
+    """Ready when the database and storage answer and at least one download worker is polling the queue"""
+    checks = {}
+    if async_db:
+        try:
+            await async_db.table('subscriptions').select('id').limit(1).execute(timeout=settings.READINESS_TIMEOUT_SECONDS)
+            checks['database'] = 'ok'
+        except Exception as e:
+            logger.warning(f"Readiness check: database unavailable: {e}")
+            checks['database'] = 'unavailable'
+    else:
+        checks['database'] = 'demo'
+    
+    try:
+        await asyncio.wait_for(run_in_threadpool(storage.check), settings.READINESS_TIMEOUT_SECONDS)
+        checks['storage'] = 'ok'
+    except Exception as e:
+        logger.warning(f"Readiness check: storage unavailable: {e}")
+        checks['storage'] = 'unavailable'
+    
+    checks['workers'] = await run_in_threadpool(job_queue.live_workers, settings.WORKER_HEARTBEAT_TIMEOUT)
+    ready = checks['database'] != 'unavailable' and checks['storage'] == 'ok' and checks['workers'] > 0
+    return JSONResponse(status_code=200 if ready else 503, content={"ready": ready, "checks": checks})
+
+def collect_system_stats() -> Dict[str, Any]:
+    return {
+        "jobs": job_queue.stats(),
+        "media_cache": media_cache.stats(),
+        "transcoder": {"workers": transcoder.workers},
+        "instagram_sessions": instagram_sessions.stats(),
+        "info_cache": info_cache.stats(),
+        "progress": progress_broker.stats(),
+        "record_writer": record_writer.stats() if record_writer else None,
+        "subscription_cache": subscription_cache.stats(),
+        "cleanup": download_cleaner.stats(),
+        "storage": storage.stats(),
+        "rate_limits": rate_limiter.stats()
+    }
+
+metrics_collector = StatsCollector(collect_system_stats)
+
+@app.get("/api/system/stats")
+async def system_stats():
+    """Queue and cache statistics for monitoring"""
+    return await run_in_threadpool(collect_system_stats)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: stage timings, bytes, queue depth and cache hit rates"""
+    body, content_type = await run_in_threadpool(render_metrics, metrics_collector)
+    return Response(content=body, headers={'Content-Type': content_type})
+
+@app.on_event("startup")
+async def start_event_loop_monitor():
+    global event_loop_monitor
+    event_loop_monitor = asyncio.create_task(monitor_event_loop())
+
+@app.on_event("shutdown")
+async def stop_event_loop_monitor():
+    if event_loop_monitor:
+        event_loop_monitor.cancel()
+
+@app.on_event("startup")
+async def start_progress_broker():
+    progress_broker.start()
+
+@app.on_event("shutdown")
+async def stop_progress_broker():
+    await progress_broker.stop()
+
+@app.on_event("startup")
+async def start_cleanup():
+    global cleanup_task
+    if settings.CLEANUP_INTERVAL_SECONDS > 0:
+        cleanup_task = asyncio.create_task(run_periodically(download_cleaner, settings.CLEANUP_INTERVAL_SECONDS))
+
+@app.on_event("shutdown")
+async def stop_cleanup():
+    if cleanup_task:
+        cleanup_task.cancel()
+
+@app.on_event("startup")
+async def start_subscription_watch():
+    global subscription_watch_task
+    if subscription_feed and settings.SUBSCRIPTION_CHANGE_POLL_SECONDS > 0:
+        subscription_watch_task = asyncio.create_task(
+            watch_subscription_changes(subscription_feed, settings.SUBSCRIPTION_CHANGE_POLL_SECONDS)
+        )
+
+@app.on_event("shutdown")
+async def stop_subscription_watch():
+    if subscription_watch_task:
+        subscription_watch_task.cancel()
+
+@app.on_event("startup")
+def start_embedded_worker():
+    """Consume the job queue in-process when no standalone workers are running"""
+    global embedded_worker, embedded_worker_thread
+    if not settings.EMBEDDED_WORKER:
+        return
+    
+    import threading
+    from worker import Worker
+    
+    embedded_worker = Worker(job_queue, shutdown_grace=settings.SHUTDOWN_GRACE_SECONDS)
+    embedded_worker_thread = threading.Thread(target=embedded_worker.run, name="embedded-worker", daemon=True)
+    embedded_worker_thread.start()
+
+@app.on_event("shutdown")
+async def stop_embedded_worker():
+    if not embedded_worker:
+        return
+    # Let running jobs finish (and their records be written) before the database clients close
+    embedded_worker.stop()
+    # The worker releases jobs still running after the grace, so this returns shortly after it
+    await run_in_threadpool(embedded_worker_thread.join, settings.SHUTDOWN_GRACE_SECONDS + settings.WORKER_POLL_INTERVAL + 5)
+    if embedded_worker_thread.is_alive():
+        logger.warning("Embedded worker did not stop, leaving its jobs to be retried once their leases expire")
+
+@app.on_event("shutdown")
+async def close_database_clients():
+    # Flush buffered record writes before the connection pools go away
+    if record_writer:
+        await run_in_threadpool(record_writer.close)
+    if db:
+        db.close()
+    if async_db:
+        await async_db.aclose()
+    await node_client.aclose()
+
+async def ensure_queue_capacity(platform: str):
+    """Reject new jobs while the platform backlog is at its limit"""
+    if await run_in_threadpool(job_queue.depth, platform) >= settings.MAX_QUEUED_DOWNLOADS:
+        raise HTTPException(status_code=503, detail="Too many downloads in progress, please retry shortly")
+
+def get_scheduling_weight(plan_type: str) -> float:
+    """Share of worker capacity a plan gets relative to the free plan"""
+    return settings.PRO_SCHEDULING_WEIGHT if plan_type == 'pro' else 1
+
+async def enforce_rate_limit(user_id: str, plan_type: str, downloads: Dict[str, int]):
+    """Take tokens for the given downloads per platform, or reject the request with a 429"""
+    user_limit = settings.RATE_LIMIT_PRO_PER_MINUTE if plan_type == 'pro' else settings.RATE_LIMIT_FREE_PER_MINUTE
+    buckets = []
+    for platform, count in downloads.items():
+        platform_limit = settings.PLATFORM_RATE_LIMITS.get(platform, 0)
+        buckets.append((f"user:{user_id}:{platform}", user_limit, user_limit / 60, count))
+        buckets.append((f"platform:{platform}", platform_limit, platform_limit / 60, count))
+    
+    retry_after = await run_in_threadpool(rate_limiter.acquire, buckets)
+    if retry_after:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many downloads, please slow down",
+            headers={'Retry-After': str(math.ceil(retry_after))}
+        )
+
+async def dispatch_download(platform: str, request: BaseModel, download_id: str, media_key: Optional[str] = None,
+                            weight: float = 1) -> DownloadResponse:
+    """Persist a download job on the durable queue for the workers to pick up.
+
+    Requests sharing a media key with a job still in flight attach to it and
+    complete from its result instead of downloading again.
+    """
+    await run_in_threadpool(job_queue.enqueue, platform, download_id, request.model_dump(mode='json'), media_key, weight)
+    await run_in_threadpool(publish_progress, download_id, request.user_id, 'queued')
+    
+    return DownloadResponse(
+        success=True,
+        download_id=download_id,
+        status='queued',
+        message="Download queued"
+    )
 
 @app.post("/api/youtube/download", response_model=DownloadResponse)
-async def download_youtube(request: YouTubeDownloadRequest, background_tasks: BackgroundTasks):
+async def download_youtube(request: YouTubeDownloadRequest):
     """Download YouTube video or audio"""
+    await ensure_queue_capacity('YouTube')
+    
+    # Check plan restrictions up front so the user gets an immediate answer
+    subscription = await run_in_threadpool(get_user_subscription, request.user_id)
+    plan_type = subscription.get('plan_type', 'free')
+    is_pro = plan_type == 'pro'
+    check_quality_access(request, plan_type)
+    await enforce_rate_limit(request.user_id, plan_type, {'YouTube': 1})
+    media_key = get_media_key('YouTube', request, is_pro)
+    weight = get_scheduling_weight(plan_type)
+    
     try:
         # Create download record
-        download_id = create_download_record(
+        download_id = await run_in_threadpool(
+            create_download_record,
             request.user_id, 
             'YouTube', 
             str(request.url), 
             request.media_type,
-            request.quality
+            request.quality,
+            media_key,
+            weight
         )
         
-        # Start download in background
-        background_tasks.add_task(download_youtube_video, request, download_id)
-        
-        return DownloadResponse(
-            success=True,
-            download_id=download_id,
-            message="Download started"
-        )
+        # Hand the job to the download workers
+        return await dispatch_download('YouTube', request, download_id, media_key, weight)
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"YouTube download request failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/youtube/info")
+async def get_youtube_video_info(url: str):
+    """Get title, duration and available formats of a YouTube video"""
+    video_id = get_youtube_video_id(url)
+    if not video_id:
+        raise HTTPException(status_code=400, detail="Invalid YouTube URL")
+    
+    try:
+        info = await run_in_threadpool(get_youtube_info, url, video_id)
+    except Exception as e:
+        logger.error(f"Error extracting YouTube info: {e}")
+        raise HTTPException(status_code=502, detail="Failed to fetch video information")
+    
+    return {
+        "video_id": video_id,
+        "title": info.get('title'),
+        "duration": info.get('duration'),
+        "thumbnail": info.get('thumbnail'),
+        "uploader": info.get('uploader'),
+        "formats": [
+            {
+                "format_id": f.get('format_id'),
+                "ext": f.get('ext'),
+                "height": f.get('height'),
+                "abr": f.get('abr'),
+                "vcodec": f.get('vcodec'),
+                "acodec": f.get('acodec'),
+                "filesize": f.get('filesize') or f.get('filesize_approx'),
+            }
+            for f in info.get('formats') or []
+        ]
+    }
+
 @app.post("/api/instagram/download", response_model=DownloadResponse)
-async def download_instagram(request: InstagramDownloadRequest, background_tasks: BackgroundTasks):
+async def download_instagram(request: InstagramDownloadRequest):
     """Download Instagram post, reel, or story"""
+    await ensure_queue_capacity('Instagram')
+    
+    subscription = await run_in_threadpool(get_user_subscription, request.user_id)
+    plan_type = subscription.get('plan_type', 'free')
+    await enforce_rate_limit(request.user_id, plan_type, {'Instagram': 1})
+    media_key = get_media_key('Instagram', request)
+    weight = get_scheduling_weight(plan_type)
+    
     try:
         # Create download record
-        download_id = create_download_record(
+        download_id = await run_in_threadpool(
+            create_download_record,
             request.user_id,
             'Instagram',
             str(request.url),
-            request.media_type
+            request.media_type,
+            media_key=media_key,
+            weight=weight
         )
         
-        # Start download in background
-        background_tasks.add_task(download_instagram_media, request, download_id)
+        # Hand the job to the download workers
+        return await dispatch_download('Instagram', request, download_id, media_key, weight)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Instagram download request failed: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/batch/download", response_model=BatchDownloadResponse)
+async def download_batch(request: BatchDownloadRequest):
+    """Queue many downloads at once; playlists and profiles are expanded server-side.
+    
+    Items run concurrently on the workers, at most MAX_CONCURRENT_JOBS_PER_USER
+    at a time per user. Failed items are reported in ``skipped`` instead of
+    failing the whole batch.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="No items to download")
+    if len(request.items) > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch can contain at most {settings.BATCH_MAX_ITEMS} items")
+    
+    subscription = await run_in_threadpool(get_user_subscription, request.user_id)
+    plan_type = subscription.get('plan_type', 'free')
+    is_pro = plan_type == 'pro'
+    
+    # Expand playlists and profiles in parallel
+    results = await asyncio.gather(
+        *(run_in_threadpool(expand_batch_item, item, request.user_id) for item in request.items),
+        return_exceptions=True
+    )
+    
+    skipped = []
+    downloads = []
+    for item, result in zip(request.items, results):
+        if isinstance(result, Exception):
+            reason = result.detail if isinstance(result, HTTPException) else "Failed to expand URL"
+            logger.warning(f"Skipping batch item {item.url}: {result or reason}")
+            skipped.append({'url': str(item.url), 'reason': reason})
+            continue
+        
+        for platform, download in result:
+            try:
+                if platform == 'YouTube':
+                    if not get_youtube_video_id(str(download.url)):
+                        raise HTTPException(status_code=400, detail="Invalid YouTube URL")
+                    check_quality_access(download, plan_type)
+            except HTTPException as e:
+                skipped.append({'url': str(download.url), 'reason': e.detail})
+                continue
+            downloads.append((platform, download))
+    
+    if len(downloads) > settings.BATCH_MAX_ITEMS:
+        skipped.extend({'url': str(d.url), 'reason': "Batch item limit reached"} for _, d in downloads[settings.BATCH_MAX_ITEMS:])
+        downloads = downloads[:settings.BATCH_MAX_ITEMS]
+    
+    batch_id = str(uuid.uuid4())
+    if not downloads:
+        return BatchDownloadResponse(success=False, batch_id=batch_id, download_ids=[], skipped=skipped, message="Nothing to download")
+    
+    per_platform: Dict[str, int] = {}
+    for platform, _ in downloads:
+        per_platform[platform] = per_platform.get(platform, 0) + 1
+    for platform in per_platform:
+        await ensure_queue_capacity(platform)
+    await enforce_rate_limit(request.user_id, plan_type, per_platform)
+    
+    weight = get_scheduling_weight(plan_type)
+    try:
+        records = [
+            new_download_record(
+                request.user_id, platform, str(download.url), download.media_type,
+                getattr(download, 'quality', 'standard'), batch_id,
+                media_key=get_media_key(platform, download, is_pro), weight=weight
+            )
+            for platform, download in downloads
+        ]
+        download_ids = await run_in_threadpool(create_download_records, records)
+        
+        # Hand all jobs to the download workers in one transaction
+        await run_in_threadpool(job_queue.enqueue_many, [
+            (platform, download_id, download.model_dump(mode='json'), record['media_key'], weight)
+            for (platform, download), record, download_id in zip(downloads, records, download_ids)
+        ])
+        await run_in_threadpool(
+            progress_store.publish, [(download_id, request.user_id) for download_id in download_ids], {'status': 'queued'}
+        )
         
-        return DownloadResponse(
+        return BatchDownloadResponse(
             success=True,
-            download_id=download_id,
-            message="Download started"
+            batch_id=batch_id,
+            download_ids=download_ids,
+            skipped=skipped,
+            archive_url=f"/api/batch/{batch_id}/archive?user_id={request.user_id}",
+            message=f"{len(download_ids)} downloads queued"
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Instagram download request failed: {e}")
+        logger.error(f"Batch download request failed: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def fetch_batch_records(batch_id: str, user_id: str) -> List[Dict[str, Any]]:
+    if not async_db:
+        raise HTTPException(status_code=503, detail="Service unavailable in demo mode")
+    
+    response = await async_db.table('download_records').select(
+        'id,url,status,filename,file_path,file_size,storage_node,error_message'
+    ).eq('batch_id', batch_id).eq('user_id', user_id).order('created_at').execute()
+    if not response.data:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return response.data
+
+@app.get("/api/batch/{batch_id}")
+async def get_batch_status(batch_id: str, user_id: str):
+    """Get the status of every download in a batch"""
+    try:
+        records = await fetch_batch_records(batch_id, user_id)
+        counts: Dict[str, int] = {}
+        for record in records:
+            counts[record['status']] = counts.get(record['status'], 0) + 1
+        
+        return {"batch_id": batch_id, "total": len(records), "counts": counts, "downloads": records}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching batch status: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch batch status")
+
+@app.get("/api/batch/{batch_id}/archive")
+async def download_batch_archive(batch_id: str, user_id: str, archive_format: str = Query('zip', alias='format')):
+    """Stream the completed files of a batch as a single ZIP (or tar) archive"""
+    try:
+        records = await fetch_batch_records(batch_id, user_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fetching batch records: {e}")
+        raise HTTPException(status_code=500, detail="Failed to fetch batch")
+    
+    entries = []
+    names = set()
+    for record in records:
+        if record['status'] != 'completed' or not record['file_path']:
+            continue
+        # Files kept on another node's local disk cannot be read from here
+        files = await run_in_threadpool(media_files, record['file_path'])
+        if not files:
+            continue
+        # Keep entry names unique when two items produced the same filename
+        name = record['filename']
+        if name in names:
+            name = f"{record['id'][:8]}_{name}"
+        names.add(name)
+        if files[0].key != record['file_path']:
+            # Multi-file results get a folder of their own
+            entries.extend((f, f"{name}/{f.name}") for f in files)
+        else:
+            entries.append((files[0], name))
+    
+    if not entries:
+        raise HTTPException(status_code=400, detail="No completed downloads in this batch")
+    
+    return archive_response(entries, f"batch-{batch_id[:8]}", archive_format)
+
 @app.get("/api/download/{download_id}/status")
 async def get_download_status(download_id: str):
     """Get download status"""
-    if not supabase:
+    if not async_db:
         return {"status": "demo", "message": "Demo mode - no database connection"}
     
     try:
-        response = supabase.table('download_records').select('*').eq('id', download_id).single().execute()
+        response = await async_db.table('download_records').select('*').eq('id', download_id).maybe_single().execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="Download not found")
         
         return response.data
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching download status: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch download status")
 
+def format_sse(event: Dict[str, Any]) -> str:
+    return f"id: {event['seq']}\nevent: progress\ndata: {json.dumps(event)}\n\n"
+
+async def stream_progress(request: Request, topic: str, queue: asyncio.Queue, initial: List[Dict[str, Any]],
+                          until_terminal: bool):
+    """Yield progress events as Server-Sent Events until the client disconnects.
+    
+    ``queue`` must be subscribed to ``topic`` before ``initial`` was read, so
+    no event falls between the snapshot and the live stream; events the
+    snapshot already covers are skipped.
+    """
+    seen = {event['download_id']: event['seq'] for event in initial}
+    try:
+        for event in initial:
+            yield format_sse(event)
+            if until_terminal and event['status'] in TERMINAL_STATES:
+                return
+        
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=settings.SSE_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            
+            if event['seq'] <= seen.get(event['download_id'], 0):
+                continue
+            yield format_sse(event)
+            if until_terminal and event['status'] in TERMINAL_STATES:
+                return
+    finally:
+        progress_broker.unsubscribe(topic, queue)
+
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+
+async def download_record_event(download_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+    """Progress event built from a user's download record, for downloads without a snapshot"""
+    if not async_db:
+        return None
+    response = await async_db.table('download_records').select('status,error_message').eq(
+        'id', download_id
+    ).eq('user_id', user_id).maybe_single().execute()
+    if not response.data:
+        return None
+    event = {'download_id': download_id, 'status': response.data['status'], 'seq': 0}
+    if response.data.get('error_message'):
+        event['error'] = response.data['error_message']
+    return event
+
+@app.get("/api/download/{download_id}/events")
+async def download_events(download_id: str, user_id: str, request: Request):
+    """Stream live progress of a download as Server-Sent Events"""
+    topic = f"download:{download_id}"
+    # Subscribe before reading the snapshot so an event published in between is not lost
+    queue = progress_broker.subscribe(topic)
+    try:
+        snapshot = await run_in_threadpool(progress_store.snapshot, download_id)
+        if snapshot is None:
+            # Snapshots expire; ownership and a finished state then come from the record
+            snapshot = await download_record_event(download_id, user_id)
+            if snapshot is None:
+                raise HTTPException(status_code=404, detail="Download not found")
+        elif snapshot.pop('user_id') != user_id:
+            raise HTTPException(status_code=404, detail="Download not found")
+    except BaseException:
+        progress_broker.unsubscribe(topic, queue)
+        raise
+    
+    # Only terminal record states are final; pending ones wait for the live stream
+    initial = [snapshot] if snapshot['seq'] or snapshot['status'] in TERMINAL_STATES else []
+    return StreamingResponse(
+        stream_progress(request, topic, queue, initial, until_terminal=True),
+        media_type='text/event-stream',
+        headers=SSE_HEADERS
+    )
+
+@app.get("/api/user/{user_id}/events")
+async def user_download_events(user_id: str, request: Request):
+    """Stream live progress of all of a user's downloads as Server-Sent Events"""
+    topic = f"user:{user_id}"
+    queue = progress_broker.subscribe(topic)
+    try:
+        snapshots = await run_in_threadpool(progress_store.user_snapshots, user_id)
+    except BaseException:
+        progress_broker.unsubscribe(topic, queue)
+        raise
+    return StreamingResponse(
+        stream_progress(request, topic, queue, snapshots, until_terminal=False),
+        media_type='text/event-stream',
+        headers=SSE_HEADERS
+    )
+
 @app.get("/api/download/{download_id}/file")
-async def download_file(download_id: str, user_id: str):
-    """Download the actual file"""
-    if not supabase:
+async def download_file(download_id: str, user_id: str, request: Request, archive_format: str = Query('zip', alias='format')):
+    """Download the actual file.
+
+    With FILE_SERVING_MODE=x-accel the API only authorizes the request and
+    nginx streams the file; otherwise it is served here with Range/ETag support.
+    Files in S3 are served through a presigned redirect (or streamed with
+    S3_SERVE_MODE=proxy), and files on another node's local disk are relayed
+    from that node. Multi-file results are always streamed from here as a
+    ZIP (or tar) archive.
+    """
+    if not async_db:
         raise HTTPException(status_code=503, detail="Service unavailable in demo mode")
     
+    started = time.perf_counter()
     try:
         # Get download record
-        response = supabase.table('download_records').select('*').eq('id', download_id).eq('user_id', user_id).single().execute()
+        response = await async_db.table('download_records').select('*').eq('id', download_id).eq('user_id', user_id).maybe_single().execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="Download not found")
         
         record = response.data
+        if record['status'] == 'expired':
+            raise HTTPException(status_code=410, detail="Download expired; please download it again")
         if record['status'] != 'completed':
             raise HTTPException(status_code=400, detail="Download not completed")
         
-        file_path = DOWNLOADS_DIR / record['file_path']
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail="File not found")
+        forwarded = request.headers.get(FORWARDED_HEADER) is not None
+        files = await run_in_threadpool(media_files, record['file_path'])
+        if not files:
+            node = record.get('storage_node')
+            if not node or node == storage.node or forwarded:
+                raise HTTPException(status_code=404, detail="File not found")
+            # Downloaded by another node onto its local disk
+            try:
+                file_response = await proxied_response(
+                    node_client, f"{node.rstrip('/')}/api/download/{download_id}/file", request,
+                    {'user_id': user_id, 'format': archive_format}
+                )
+            except httpx.HTTPError as e:
+                logger.error(f"Node {node} holding download {download_id} is unreachable: {e}")
+                raise HTTPException(status_code=502, detail="File is temporarily unavailable")
+            FILE_SERVE_SECONDS.labels('node').observe(time.perf_counter() - started)
+            return file_response
         
-        return FileResponse(
-            path=str(file_path),
-            filename=record['filename'],
-            media_type='application/octet-stream'
-        )
+        # Recently served downloads are the last to be evicted under the disk quota
+        await run_in_threadpool(download_cleaner.touch, download_id)
+        
+        stored = files[0]
+        if stored.key != record['file_path']:
+            mode = 'archive'
+            file_response = archive_response([(f, f.name) for f in files], record['filename'], archive_format)
+        elif stored.path is None and settings.S3_SERVE_MODE == 'proxy':
+            mode = 'proxy'
+            status, headers, body = await run_in_threadpool(storage.get, stored.key, request.headers.get('range'))
+            file_response = object_response(status, headers, body, record['filename'])
+        elif stored.path is None:
+            mode = 'redirect'
+            file_response = RedirectResponse(storage.url(stored.key, record['filename']), status_code=307)
+        elif settings.FILE_SERVING_MODE == 'x-accel' and not forwarded:
+            # Relayed requests are streamed by the relaying node, not by nginx in front of this one
+            mode = 'x-accel'
+            file_response = accel_redirect_response(record['file_path'], record['filename'], settings.X_ACCEL_PREFIX)
+        else:
+            mode = 'python'
+            file_response = ranged_file_response(request, stored.path, record['filename'])
+        
+        FILE_SERVE_SECONDS.labels(mode).observe(time.perf_counter() - started)
+        served = file_response.headers.get('content-length') if mode in ('python', 'proxy') else None
+        BYTES_SERVED.labels(mode).inc(int(served) if served is not None else record['file_size'] or 0)
+        return file_response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error serving file: {e}")
         raise HTTPException(status_code=500, detail="Failed to serve file")
 
+def require_service_key(request: Request):
+    """Only let callers holding the service role key (e.g. a database webhook) through"""
+    scheme, _, token = request.headers.get('authorization', '').partition(' ')
+    if not SUPABASE_SERVICE_KEY or scheme.lower() != 'bearer' or not hmac.compare_digest(token, SUPABASE_SERVICE_KEY):
+        raise HTTPException(status_code=401, detail="Service key required")
+
+@app.post("/api/user/{user_id}/subscription/invalidate", dependencies=[Depends(require_service_key)])
+async def invalidate_subscription(user_id: str):
+    """Drop the cached plan of a user after their subscription changed"""
+    await run_in_threadpool(subscription_cache.invalidate, user_id)
+    return {"message": "Subscription cache invalidated"}
+
 @app.get("/api/user/{user_id}/downloads")
-async def get_user_downloads(user_id: str, limit: int = 50, offset: int = 0):
-    """Get user's download history"""
-    if not supabase:
+async def get_user_downloads(request: Request, user_id: str, limit: int = Query(50, ge=1, le=200),
+                             cursor: Optional[str] = None, offset: int = Query(0, ge=0)):
+    """Get a page of the user's download history, newest first.
+    
+    Pages are keyset-paginated on (created_at, id): pass the ``X-Next-Cursor``
+    header of one page as ``cursor`` to get the next. ``offset`` still works
+    for older clients but cannot be combined with a cursor. Responses carry
+    an ETag derived from the user's record count and latest change, so an
+    unchanged page is answered with 304 before the page is read.
+    """
+    if not async_db:
         return []
+    if cursor and offset:
+        raise HTTPException(status_code=400, detail="Pass either cursor or offset, not both")
+    
+    query = async_db.table('download_records').select(HISTORY_COLUMNS).eq('user_id', user_id)
+    if cursor:
+        created_at, last_id = decode_history_cursor(cursor)
+        query = query.or_(
+            f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{last_id})'
+        )
+    elif offset:
+        query = query.offset(offset)
     
     try:
-        response = supabase.table('download_records').select('*').eq('user_id', user_id).order('created_at', desc=True).limit(limit).offset(offset).execute()
-        return response.data
+        headers = {
+            'ETag': await history_etag(user_id, limit, cursor, offset),
+            # Pages change as downloads progress; clients revalidate every time
+            'Cache-Control': 'private, no-cache',
+        }
+        if_none_match = request.headers.get('if-none-match')
+        if if_none_match and headers['ETag'] in [tag.strip() for tag in if_none_match.split(',')]:
+            return Response(status_code=304, headers=headers)
         
+        response = await query.order('created_at', desc=True).order('id', desc=True).limit(limit).execute()
     except Exception as e:
         logger.error(f"Error fetching user downloads: {e}")
         raise HTTPException(status_code=500, detail="Failed to fetch downloads")
+    
+    rows = response.data or []
+    if len(rows) == limit:
+        headers['X-Next-Cursor'] = encode_history_cursor(rows[-1])
+    body = orjson.dumps(rows) if orjson else json.dumps(rows, separators=(',', ':')).encode()
+    return Response(content=body, media_type='application/json', headers=headers)
 
 @app.delete("/api/download/{download_id}")
 async def delete_download(download_id: str, user_id: str):
     """Delete a download and its files"""
-    if not supabase:
+    if not async_db:
         raise HTTPException(status_code=503, detail="Service unavailable in demo mode")
     
     try:
         # Get download record
-        response = supabase.table('download_records').select('*').eq('id', download_id).eq('user_id', user_id).single().execute()
+        response = await async_db.table('download_records').select('*').eq('id', download_id).eq('user_id', user_id).maybe_single().execute()
         if not response.data:
             raise HTTPException(status_code=404, detail="Download not found")
         
         record = response.data
         
-        # Delete file if it exists
-        if record['file_path']:
-            file_path = DOWNLOADS_DIR / record['file_path']
-            if file_path.exists():
-                file_path.unlink()
-            
-            # Also try to remove the directory if it's empty
-            try:
-                file_path.parent.rmdir()
-            except OSError:
-                pass  # Directory not empty or doesn't exist
+        # Delete file if it exists; files on another node's disk are swept there once the record is gone
+        if record['file_path'] and record.get('storage_node') in (None, storage.node):
+            await run_in_threadpool(storage.delete, record['file_path'])
         
         # Delete database record
-        supabase.table('download_records').delete().eq('id', download_id).execute()
+        await async_db.table('download_records').delete().eq('id', download_id).execute()
         
         return {"message": "Download deleted successfully"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error deleting download: {e}")
         raise HTTPException(status_code=500, detail="Failed to delete download")
 
 if __name__ == "__main__":
+    # Development server with auto-reload; production runs serve.py
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
@@ -0,0 +1,37 @@
+"""Production entry point for the API.
+
+Runs one uvicorn process per CPU core (API_WORKERS) on uvloop and the
+httptools parser. Each process serves the same socket, so nginx keeps a
+pool of connections open to it. On SIGTERM in-flight requests get
+SHUTDOWN_GRACE_SECONDS to finish before the processes exit.
+"""
+import os
+import importlib.util
+
+import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config import settings
+
+def available(module: str, fallback: str = 'auto') -> str:
+    return module if importlib.util.find_spec(module) else fallback
+
+if __name__ == "__main__":
+    uvicorn.run(
+        "main:app",
+        host=settings.HOST,
+        port=settings.PORT,
+        workers=settings.API_WORKERS or os.cpu_count() or 1,
+        loop=available('uvloop'),
+        http=available('httptools'),
+        # nginx must drop idle upstream connections before uvicorn does, or it reuses closed ones
+        timeout_keep_alive=settings.KEEPALIVE_TIMEOUT_SECONDS,
+        timeout_graceful_shutdown=int(settings.SHUTDOWN_GRACE_SECONDS),
+        proxy_headers=True,
+        forwarded_allow_ips='127.0.0.1',
+        # nginx already logs every request
+        access_log=False,
+        log_level="info"
+    )
@@ -0,0 +1,105 @@
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+# Tests import the backend modules the way main.py and worker.py do
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+class Clock:
+    """Stand-in for time.time that only moves when told to"""
+
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr('time.time', clock)
+    return clock
+
+@pytest.fixture(scope='session')
+def backend(tmp_path_factory):
+    """The API module, imported in a scratch directory for its queue, cache and download files"""
+    os.chdir(tmp_path_factory.mktemp('backend'))
+    import main
+    return main
+
+class FakeQuery:
+    """Records the filters of a PostgREST query and answers it with fixed rows"""
+
+    def __init__(self, rows: List[Dict[str, Any]]):
+        self.rows = rows
+        self.filters: List[tuple] = []
+        self.ordering: Optional[tuple] = None
+        self.row_limit: Optional[int] = None
+        self.values: Optional[Dict[str, Any]] = None
+
+    def select(self, columns: str) -> 'FakeQuery':
+        self.columns = columns
+        return self
+
+    def eq(self, column: str, value: Any) -> 'FakeQuery':
+        self.filters.append((column, value))
+        return self
+
+    def update(self, values: Dict[str, Any]) -> 'FakeQuery':
+        self.values = values
+        return self
+
+    def in_(self, column: str, values: List[Any]) -> 'FakeQuery':
+        self.filters.append((column, values, 'in'))
+        return self
+
+    def gt(self, column: str, value: Any) -> 'FakeQuery':
+        self.filters.append((column, value, 'gt'))
+        return self
+
+    def order(self, column: str, desc: bool = False) -> 'FakeQuery':
+        self.ordering = (column, desc)
+        return self
+
+    def limit(self, count: int) -> 'FakeQuery':
+        self.row_limit = count
+        return self
+
+    def execute(self):
+        rows = [row for row in self.rows if all(self._matches(row, *f) for f in self.filters)]
+        if self.ordering:
+            column, desc = self.ordering
+            rows.sort(key=lambda row: row[column], reverse=desc)
+        if self.row_limit is not None:
+            rows = rows[:self.row_limit]
+        if self.values is not None:
+            for row in rows:
+                row.update(self.values)
+        return SimpleNamespace(data=rows)
+
+    @staticmethod
+    def _matches(row: Dict[str, Any], column: str, value: Any, operator: str = 'eq') -> bool:
+        if operator == 'in':
+            return row.get(column) in value
+        if operator == 'gt':
+            return row.get(column) is not None and row[column] > value
+        return row.get(column) == value
+
+class FakeDB:
+    """Blocking PostgREST client answering selects from in-memory tables"""
+
+    def __init__(self, **tables: List[Dict[str, Any]]):
+        self.tables = tables
+        self.queries: List[FakeQuery] = []
+
+    def table(self, name: str) -> FakeQuery:
+        query = FakeQuery(self.tables.get(name, []))
+        self.queries.append(query)
+        return query
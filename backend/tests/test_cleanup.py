@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from conftest import FakeDB
+from utils.cleanup import DownloadCleaner
+
+MB = 1024 * 1024
+
+@pytest.fixture
+def downloads(tmp_path):
+    path = tmp_path / 'downloads'
+    path.mkdir()
+    return path
+
+def make_cleaner(downloads, tmp_path, client=None, max_bytes=0):
+    return DownloadCleaner(
+        client, downloads, tmp_path / 'cleanup.db', tmp_path / 'cleanup.lock',
+        retention_days=30, max_bytes=max_bytes, orphan_grace_seconds=0
+    )
+
+def write(path, size):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b'\0' * size)
+    return path
+
+def test_hardlinked_files_count_once(downloads, tmp_path):
+    source = write(downloads / '.cache' / 'abc' / 'video.mp4', 2 * MB)
+    for download_id in ('d1', 'd2', 'd3'):
+        (downloads / 'user-1' / download_id).mkdir(parents=True)
+        os.link(source, downloads / 'user-1' / download_id / 'video.mp4')
+    write(downloads / 'user-1' / 'd3' / 'extra.jpg', MB)
+
+    cleaner = make_cleaner(downloads, tmp_path)
+    cleaner.refresh_index()
+
+    assert cleaner.stats()['size_bytes'] == 3 * MB
+
+def test_quota_eviction_expires_records_instead_of_deleting_them(downloads, tmp_path):
+    records = [
+        {'id': download_id, 'user_id': 'user-1', 'status': 'completed', 'file_path': f"user-1/{download_id}/video.mp4"}
+        for download_id in ('old', 'shared-1', 'shared-2', 'new')
+    ]
+    write(downloads / 'user-1' / 'old' / 'video.mp4', 2 * MB)
+    shared = write(downloads / 'user-1' / 'shared-1' / 'video.mp4', 2 * MB)
+    (downloads / 'user-1' / 'shared-2').mkdir()
+    os.link(shared, downloads / 'user-1' / 'shared-2' / 'video.mp4')
+    write(downloads / 'user-1' / 'new' / 'video.mp4', 2 * MB)
+
+    cleaner = make_cleaner(downloads, tmp_path, FakeDB(download_records=records), max_bytes=3 * MB)
+    cleaner.refresh_index()
+    for access, download_id in enumerate(('old', 'shared-1', 'shared-2', 'new')):
+        with cleaner._connect() as conn:
+            conn.execute("UPDATE usage SET last_access = ? WHERE download_id = ?", (access, download_id))
+
+    evicted, freed = cleaner.enforce_quota()
+
+    # Evicting shared-1 alone frees nothing; shared-2 has to go too
+    assert evicted == 3
+    assert freed == 4 * MB
+    assert [record['status'] for record in records] == ['expired', 'expired', 'expired', 'completed']
+    assert records[0]['file_path'] is None
+    assert (downloads / 'user-1' / 'new' / 'video.mp4').exists()
+    assert cleaner.stats()['size_bytes'] == 2 * MB
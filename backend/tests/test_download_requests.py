@@ -0,0 +1,24 @@
+import pytest
+from fastapi.testclient import TestClient
+
+USER_ID = '00000000-0000-0000-0000-000000000001'
+
+@pytest.fixture
+def client(backend):
+    return TestClient(backend.app)
+
+@pytest.mark.parametrize('path, body', [
+    ('/api/youtube/download', {'url': 'https://www.youtube.com/watch?v=abc', 'media_type': 'image', 'user_id': USER_ID}),
+    ('/api/instagram/download', {'url': 'https://www.instagram.com/p/abc/', 'media_type': 'video', 'user_id': USER_ID}),
+    ('/api/batch/download', {'user_id': USER_ID, 'items': [{'url': 'https://www.youtube.com/watch?v=abc', 'media_type': 'gif'}]}),
+])
+def test_rejects_media_types_download_records_does_not_accept(client, path, body):
+    response = client.post(path, json=body)
+
+    assert response.status_code == 422
+    assert response.json()['detail'][-1]['loc'][-1] == 'media_type'
+
+def test_media_types_are_a_subset_of_the_record_check(backend):
+    for model in (backend.YouTubeDownloadRequest, backend.InstagramDownloadRequest, backend.BatchItem):
+        allowed = model.model_fields['media_type'].annotation.__args__
+        assert set(allowed) <= set(backend.RECORD_MEDIA_TYPES)
@@ -0,0 +1,23 @@
+import pytest
+
+from utils.file_serving import parse_range
+
+@pytest.mark.parametrize('header, expected', [
+    ('bytes=0-99', (0, 99)),
+    ('bytes=100-', (100, 999)),
+    ('bytes=-100', (900, 999)),
+    ('bytes=-5000', (0, 999)),
+    ('bytes=900-5000', (900, 999)),
+    (' bytes=0-0 ', (0, 0)),
+])
+def test_satisfiable_ranges(header, expected):
+    assert parse_range(header, 1000) == expected
+
+@pytest.mark.parametrize('header', ['bytes=1000-', 'bytes=1000-1200', 'bytes=500-100', 'bytes=-0'])
+def test_unsatisfiable_ranges(header):
+    assert parse_range(header, 1000) is None
+
+@pytest.mark.parametrize('header', ['bytes=0-1,5-9', 'bytes=-', 'items=0-9', 'bytes=a-b', ''])
+def test_unsupported_ranges(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 1000)
@@ -0,0 +1,85 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from utils.db import PostgrestClient
+
+USER_ID = str(uuid.UUID(int=1))
+
+class FakeAsyncQuery:
+    def __init__(self, db, target):
+        self.db = db
+        self.target = target
+        self.params = []
+
+    def __getattr__(self, name):
+        def record(*args, **kwargs):
+            self.params.append((name, args))
+            return self
+        return record
+
+    async def execute(self):
+        self.db.executed.append(self)
+        if self.target == 'download_history_version':
+            return SimpleNamespace(data=[self.db.version])
+        return SimpleNamespace(data=self.db.rows)
+
+class FakeAsyncDB:
+    def __init__(self, rows):
+        self.rows = rows
+        self.version = {'total': len(rows), 'last_change': '2026-10-16T10:00:00+00:00'}
+        self.executed = []
+
+    def table(self, name):
+        return FakeAsyncQuery(self, name)
+
+    def rpc(self, function, params):
+        return FakeAsyncQuery(self, function)
+
+def record(index):
+    return {'id': str(uuid.UUID(int=index)), 'created_at': f"2026-10-16T10:00:{index:02d}+00:00", 'status': 'completed'}
+
+@pytest.fixture
+def history(backend, monkeypatch):
+    db = FakeAsyncDB([record(2), record(1)])
+    monkeypatch.setattr(backend, 'async_db', db)
+    return db, TestClient(backend.app)
+
+def test_cursor_round_trip(backend):
+    cursor = backend.encode_history_cursor(record(7))
+
+    assert backend.decode_history_cursor(cursor) == (record(7)['created_at'], record(7)['id'])
+    with pytest.raises(HTTPException):
+        backend.decode_history_cursor('not-a-cursor')
+
+def test_repeated_order_calls_add_tie_breakers():
+    query = PostgrestClient('http://db', 'key').table('download_records').order('created_at', desc=True).order('id', desc=True)
+
+    assert [value for name, value in query._params if name == 'order'] == ['created_at.desc,id.desc']
+
+def test_unchanged_history_is_answered_from_the_version_probe(history):
+    db, client = history
+    path = f"/api/user/{USER_ID}/downloads?limit=2"
+    first = client.get(path)
+    assert first.status_code == 200
+    assert first.headers['X-Next-Cursor']
+
+    db.executed.clear()
+    cached = client.get(path, headers={'If-None-Match': first.headers['ETag']})
+    assert cached.status_code == 304
+    assert [query.target for query in db.executed] == ['download_history_version']
+
+    db.version = {'total': 3, 'last_change': '2026-10-16T10:05:00+00:00'}
+    assert client.get(path, headers={'If-None-Match': first.headers['ETag']}).status_code == 200
+
+def test_offset_still_pages_but_not_with_a_cursor(history):
+    db, client = history
+    path = f"/api/user/{USER_ID}/downloads"
+
+    assert client.get(path, params={'offset': 50}).status_code == 200
+    assert ('offset', (50,)) in db.executed[-1].params
+    cursor = client.get(path, params={'limit': 2}).headers['X-Next-Cursor']
+    assert client.get(path, params={'offset': 50, 'cursor': cursor}).status_code == 400
@@ -0,0 +1,38 @@
+import pytest
+
+from utils.info_cache import InfoCache
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return InfoCache(tmp_path / 'info.db', ttl_seconds=60, memory_entries=2)
+
+def test_callers_get_independent_copies(cache):
+    info = {'id': 'abc', 'formats': [{'format_id': '18'}]}
+    cache.set('YouTube:abc', info)
+    # yt-dlp fills in the dicts it processes
+    info['formats'][0]['http_headers'] = {}
+
+    first = cache.get('YouTube:abc')
+    first['fulltitle'] = 'changed'
+    first['formats'].append({'format_id': '22'})
+
+    assert cache.get('YouTube:abc') == {'id': 'abc', 'formats': [{'format_id': '18'}]}
+
+def test_shared_table_serves_other_processes(cache, tmp_path):
+    cache.set('YouTube:abc', {'id': 'abc'})
+    other = InfoCache(tmp_path / 'info.db', ttl_seconds=60)
+    assert other.get('YouTube:abc') == {'id': 'abc'}
+    assert other.stats()['hits'] == 1
+
+def test_entries_expire(cache, clock):
+    cache.set('YouTube:abc', {'id': 'abc'})
+    clock.advance(61)
+    assert cache.get('YouTube:abc') is None
+    assert cache.stats()['misses'] == 1
+
+def test_memory_is_bounded(cache):
+    for key in ('a', 'b', 'c'):
+        cache.set(key, {'id': key})
+    assert cache.stats()['memory_entries'] == 2
+    # Evicted from memory, still in the shared table
+    assert cache.get('a') == {'id': 'a'}
@@ -0,0 +1,63 @@
+import pytest
+
+from utils.instagram_sessions import InstagramSessionPool, SessionRateLimitedError, SessionUnavailableError
+
+class FakeLoader:
+    def __init__(self):
+        self.logins = 0
+        self.loaded = None
+
+    def login(self, username, password):
+        self.logins += 1
+
+    def save_session_to_file(self, filename):
+        with open(filename, 'w') as f:
+            f.write('cookies')
+
+    def load_session_from_file(self, username, filename):
+        self.loaded = filename
+
+def pool(tmp_path, accounts=(), **options):
+    return InstagramSessionPool(list(accounts), tmp_path, anonymous=0 if accounts else 1, **options)
+
+def test_processes_spend_from_one_budget(tmp_path, clock):
+    first, second = pool(tmp_path, jobs_per_minute=1), pool(tmp_path, jobs_per_minute=1)
+
+    with first.checkout(timeout=0):
+        pass
+    with pytest.raises(SessionUnavailableError):
+        with second.checkout(timeout=0):
+            pass
+
+    clock.advance(60)
+    with second.checkout(timeout=0):
+        pass
+
+def test_backoff_after_429_is_shared(tmp_path, clock):
+    first, second = pool(tmp_path, backoff_seconds=300), pool(tmp_path, backoff_seconds=300)
+
+    with pytest.raises(SessionRateLimitedError):
+        with first.checkout(timeout=0):
+            raise SessionRateLimitedError("429")
+    with pytest.raises(SessionUnavailableError):
+        with second.checkout(timeout=0):
+            pass
+
+    clock.advance(301)
+    with second.checkout(timeout=0):
+        pass
+    assert second.stats()['backing_off'] == 0
+
+def test_only_one_process_logs_in(tmp_path):
+    first = pool(tmp_path, accounts=[('alice', 'secret')])
+    second = pool(tmp_path, accounts=[('alice', 'secret')])
+    for p in (first, second):
+        p._sessions[0].loader = FakeLoader()
+
+    first._login(first._sessions[0])
+    second._login(second._sessions[0])
+
+    assert first._sessions[0].loader.logins == 1
+    assert second._sessions[0].loader.logins == 0
+    assert second._sessions[0].loader.loaded == str(tmp_path / 'session-alice')
+    assert not list(tmp_path.glob('*.tmp'))
@@ -0,0 +1,148 @@
+import pytest
+
+from utils.job_queue import JobQueue
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return JobQueue(tmp_path / 'jobs.db', lease_seconds=60, max_attempts=3, retry_backoff=10, aging_seconds=60)
+
+def payload(user_id='user-1'):
+    return {'url': 'https://www.youtube.com/watch?v=x', 'user_id': user_id}
+
+def test_enqueue_ignores_duplicate_download(queue):
+    assert queue.enqueue('YouTube', 'd1', payload())
+    assert not queue.enqueue('YouTube', 'd1', payload())
+    assert queue.depth('YouTube') == 1
+
+def test_lease_claims_job_once(queue):
+    queue.enqueue('YouTube', 'd1', payload())
+    queue.enqueue('Instagram', 'd2', payload())
+
+    jobs = queue.lease('YouTube', 'w1', limit=5)
+    assert [job['download_id'] for job in jobs] == ['d1']
+    assert jobs[0]['attempts'] == 1
+    assert jobs[0]['payload'] == payload()
+    assert queue.lease('YouTube', 'w2', limit=5) == []
+
+def test_expired_lease_is_reclaimed(queue, clock):
+    queue.enqueue('YouTube', 'd1', payload())
+    job, = queue.lease('YouTube', 'w1')
+
+    clock.advance(30)
+    queue.renew([job['id']], 'w1')
+    clock.advance(59)
+    assert queue.lease('YouTube', 'w2') == []
+
+    clock.advance(2)
+    reclaimed, = queue.lease('YouTube', 'w2')
+    assert reclaimed['id'] == job['id']
+    assert reclaimed['attempts'] == 2
+
+def test_failed_job_is_retried_with_backoff(queue, clock):
+    queue.enqueue('YouTube', 'd1', payload())
+    job, = queue.lease('YouTube', 'w1')
+
+    assert queue.fail(job['id'], 'boom')
+    assert queue.lease('YouTube', 'w1') == []
+    clock.advance(10)
+    job, = queue.lease('YouTube', 'w1')
+
+    # The backoff doubles with every attempt
+    assert queue.fail(job['id'], 'boom')
+    clock.advance(19)
+    assert queue.lease('YouTube', 'w1') == []
+    clock.advance(1)
+    job, = queue.lease('YouTube', 'w1')
+    assert job['attempts'] == 3
+
+    assert not queue.fail(job['id'], 'boom')
+    assert queue.stats() == {'YouTube': {'failed': 1}}
+
+def test_fail_without_retry_fails_followers(queue):
+    queue.enqueue('YouTube', 'd1', payload(), media_key='k')
+    job, = queue.lease('YouTube', 'w1')
+    queue.enqueue('YouTube', 'd2', payload('user-2'), media_key='k')
+
+    assert not queue.fail(job['id'], 'bad url', retry=False)
+    assert queue.stats() == {'YouTube': {'failed': 2}}
+
+def test_identical_media_attaches_to_running_job(queue):
+    queue.enqueue('YouTube', 'd1', payload(), media_key='k')
+    job, = queue.lease('YouTube', 'w1')
+    queue.enqueue('YouTube', 'd2', payload('user-2'), media_key='k')
+    queue.enqueue('YouTube', 'd3', payload('user-3'), media_key='other')
+
+    assert [f['download_id'] for f in queue.followers(job['id'])] == ['d2']
+    # Followers are never scheduled themselves
+    assert [j['download_id'] for j in queue.lease('YouTube', 'w1', limit=5)] == ['d3']
+
+def test_complete_returns_followers_attached_after_lease(queue):
+    queue.enqueue('YouTube', 'd1', payload(), media_key='k')
+    job, = queue.lease('YouTube', 'w1')
+    assert queue.followers(job['id']) == []
+    # Attaches while the leader is downloading, after any earlier look at its followers
+    queue.enqueue('YouTube', 'd2', payload('user-2'), media_key='k')
+
+    assert [f['download_id'] for f in queue.complete(job['id'])] == ['d2']
+    assert queue.stats() == {'YouTube': {'done': 2}}
+
+    # Once the leader is done, identical requests start a new job
+    queue.enqueue('YouTube', 'd3', payload('user-3'), media_key='k')
+    job, = queue.lease('YouTube', 'w1')
+    assert job['download_id'] == 'd3'
+    assert job['leader_id'] is None
+
+def test_lease_interleaves_users(queue, clock):
+    for i in range(3):
+        queue.enqueue('YouTube', f"a{i}", payload('heavy'))
+        clock.advance(1)
+    queue.enqueue('YouTube', 'b0', payload('light'))
+
+    jobs = queue.lease('YouTube', 'w1', limit=2)
+    assert sorted(job['download_id'] for job in jobs) == ['a0', 'b0']
+
+def test_lease_prefers_higher_weight(queue):
+    queue.enqueue('YouTube', 'free0', payload('free'), weight=1)
+    queue.enqueue('YouTube', 'pro0', payload('pro'), weight=3)
+    queue.lease('YouTube', 'w1', limit=2)
+    queue.enqueue('YouTube', 'free1', payload('free'), weight=1)
+    queue.enqueue('YouTube', 'pro1', payload('pro'), weight=3)
+
+    # Both users run one job; the pro job's share is three times larger
+    job, = queue.lease('YouTube', 'w1', limit=1)
+    assert job['download_id'] == 'pro1'
+
+def test_waiting_job_eventually_wins(queue, clock):
+    queue.enqueue('YouTube', 'free0', payload('free'), weight=1)
+    running, = queue.lease('YouTube', 'w1')
+    queue.enqueue('YouTube', 'free1', payload('free'), weight=1)
+    for _ in range(3):
+        clock.advance(50)
+        queue.renew([running['id']], 'w1')
+    # A fresh pro job scores 1/3; free1 scores 2/1 less 150s/60s of waiting
+    queue.enqueue('YouTube', 'pro0', payload('pro'), weight=3)
+
+    job, = queue.lease('YouTube', 'w1', limit=1)
+    assert job['download_id'] == 'free1'
+
+def test_per_user_limit(tmp_path, clock):
+    queue = JobQueue(tmp_path / 'jobs.db', per_user_limit=2)
+    for i in range(4):
+        queue.enqueue('YouTube', f"a{i}", payload('heavy'))
+    queue.enqueue('YouTube', 'b0', payload('light'))
+
+    jobs = queue.lease('YouTube', 'w1', limit=5)
+    assert sorted(job['download_id'] for job in jobs) == ['a0', 'a1', 'b0']
+    assert queue.lease('YouTube', 'w1', limit=5) == []
+
+    queue.complete(jobs[0]['id'])
+    assert len(queue.lease('YouTube', 'w1', limit=5)) == 1
+
+def test_released_job_is_leased_again_without_losing_an_attempt(queue):
+    queue.enqueue('YouTube', 'd1', payload())
+    job, = queue.lease('YouTube', 'w1')
+
+    assert queue.release([job['id']], 'w2') == 0
+    assert queue.release([job['id']], 'w1') == 1
+    job, = queue.lease('YouTube', 'w2')
+    assert job['attempts'] == 1
@@ -0,0 +1,66 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from utils.progress import ProgressStore
+
+class ConnectedRequest:
+    async def is_disconnected(self) -> bool:
+        return False
+
+def parse_events(chunks):
+    return [json.loads(chunk.split('data: ', 1)[1]) for chunk in chunks if chunk.startswith('id:')]
+
+def test_store_keeps_latest_event_per_download(tmp_path):
+    store = ProgressStore(tmp_path / 'progress.db')
+    store.publish([('d1', 'u1'), ('d2', 'u1')], {'status': 'queued'})
+    store.publish([('d1', 'u1')], {'status': 'downloading', 'percent': 50})
+
+    snapshot = store.snapshot('d1')
+    assert snapshot['status'] == 'downloading'
+    assert snapshot['user_id'] == 'u1'
+    assert [e['download_id'] for e in store.user_snapshots('u1')] == ['d2', 'd1']
+    assert [(user, e['status']) for user, e in store.changes_since(1)] == [('u1', 'queued'), ('u1', 'downloading')]
+
+@pytest.fixture
+def events(backend, tmp_path, monkeypatch):
+    from utils.progress import ProgressBroker
+
+    store = ProgressStore(tmp_path / 'progress.db')
+    broker = ProgressBroker(store)
+    monkeypatch.setattr(backend, 'progress_store', store)
+    monkeypatch.setattr(backend, 'progress_broker', broker)
+    return backend, store, broker
+
+def test_rejects_other_users_download(events):
+    backend, store, _ = events
+    store.publish([('d1', 'owner')], {'status': 'queued'})
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(backend.download_events('d1', 'someone-else', ConnectedRequest()))
+    assert error.value.status_code == 404
+
+def test_rejects_unknown_download_without_snapshot(events):
+    backend, _, broker = events
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(backend.download_events('missing', 'u1', ConnectedRequest()))
+    assert error.value.status_code == 404
+    assert broker.stats()['subscribers'] == 0
+
+def test_event_published_after_snapshot_ends_stream(events):
+    backend, store, broker = events
+    store.publish([('d1', 'u1')], {'status': 'downloading'})
+
+    async def scenario():
+        response = await backend.download_events('d1', 'u1', ConnectedRequest())
+        # Subscribed before the snapshot was read: the broker delivers what came after it
+        store.publish([('d1', 'u1')], {'status': 'completed'})
+        for _, event in store.changes_since(0):
+            broker._dispatch('download:d1', event)
+        return [chunk async for chunk in response.body_iterator]
+
+    received = parse_events(asyncio.run(asyncio.wait_for(scenario(), 5)))
+    # The snapshot is not sent twice, and the terminal event closes the stream
+    assert [e['status'] for e in received] == ['downloading', 'completed']
+    assert broker.stats()['subscribers'] == 0
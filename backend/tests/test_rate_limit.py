@@ -0,0 +1,45 @@
+import pytest
+
+from utils.rate_limit import RateLimiter
+
+@pytest.fixture
+def limiter(tmp_path, clock):
+    return RateLimiter(tmp_path / 'rate_limits.db')
+
+def test_admits_up_to_capacity(limiter):
+    bucket = ('user:1', 3, 1.0, 1)
+    assert [limiter.acquire([bucket]) for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire([bucket]) == pytest.approx(1.0)
+    assert limiter.stats() == {'allowed': 3, 'limited': 1}
+
+def test_refills_over_time(limiter, clock):
+    bucket = ('user:1', 2, 0.5, 1)
+    limiter.acquire([bucket])
+    limiter.acquire([bucket])
+    assert limiter.acquire([bucket]) == pytest.approx(2.0)
+
+    clock.advance(1)
+    assert limiter.acquire([bucket]) == pytest.approx(1.0)
+    clock.advance(1)
+    assert limiter.acquire([bucket]) == 0
+
+def test_takes_from_all_buckets_or_none(limiter):
+    user = ('user:1', 5, 1.0, 1)
+    platform = ('platform:YouTube', 1, 1.0, 1)
+    assert limiter.acquire([user, platform]) == 0
+    assert limiter.acquire([user, platform]) == pytest.approx(1.0)
+
+    # The rejected request above must not have spent the user's tokens
+    for _ in range(4):
+        assert limiter.acquire([user]) == 0
+    assert limiter.acquire([user]) > 0
+
+def test_large_request_runs_into_debt(limiter, clock):
+    bucket = ('user:1', 10, 1.0, 25)
+    assert limiter.acquire([bucket]) == 0
+    # 10 - 25 leaves the bucket 15 tokens short of the next single download
+    assert limiter.acquire([('user:1', 10, 1.0, 1)]) == pytest.approx(16.0)
+
+def test_zero_rate_disables_bucket(limiter):
+    for _ in range(5):
+        assert limiter.acquire([('user:1', 1, 0, 1)]) == 0
@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+
+import pytest
+
+from utils.db import PostgrestError
+from utils.record_writer import RecordWriter
+
+class FakeTable:
+    def __init__(self, client):
+        self.client = client
+
+    def insert(self, rows):
+        self.rows = rows
+        return self
+
+    def execute(self):
+        self.client.insert_calls.append(len(self.rows))
+        if any(row.get('media_type') == 'bad' for row in self.rows):
+            raise PostgrestError(400, 'new row violates check constraint "download_records_media_type_check"')
+        self.client.inserted.extend(self.rows)
+        return SimpleNamespace(data=None)
+
+class FakeRpc:
+    def __init__(self, client, params):
+        self.client = client
+        self.params = params
+
+    def execute(self):
+        if self.client.fail_updates:
+            self.client.fail_updates -= 1
+            raise PostgrestError(503, 'unavailable')
+        self.client.updates.append(self.params['updates'])
+        return SimpleNamespace(data=None)
+
+class FakeClient:
+    def __init__(self):
+        self.inserted = []
+        self.insert_calls = []
+        self.updates = []
+        self.fail_updates = 0
+
+    def table(self, name):
+        return FakeTable(self)
+
+    def rpc(self, name, params):
+        return FakeRpc(self, params)
+
+@pytest.fixture
+def client():
+    return FakeClient()
+
+@pytest.fixture
+def writer(client):
+    # A long interval keeps the background thread out of the way; tests flush explicitly
+    writer = RecordWriter(client, max_batch=10, flush_interval=60)
+    yield writer
+    writer.close()
+
+def test_inserts_are_group_committed(writer, client):
+    futures = [writer.insert({'id': str(i), 'media_type': 'video'}) for i in range(3)]
+    writer.flush()
+    assert all(future.result(timeout=1) is None for future in futures)
+    assert client.insert_calls == [3]
+
+def test_rejected_row_fails_only_its_own_future(writer, client):
+    good = writer.insert({'id': 'good', 'media_type': 'video'})
+    bad = writer.insert({'id': 'bad', 'media_type': 'bad'})
+    other = writer.insert({'id': 'other', 'media_type': 'audio'})
+    writer.flush()
+
+    assert good.result(timeout=1) is None
+    assert other.result(timeout=1) is None
+    with pytest.raises(PostgrestError):
+        bad.result(timeout=1)
+    assert [row['id'] for row in client.inserted] == ['good', 'other']
+    assert client.insert_calls == [3, 1, 1, 1]
+
+def test_updates_are_merged_per_record(writer, client):
+    writer.update('d1', status='downloading')
+    writer.update('d1', status='completed', file_size=10)
+    writer.update('d2', status='failed')
+    writer.flush()
+    assert client.updates == [[
+        {'id': 'd1', 'status': 'completed', 'file_size': 10},
+        {'id': 'd2', 'status': 'failed'},
+    ]]
+
+def test_failed_updates_are_retried_without_overwriting_newer_changes(writer, client):
+    client.fail_updates = 1
+    writer.update('d1', status='downloading', file_size=5)
+    writer.flush()
+    writer.update('d1', status='completed')
+    writer.flush()
+    assert client.updates == [[{'id': 'd1', 'status': 'completed', 'file_size': 5}]]
+
+@pytest.mark.parametrize('fields', [{'media_type': 'gif'}, {'platform': 'TikTok'}, {'user_id': 'user-1'}])
+def test_rows_the_database_would_reject_are_refused_up_front(backend, fields):
+    from fastapi import HTTPException
+
+    record = backend.new_download_record(
+        '8f14e45f-ceea-467f-a0e6-0f2b3c4d5e6f', 'YouTube', 'https://www.youtube.com/watch?v=x', 'video'
+    )
+    record.update(fields)
+    with pytest.raises(HTTPException) as error:
+        backend.create_download_records([record])
+    assert error.value.status_code == 400
@@ -0,0 +1,91 @@
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+from utils.file_serving import FORWARDED_HEADER
+from utils.storage import LocalStorage, node_url
+
+def test_put_hardlinks_and_lists_a_prefix(tmp_path):
+    source = tmp_path / 'cache' / 'clip.mp4'
+    source.parent.mkdir()
+    source.write_bytes(b'x' * 10)
+    storage = LocalStorage(tmp_path / 'downloads', node='http://node-a:8000')
+
+    storage.put('user-1/d1', [source])
+
+    stored, = storage.files('user-1/d1')
+    assert stored.key == 'user-1/d1/clip.mp4'
+    assert stored.size == 10
+    assert stored.path.stat().st_ino == source.stat().st_ino
+    assert storage.files('user-1/d1/clip.mp4')[0].key == stored.key
+
+def test_delete_reclaims_the_download_directory(tmp_path):
+    storage = LocalStorage(tmp_path)
+    (tmp_path / 'user-1' / 'd1').mkdir(parents=True)
+    (tmp_path / 'user-1' / 'd1' / 'clip.mp4').write_bytes(b'x' * 10)
+
+    assert storage.delete('user-1/d1/clip.mp4') == 10
+    assert not (tmp_path / 'user-1' / 'd1').exists()
+    assert storage.files('user-1/d1') == []
+
+def test_node_url_prefers_the_configured_url(monkeypatch):
+    from config import settings
+
+    monkeypatch.setattr(settings, 'NODE_URL', 'http://node-a.internal:8000')
+    assert node_url() == 'http://node-a.internal:8000'
+
+class FakeRecordDB:
+    """Answers the file endpoint's record lookup"""
+
+    def __init__(self, record):
+        self.record = record
+
+    def table(self, name):
+        return self
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        return self
+
+    def maybe_single(self):
+        return self
+
+    async def execute(self):
+        return SimpleNamespace(data=self.record)
+
+@pytest.fixture
+def remote_record(backend, monkeypatch):
+    record = {
+        'id': 'd1', 'user_id': 'user-1', 'status': 'completed', 'file_path': 'user-1/d1/clip.mp4',
+        'filename': 'clip.mp4', 'storage_node': 'http://node-b:8000',
+    }
+    monkeypatch.setattr(backend, 'async_db', FakeRecordDB(record))
+    return record
+
+def test_file_on_another_node_is_relayed_from_it(backend, remote_record, monkeypatch):
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return httpx.Response(206, stream=httpx.ByteStream(b'abc'), headers={'Content-Range': 'bytes 0-2/10'})
+
+    monkeypatch.setattr(backend, 'node_client', httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    response = TestClient(backend.app).get('/api/download/d1/file', params={'user_id': 'user-1'}, headers={'Range': 'bytes=0-2'})
+
+    assert response.status_code == 206
+    assert response.content == b'abc'
+    request, = seen
+    assert str(request.url).startswith('http://node-b:8000/api/download/d1/file?')
+    assert request.headers[FORWARDED_HEADER] == '1'
+    assert request.headers['range'] == 'bytes=0-2'
+
+def test_forwarded_requests_are_not_relayed_again(backend, remote_record):
+    response = TestClient(backend.app).get(
+        '/api/download/d1/file', params={'user_id': 'user-1'}, headers={FORWARDED_HEADER: '1'}
+    )
+
+    assert response.status_code == 404
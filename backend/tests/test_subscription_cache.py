@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from conftest import FakeDB
+from utils.subscription_cache import SubscriptionCache, SubscriptionChangeFeed
+
+PRO = {'user_id': 'user-1', 'plan_type': 'pro'}
+
+@pytest.fixture
+def cache(tmp_path, clock):
+    return SubscriptionCache(tmp_path / 'subscriptions.db', ttl_seconds=300, negative_ttl_seconds=600)
+
+def test_caches_lookups_until_the_ttl(cache, clock):
+    calls = []
+    loader = lambda user_id: calls.append(user_id) or PRO
+
+    assert cache.get('user-1', loader) == PRO
+    assert cache.get('user-1', loader) == PRO
+    clock.advance(301)
+    assert cache.get('user-1', loader) == PRO
+    assert calls == ['user-1', 'user-1']
+
+def test_negative_entries_never_outlive_positive_ones(cache, clock):
+    calls = []
+    cache.get('user-1', lambda user_id: calls.append(user_id))
+
+    clock.advance(301)
+    cache.get('user-1', lambda user_id: calls.append(user_id))
+    assert cache.negative_ttl_seconds == 300
+    assert len(calls) == 2
+
+def test_invalidation_reaches_other_processes(cache, tmp_path, clock):
+    other = SubscriptionCache(tmp_path / 'subscriptions.db', ttl_seconds=300, negative_ttl_seconds=300)
+    other.get('user-1', lambda user_id: None)
+
+    cache.invalidate('user-1')
+    clock.advance(2)
+
+    assert other.get('user-1', lambda user_id: PRO) == PRO
+
+def test_invalidation_during_a_load_is_not_overwritten(cache):
+    loading, release = threading.Event(), threading.Event()
+
+    def slow_loader(user_id):
+        loading.set()
+        release.wait(5)
+        return None  # read before the upgrade committed
+
+    thread = threading.Thread(target=cache.get, args=('user-1', slow_loader))
+    thread.start()
+    loading.wait(5)
+    cache.invalidate('user-1')
+    release.set()
+    thread.join(5)
+
+    assert cache.get('user-1', lambda user_id: PRO) == PRO
+
+def test_change_feed_invalidates_users_changed_since_the_last_poll(cache):
+    subscriptions = [{'user_id': 'user-1', 'updated_at': '2026-10-16T10:00:00+00:00'}]
+    feed = SubscriptionChangeFeed(FakeDB(subscriptions=subscriptions), cache)
+    assert feed.poll() == 0
+
+    cache.get('user-1', lambda user_id: None)
+    cache.get('user-2', lambda user_id: None)
+    subscriptions.append({'user_id': 'user-2', 'updated_at': '2026-10-16T10:05:00+00:00'})
+
+    assert feed.poll() == 1
+    assert cache.get('user-1', lambda user_id: PRO) is None
+    assert cache.get('user-2', lambda user_id: PRO) == PRO
+    assert feed.poll() == 0
+
+def test_invalidate_endpoint_requires_the_service_key(backend, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    monkeypatch.setattr(backend, 'SUPABASE_SERVICE_KEY', 'service-key')
+    client = TestClient(backend.app)
+    path = '/api/user/user-1/subscription/invalidate'
+
+    assert client.post(path).status_code == 401
+    assert client.post(path, headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    assert client.post(path, headers={'Authorization': 'Bearer service-key'}).status_code == 200
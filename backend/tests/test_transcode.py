@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+from utils.executor import DownloadExecutor, download_slot_released
+from utils.transcode import PRESETS, HostSlots, TranscodeError, is_remux, plan
+
+def test_mp4_sources_are_remuxed():
+    container, args = plan({'video_codec': 'h264', 'audio_codec': 'aac', 'audio_bitrate': 128000}, PRESETS['mp4'])
+
+    assert container == 'mp4'
+    assert is_remux(args)
+    assert '+faststart' in args
+
+def test_video_codecs_outside_mp4_fall_back_to_mkv():
+    container, args = plan({'video_codec': 'vp8', 'audio_codec': 'vorbis', 'audio_bitrate': None}, PRESETS['mp4'])
+
+    assert container == 'mkv'
+    assert is_remux(args)
+
+def test_audio_above_the_preset_bitrate_is_reencoded():
+    container, args = plan({'video_codec': None, 'audio_codec': 'mp3', 'audio_bitrate': 320000}, PRESETS['mp3-128'])
+
+    assert container == 'mp3'
+    assert not is_remux(args)
+    assert args[args.index('-b:a') + 1] == '128k'
+
+def test_audio_presets_need_an_audio_stream():
+    with pytest.raises(TranscodeError):
+        plan({'video_codec': 'h264', 'audio_codec': None, 'audio_bitrate': None}, PRESETS['mp3-128'])
+
+def test_host_slots_are_shared_between_instances(tmp_path):
+    # Two instances stand in for two worker processes on one host
+    first, second = HostSlots(tmp_path, 1, poll_interval=0.01), HostSlots(tmp_path, 1, poll_interval=0.01)
+    acquired = threading.Event()
+
+    def take_second():
+        with second.acquire():
+            acquired.set()
+
+    with first.acquire():
+        thread = threading.Thread(target=take_second)
+        thread.start()
+        assert not acquired.wait(0.1)
+    assert acquired.wait(5)
+    thread.join(5)
+
+def test_waiting_job_frees_its_download_slot():
+    executor = DownloadExecutor({'YouTube': 1})
+    waiting, release, done = threading.Event(), threading.Event(), threading.Event()
+
+    def transcoding_job():
+        with download_slot_released():
+            waiting.set()
+            release.wait(5)
+
+    executor.submit('YouTube', transcoding_job)
+    assert waiting.wait(5)
+    assert executor.available('YouTube') == 1
+
+    executor.submit('YouTube', done.set)
+    assert done.wait(5)
+    release.set()
+    executor.shutdown(wait=True)
+    assert executor.available('YouTube') == 1
@@ -0,0 +1,71 @@
+import pytest
+
+from conftest import FakeDB
+
+@pytest.fixture
+def worker(backend):
+    import worker
+    return worker
+
+def pending(download_id, **fields):
+    return {
+        'id': download_id, 'user_id': 'user-1', 'platform': 'YouTube', 'status': 'pending',
+        'url': f"https://www.youtube.com/watch?v={download_id}", 'media_type': 'video', 'quality': '720p',
+        'media_key': None, 'job_weight': None, **fields
+    }
+
+def test_recovers_pending_records_of_this_node(worker, tmp_path, monkeypatch):
+    from utils.job_queue import JobQueue
+    from utils.storage import node_url
+
+    queue = JobQueue(tmp_path / 'jobs.db')
+    monkeypatch.setattr(worker, 'db', FakeDB(download_records=[
+        pending('mine', queue_node=node_url(), media_key='YouTube:mine', job_weight=3),
+        pending('legacy', queue_node=node_url()),
+        pending('other', queue_node='http://other-node:8000'),
+        pending('done', queue_node=node_url(), status='completed'),
+    ]))
+
+    assert worker.recover_orphaned_records(queue) == 2
+    jobs = {job['download_id']: job for job in queue.lease('YouTube', 'w1', limit=5)}
+    assert set(jobs) == {'mine', 'legacy'}
+    assert jobs['mine']['media_key'] == 'YouTube:mine'
+    assert jobs['mine']['weight'] == 3
+    assert jobs['mine']['payload'] == {
+        'url': 'https://www.youtube.com/watch?v=mine', 'media_type': 'video', 'quality': '720p', 'user_id': 'user-1'
+    }
+    assert jobs['legacy']['weight'] == 1
+
+    # Already queued jobs are not enqueued twice
+    assert worker.recover_orphaned_records(queue) == 0
+
+@pytest.fixture
+def draining(worker, tmp_path, monkeypatch):
+    from utils.job_queue import JobQueue
+
+    monkeypatch.setattr(worker.settings, 'WORKER_POLL_INTERVAL', 0.01)
+    queue = JobQueue(tmp_path / 'jobs.db', lease_seconds=60)
+    queue.enqueue('YouTube', 'd1', {'url': 'https://www.youtube.com/watch?v=d1', 'user_id': 'user-1'})
+    draining = worker.Worker(queue, worker_id='w1', shutdown_grace=0.2)
+    job, = queue.lease('YouTube', 'w1')
+    draining._running[job['id']] = job
+    return draining, job
+
+def test_drain_waits_for_running_jobs(draining):
+    import threading
+
+    draining, job = draining
+    threading.Timer(0.05, draining._running.clear).start()
+
+    assert draining._drain() == 0
+
+def test_drain_renews_leases_then_releases_unfinished_jobs(draining, clock):
+    draining, job = draining
+    renewed = []
+    draining.queue.lease_seconds = 0.03  # renewed every 10ms
+    draining.queue.renew = lambda job_ids, worker_id: renewed.append(list(job_ids))
+
+    assert draining._drain() == 1
+    assert renewed and renewed[0] == [job['id']]
+    job, = draining.queue.lease('YouTube', 'w2')
+    assert job['attempts'] == 1
@@ -0,0 +1,100 @@
+import time
+import tarfile
+import zipfile
+from pathlib import Path
+from typing import Iterable, Iterator, Tuple, Union, Callable, BinaryIO
+
+from utils.storage import StoredFile
+
+CHUNK_SIZE = 1024 * 1024
+
+class _StreamBuffer:
+    """Write-only file object that collects zip output until it is drained"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+Source = Union[Path, StoredFile]
+
+def _describe(source: Source) -> Tuple[int, float, Callable[[], BinaryIO]]:
+    """Size, modification time and opener of a local path or a stored file"""
+    if isinstance(source, Path):
+        stat = source.stat()
+        return stat.st_size, stat.st_mtime, lambda: open(source, 'rb')
+    return source.size, source.mtime, source.open
+
+def iter_zip(entries: Iterable[Tuple[Source, str]], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Stream a ZIP archive of (source, name in archive) entries without a temp file.
+
+    Media is already compressed, so entries are stored rather than deflated;
+    memory use stays at roughly one chunk regardless of archive size.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for source, name in entries:
+            size, mtime, opener = _describe(source)
+            info = zipfile.ZipInfo(name, date_time=time.localtime(mtime)[:6])
+            info.external_attr = 0o644 << 16
+            info.file_size = size
+            info.compress_type = zipfile.ZIP_STORED
+            with opener() as reader, archive.open(info, mode='w', force_zip64=True) as target:
+                while True:
+                    chunk = reader.read(chunk_size)
+                    if not chunk:
+                        break
+                    target.write(chunk)
+                    data = buffer.drain()
+                    if data:
+                        yield data
+            data = buffer.drain()
+            if data:
+                yield data
+    data = buffer.drain()
+    if data:
+        yield data
+
+def iter_tar(entries: Iterable[Tuple[Source, str]], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Stream an uncompressed tar archive of (source, name in archive) entries.
+
+    Headers and padding are generated directly so file contents are never
+    buffered beyond a single chunk.
+    """
+    for source, name in entries:
+        size, mtime, opener = _describe(source)
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        yield info.tobuf(format=tarfile.PAX_FORMAT)
+
+        remaining = info.size
+        with opener() as reader:
+            while remaining > 0:
+                chunk = reader.read(min(chunk_size, remaining))
+                if not chunk:
+                    raise OSError(f"{name} shrank while it was being archived")
+                remaining -= len(chunk)
+                yield chunk
+
+        padding = -info.size % tarfile.BLOCKSIZE
+        if padding:
+            yield b'\0' * padding
+    # End-of-archive marker: two zero blocks
+    yield b'\0' * (tarfile.BLOCKSIZE * 2)
+
+ARCHIVE_FORMATS = {
+    'zip': (iter_zip, 'application/zip'),
+    'tar': (iter_tar, 'application/x-tar'),
+}
@@ -1,45 +1,398 @@
 import asyncio
+import fcntl
+import os
+import shutil
+import sqlite3
+import time
 import logging
-from datetime import datetime, timedelta
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from supabase import create_client
+from typing import Optional, Dict, Any, List, Iterator, Tuple
+
 from config import settings
+from utils.db import PostgrestClient
+from utils.storage import create_storage
 
 logger = logging.getLogger(__name__)
 
-async def cleanup_old_downloads():
-    """Clean up old download files and records"""
-    try:
-        supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
-        
-        # Calculate cutoff date
-        cutoff_date = datetime.now() - timedelta(days=settings.CLEANUP_AFTER_DAYS)
-        
-        # Get old download records
-        response = supabase.table('download_records').select('*').lt('created_at', cutoff_date.isoformat()).execute()
-        old_records = response.data
-        
-        cleaned_count = 0
-        for record in old_records:
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage (
+    download_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    first_seen REAL NOT NULL,
+    last_access REAL NOT NULL,
+    scanned_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS usage_lru_idx ON usage (last_access);
+CREATE TABLE IF NOT EXISTS usage_files (
+    download_id TEXT NOT NULL,
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (download_id, dev, ino)
+);
+"""
+
+Inode = Tuple[int, int]
+
+class DownloadCleaner:
+    """Incremental cleanup of the downloads directory.
+
+    Each run pages through expired download records in batches, removes
+    their directories and deletes the rows in bulk. A small SQLite index of
+    per-download disk usage is refreshed from directory mtimes, so only
+    changed directories are re-measured; it is used to sweep directories
+    without a record and to evict least recently served downloads when
+    ``max_bytes`` is exceeded. Usage is tracked per inode, so files
+    hardlinked into several downloads count once. Evicted downloads keep
+    their record, marked ``expired``. A file lock ensures that only one
+    process cleans at a time. With remote ``storage`` (S3) the files of expired
+    records are deleted there as well.
+    """
+
+    def __init__(self, client: Optional[PostgrestClient], downloads_dir: Path, index_path: Path, lock_path: Path,
+                 retention_days: int, batch_size: int = 500, max_batches: int = 20,
+                 max_bytes: int = 0, orphan_grace_seconds: int = 3600, storage=None):
+        self.client = client
+        self.storage = storage
+        self.downloads_dir = Path(downloads_dir)
+        self.index_path = Path(index_path)
+        self.lock_path = Path(lock_path)
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.max_bytes = max_bytes
+        self.orphan_grace_seconds = orphan_grace_seconds
+        self._stats = {'runs': 0, 'expired': 0, 'orphans': 0, 'evicted': 0, 'bytes_freed': 0,
+                       'last_run_at': None, 'last_duration': None}
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.index_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[bool]:
+        """Yield True if this process holds the cleanup lock"""
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, 'w') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
             try:
-                # Delete file if it exists
-                if record['file_path']:
-                    file_path = settings.DOWNLOADS_DIR / record['file_path']
-                    if file_path.exists():
-                        file_path.unlink()
-                        logger.info(f"Deleted file: {file_path}")
-                
-                # Delete database record
-                supabase.table('download_records').delete().eq('id', record['id']).execute()
-                cleaned_count += 1
-                
-            except Exception as e:
-                logger.error(f"Error cleaning up record {record['id']}: {e}")
-        
-        logger.info(f"Cleanup completed. Removed {cleaned_count} old downloads.")
-        
-    except Exception as e:
-        logger.error(f"Cleanup failed: {e}")
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def run_once(self) -> Optional[Dict[str, int]]:
+        """Run one cleanup pass; returns None when another process is already cleaning"""
+        with self._exclusive() as acquired:
+            if not acquired:
+                return None
+
+            started = time.monotonic()
+            result = {'expired': 0, 'orphans': 0, 'evicted': 0, 'bytes_freed': 0}
+            for name, step in (('expired', self.remove_expired), ('orphans', self.sweep_orphans), ('evicted', self.enforce_quota)):
+                try:
+                    count, freed = step()
+                except Exception as e:
+                    logger.error(f"Cleanup step {name} failed: {e}")
+                    continue
+                result[name] += count
+                result['bytes_freed'] += freed
+
+            for key, value in result.items():
+                self._stats[key] += value
+            self._stats['runs'] += 1
+            self._stats['last_run_at'] = time.time()
+            self._stats['last_duration'] = time.monotonic() - started
+            logger.info(
+                f"Cleanup completed: {result['expired']} expired, {result['orphans']} orphaned, "
+                f"{result['evicted']} evicted, {result['bytes_freed'] / 1024 / 1024:.1f} MB freed"
+            )
+            return result
+
+    def _download_dir(self, user_id: str, download_id: str) -> Path:
+        return self.downloads_dir / user_id / download_id
+
+    def _remove(self, user_id: str, download_id: str, file_path: Optional[str] = None) -> int:
+        """Delete a download's files and reclaim empty directories; returns bytes freed"""
+        freed = 0
+        download_dir = self._download_dir(user_id, download_id)
+        targets = [download_dir]
+        if file_path:
+            # Records created before per-download directories may point elsewhere
+            legacy = self.downloads_dir / file_path
+            if download_dir not in legacy.parents and legacy != download_dir:
+                targets.append(legacy)
+
+        for target in targets:
+            if target.is_dir():
+                freed += self._reclaimable(target)
+                shutil.rmtree(target, ignore_errors=True)
+            elif target.exists():
+                freed += target.stat().st_size
+                target.unlink()
+
+        try:
+            download_dir.parent.rmdir()
+        except OSError:
+            pass  # User still has other downloads
+
+        if self.storage is not None and self.storage.remote:
+            freed += self.storage.delete(f"{user_id}/{download_id}")
+        return freed
+
+    def _delete_records(self, ids: List[str]):
+        for start in range(0, len(ids), self.batch_size):
+            self.client.table('download_records').delete().in_('id', ids[start:start + self.batch_size]).execute()
+
+    def _expire_records(self, ids: List[str]):
+        """Mark completed records whose files were evicted, keeping them in the user's history"""
+        for start in range(0, len(ids), self.batch_size):
+            self.client.table('download_records').update({'status': 'expired', 'file_path': None}).in_(
+                'id', ids[start:start + self.batch_size]
+            ).eq('status', 'completed').execute()
+
+    def _forget(self, download_ids: List[str]):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany("DELETE FROM usage WHERE download_id = ?", [(i,) for i in download_ids])
+            conn.executemany("DELETE FROM usage_files WHERE download_id = ?", [(i,) for i in download_ids])
+            conn.execute("COMMIT")
+
+    def remove_expired(self) -> Tuple[int, int]:
+        """Delete records older than the retention period and their files, one page at a time"""
+        if not self.client:
+            return 0, 0
+
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=self.retention_days)).isoformat()
+        removed = freed = 0
+        for _ in range(self.max_batches):
+            # Deleted rows drop out of the range, so the first page is always the next one
+            rows = self.client.table('download_records').select('id,user_id,file_path').lt(
+                'created_at', cutoff
+            ).order('created_at').limit(self.batch_size).execute().data or []
+            if not rows:
+                break
+
+            for row in rows:
+                freed += self._remove(row['user_id'], row['id'], row['file_path'])
+            ids = [row['id'] for row in rows]
+            self._delete_records(ids)
+            self._forget(ids)
+            removed += len(rows)
+            if len(rows) < self.batch_size:
+                break
+        return removed, freed
+
+    @staticmethod
+    def _inodes(path: Path, found: Optional[Dict[Inode, List]] = None) -> Dict[Inode, List]:
+        """Map each (st_dev, st_ino) under a directory to [size, link count, links seen here]"""
+        found = {} if found is None else found
+        for entry in os.scandir(path):
+            if entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                inode = (stat.st_dev, stat.st_ino)
+                if inode in found:
+                    found[inode][2] += 1
+                else:
+                    found[inode] = [stat.st_size, stat.st_nlink, 1]
+            elif entry.is_dir(follow_symlinks=False):
+                DownloadCleaner._inodes(Path(entry.path), found)
+        return found
+
+    @staticmethod
+    def _reclaimable(path: Path) -> int:
+        """Bytes freed by deleting a directory: files with no link outside of it"""
+        return sum(size for size, links, seen in DownloadCleaner._inodes(path).values() if seen >= links)
+
+    def refresh_index(self):
+        """Bring the disk-usage index in line with the downloads directory.
+
+        Only directories whose mtime changed since the last scan are measured again.
+        """
+        now = time.time()
+        with self._connect() as conn:
+            # Downloads indexed before per-inode usage have no files yet and are measured again
+            known = {row['download_id']: row['mtime_ns'] for row in conn.execute(
+                "SELECT download_id, mtime_ns FROM usage WHERE download_id IN (SELECT download_id FROM usage_files)"
+            )}
+            indexed = {row[0] for row in conn.execute("SELECT download_id FROM usage")}
+        seen = set()
+        changed = []
+
+        for user_entry in os.scandir(self.downloads_dir):
+            # Skip the media cache and other hidden directories
+            if user_entry.name.startswith('.') or not user_entry.is_dir(follow_symlinks=False):
+                continue
+            download_entries = list(os.scandir(user_entry.path))
+            if not download_entries:
+                try:
+                    os.rmdir(user_entry.path)
+                except OSError:
+                    pass
+                continue
+            for entry in download_entries:
+                if not entry.is_dir(follow_symlinks=False):
+                    continue
+                mtime_ns = entry.stat(follow_symlinks=False).st_mtime_ns
+                seen.add(entry.name)
+                if known.get(entry.name) != mtime_ns:
+                    changed.append((entry.name, user_entry.name, self._inodes(Path(entry.path)), mtime_ns))
+
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for download_id, user_id, inodes, mtime_ns in changed:
+                size = sum(size for size, _, _ in inodes.values())
+                conn.execute(
+                    "INSERT INTO usage (download_id, user_id, size, mtime_ns, first_seen, last_access, scanned_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(download_id) DO UPDATE SET "
+                    "size = excluded.size, mtime_ns = excluded.mtime_ns, scanned_at = excluded.scanned_at",
+                    (download_id, user_id, size, mtime_ns, now, now, now)
+                )
+                conn.execute("DELETE FROM usage_files WHERE download_id = ?", (download_id,))
+                conn.executemany(
+                    "INSERT INTO usage_files (download_id, dev, ino, size) VALUES (?, ?, ?, ?)",
+                    [(download_id, dev, ino, size) for (dev, ino), (size, _, _) in inodes.items()]
+                )
+            gone = [(i,) for i in indexed - seen]
+            conn.executemany("DELETE FROM usage WHERE download_id = ?", gone)
+            conn.executemany("DELETE FROM usage_files WHERE download_id = ?", gone)
+            conn.execute("COMMIT")
+
+    def sweep_orphans(self) -> Tuple[int, int]:
+        """Remove download directories that have no record, after a grace period"""
+        self.refresh_index()
+        if not self.client:
+            return 0, 0
+
+        cutoff = time.time() - self.orphan_grace_seconds
+        with self._connect() as conn:
+            candidates = conn.execute(
+                "SELECT download_id, user_id FROM usage WHERE first_seen < ? ORDER BY first_seen", (cutoff,)
+            ).fetchall()
+
+        removed = freed = 0
+        for start in range(0, len(candidates), self.batch_size):
+            page = candidates[start:start + self.batch_size]
+            ids = [row['download_id'] for row in page]
+            existing = self.client.table('download_records').select('id').in_('id', ids).execute().data or []
+            existing_ids = {row['id'] for row in existing}
+            orphans = [row for row in page if row['download_id'] not in existing_ids]
+            for row in orphans:
+                freed += self._remove(row['user_id'], row['download_id'])
+                logger.info(f"Removed orphaned download directory {row['user_id']}/{row['download_id']}")
+            self._forget([row['download_id'] for row in orphans])
+            removed += len(orphans)
+        return removed, freed
+
+    def enforce_quota(self) -> Tuple[int, int]:
+        """Evict least recently served downloads while the directory exceeds max_bytes"""
+        if not self.max_bytes:
+            return 0, 0
+
+        with self._connect() as conn:
+            if self._indexed_bytes(conn) <= self.max_bytes:
+                return 0, 0
+            rows = conn.execute("SELECT download_id, user_id FROM usage ORDER BY last_access").fetchall()
+            files = conn.execute("SELECT download_id, dev, ino, size FROM usage_files").fetchall()
+
+        # A hardlinked file is only reclaimed once the last download linking it is gone
+        links: Counter = Counter()
+        sizes: Dict[Inode, int] = {}
+        inodes_of: Dict[str, List[Inode]] = {}
+        for row in files:
+            inode = (row['dev'], row['ino'])
+            links[inode] += 1
+            sizes[inode] = row['size']
+            inodes_of.setdefault(row['download_id'], []).append(inode)
+        total = sum(sizes.values())
+
+        evicted = []
+        freed = 0
+        for row in rows:
+            if total <= self.max_bytes:
+                break
+            freed += self._remove(row['user_id'], row['download_id'])
+            for inode in inodes_of.get(row['download_id'], []):
+                links[inode] -= 1
+                if not links[inode]:
+                    total -= sizes[inode]
+            evicted.append(row['download_id'])
+
+        if self.client and evicted:
+            self._expire_records(evicted)
+        self._forget(evicted)
+        logger.info(f"Evicted {len(evicted)} downloads to stay within the disk quota")
+        return len(evicted), freed
+
+    def touch(self, download_id: str):
+        """Mark a download as recently served for LRU eviction"""
+        with self._connect() as conn:
+            conn.execute("UPDATE usage SET last_access = ? WHERE download_id = ?", (time.time(), download_id))
+
+    @staticmethod
+    def _indexed_bytes(conn) -> int:
+        return conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM usage_files GROUP BY dev, ino)"
+        ).fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM usage").fetchone()[0]
+            size = self._indexed_bytes(conn)
+        return {'downloads': entries, 'size_bytes': size, 'max_bytes': self.max_bytes, **self._stats}
+
+async def run_periodically(cleaner: DownloadCleaner, interval: float):
+    """Run cleanup passes in the background of an asyncio application"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(cleaner.run_once)
+        except Exception as e:
+            logger.error(f"Cleanup failed: {e}")
+
+def create_cleaner(client: Optional[PostgrestClient], storage=None) -> DownloadCleaner:
+    return DownloadCleaner(
+        client,
+        settings.DOWNLOADS_DIR,
+        settings.CLEANUP_INDEX_PATH,
+        settings.CLEANUP_LOCK_PATH,
+        retention_days=settings.CLEANUP_AFTER_DAYS,
+        batch_size=settings.CLEANUP_BATCH_SIZE,
+        max_batches=settings.CLEANUP_MAX_BATCHES,
+        max_bytes=settings.CLEANUP_MAX_DISK_MB * 1024 * 1024,
+        orphan_grace_seconds=settings.CLEANUP_ORPHAN_GRACE_SECONDS,
+        storage=storage
+    )
 
 if __name__ == "__main__":
-    asyncio.run(cleanup_old_downloads())
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO)
+    client = None
+    if settings.SUPABASE_URL and settings.SUPABASE_SERVICE_KEY:
+        client = PostgrestClient(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+    try:
+        cleaner = create_cleaner(client, create_storage())
+        while True:
+            result = cleaner.run_once()
+            # A pass that hit its batch limit leaves more expired records behind
+            if not result or result['expired'] < cleaner.batch_size * cleaner.max_batches:
+                break
+    finally:
+        if client:
+            client.close()
@@ -0,0 +1,189 @@
+import logging
+from typing import Optional, Dict, Any, List, Union
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+class PostgrestError(Exception):
+    """Raised when PostgREST answers with an error status"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+
+class Result:
+    """Rows returned by a query (a dict for maybe_single queries)"""
+
+    def __init__(self, data: Union[List[Dict[str, Any]], Dict[str, Any], None]):
+        self.data = data
+
+def _quote(value: Any) -> str:
+    text = str(value)
+    if any(c in text for c in ',()":'):
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return text
+
+class Query:
+    """Chainable PostgREST request, mirroring the subset of the supabase-py API we use"""
+
+    def __init__(self, client: "_BaseClient", path: str):
+        self._client = client
+        self._path = path
+        self._method = 'GET'
+        self._params: List[tuple] = []
+        self._body: Any = None
+        self._prefer: List[str] = []
+        self._single = False
+
+    def select(self, columns: str = '*') -> "Query":
+        self._method = 'GET'
+        self._params.append(('select', columns))
+        return self
+
+    def insert(self, rows: Union[Dict[str, Any], List[Dict[str, Any]]], ignore_duplicates: bool = False, returning: bool = False) -> "Query":
+        self._method = 'POST'
+        self._body = rows
+        if ignore_duplicates:
+            self._prefer.append('resolution=ignore-duplicates')
+        self._prefer.append('return=representation' if returning else 'return=minimal')
+        return self
+
+    def update(self, values: Dict[str, Any]) -> "Query":
+        self._method = 'PATCH'
+        self._body = values
+        self._prefer.append('return=minimal')
+        return self
+
+    def delete(self) -> "Query":
+        self._method = 'DELETE'
+        self._prefer.append('return=minimal')
+        return self
+
+    def _filter(self, column: str, operator: str, value: Any) -> "Query":
+        self._params.append((column, f"{operator}.{value}"))
+        return self
+
+    def eq(self, column: str, value: Any) -> "Query":
+        return self._filter(column, 'eq', value)
+
+    def neq(self, column: str, value: Any) -> "Query":
+        return self._filter(column, 'neq', value)
+
+    def lt(self, column: str, value: Any) -> "Query":
+        return self._filter(column, 'lt', value)
+
+    def lte(self, column: str, value: Any) -> "Query":
+        return self._filter(column, 'lte', value)
+
+    def gt(self, column: str, value: Any) -> "Query":
+        return self._filter(column, 'gt', value)
+
+    def in_(self, column: str, values: List[Any]) -> "Query":
+        return self._filter(column, 'in', '(' + ','.join(_quote(v) for v in values) + ')')
+
+    def or_(self, expression: str) -> "Query":
+        self._params.append(('or', f"({expression})"))
+        return self
+
+    def order(self, column: str, desc: bool = False) -> "Query":
+        """Sort by a column; repeated calls add tie-breaking columns"""
+        term = f"{column}.{'desc' if desc else 'asc'}"
+        for index, (name, value) in enumerate(self._params):
+            if name == 'order':
+                self._params[index] = ('order', f"{value},{term}")
+                return self
+        self._params.append(('order', term))
+        return self
+
+    def limit(self, count: int) -> "Query":
+        self._params.append(('limit', str(count)))
+        return self
+
+    def offset(self, count: int) -> "Query":
+        self._params.append(('offset', str(count)))
+        return self
+
+    def maybe_single(self) -> "Query":
+        """Return the first row as a dict, or None when nothing matches"""
+        self._single = True
+        return self.limit(1)
+
+    def execute(self, timeout: Optional[float] = None):
+        """Run the request; returns a Result, or an awaitable of one for async clients"""
+        return self._client._execute(self, timeout)
+
+class _BaseClient:
+    def __init__(self, url: str, service_key: str, pool_size: int = 20, timeout: float = 10.0, connect_timeout: float = 5.0):
+        self.base_url = url.rstrip('/') + '/rest/v1'
+        self.headers = {
+            'apikey': service_key,
+            'Authorization': f"Bearer {service_key}",
+            'Content-Type': 'application/json',
+        }
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+
+    def table(self, name: str) -> Query:
+        return Query(self, f"/{name}")
+
+    def rpc(self, function: str, params: Dict[str, Any]) -> Query:
+        query = Query(self, f"/rpc/{function}")
+        query._method = 'POST'
+        query._body = params
+        return query
+
+    def _request_args(self, query: Query, timeout: Optional[float]) -> Dict[str, Any]:
+        headers = {}
+        if query._prefer:
+            headers['Prefer'] = ','.join(query._prefer)
+        args = {
+            'method': query._method,
+            'url': query._path,
+            'params': query._params,
+            'headers': headers,
+            'json': query._body,
+        }
+        if timeout is not None:
+            args['timeout'] = timeout
+        return args
+
+    @staticmethod
+    def _result(query: Query, response: httpx.Response) -> Result:
+        if response.status_code >= 400:
+            try:
+                message = response.json().get('message', response.text)
+            except ValueError:
+                message = response.text
+            raise PostgrestError(response.status_code, message)
+        data = response.json() if response.content else None
+        if query._single:
+            data = data[0] if data else None
+        return Result(data)
+
+class PostgrestClient(_BaseClient):
+    """Blocking client with a keep-alive connection pool, for worker threads"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._http = httpx.Client(base_url=self.base_url, headers=self.headers, limits=self.limits, timeout=self.timeout)
+
+    def _execute(self, query: Query, timeout: Optional[float]) -> Result:
+        return self._result(query, self._http.request(**self._request_args(query, timeout)))
+
+    def close(self):
+        self._http.close()
+
+class AsyncPostgrestClient(_BaseClient):
+    """Non-blocking client with a keep-alive connection pool, for routes and async jobs"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._http = httpx.AsyncClient(base_url=self.base_url, headers=self.headers, limits=self.limits, timeout=self.timeout)
+
+    async def _execute(self, query: Query, timeout: Optional[float]) -> Result:
+        return self._result(query, await self._http.request(**self._request_args(query, timeout)))
+
+    async def aclose(self):
+        await self._http.aclose()
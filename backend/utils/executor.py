@@ -0,0 +1,95 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+# Executor and platform of the job running on the current thread
+_current = threading.local()
+
+@contextmanager
+def download_slot_released():
+    """Hand the calling job's download slot to the next job while it waits on other work.
+
+    Used around CPU-bound steps (transcodes) that run on their own pool, so
+    network downloads keep flowing in the meantime. A no-op outside of a
+    DownloadExecutor thread.
+    """
+    executor = getattr(_current, 'executor', None)
+    if executor is None:
+        yield
+        return
+    with executor._released(_current.platform):
+        yield
+
+class DownloadExecutor:
+    """Bounded per-platform thread pools for blocking download jobs.
+
+    Admission happens in the durable job queue; workers lease only as many
+    jobs as ``available`` reports, so submitted jobs never wait for a thread.
+    A job waiting in ``download_slot_released`` does not count as busy; each
+    pool has one spare thread per slot for the jobs started in its place.
+    """
+
+    def __init__(self, pool_sizes: Dict[str, int]):
+        self.pool_sizes = dict(pool_sizes)
+        self._pools = {
+            platform: ThreadPoolExecutor(max_workers=2 * size, thread_name_prefix=f"{platform.lower()}-dl")
+            for platform, size in self.pool_sizes.items()
+        }
+        self._busy = {platform: 0 for platform in self.pool_sizes}
+        self._parked = {platform: 0 for platform in self.pool_sizes}
+        self._lock = threading.Lock()
+
+    def available(self, platform: str) -> int:
+        """Number of idle workers for the platform"""
+        with self._lock:
+            return max(self.pool_sizes[platform] - self._busy[platform], 0)
+
+    def submit(self, platform: str, fn: Callable, *args):
+        """Run a job on the platform pool"""
+        with self._lock:
+            self._busy[platform] += 1
+        future = self._pools[platform].submit(self._run, platform, fn, *args)
+        future.add_done_callback(self._log_failure)
+
+    def _run(self, platform: str, fn: Callable, *args):
+        _current.executor, _current.platform = self, platform
+        try:
+            return fn(*args)
+        finally:
+            _current.executor = _current.platform = None
+            with self._lock:
+                self._busy[platform] -= 1
+
+    @contextmanager
+    def _released(self, platform: str):
+        with self._lock:
+            # Without a spare thread the replacement job could not start, so keep the slot
+            parked = self._parked[platform] < self.pool_sizes[platform]
+            if parked:
+                self._parked[platform] += 1
+                self._busy[platform] -= 1
+        try:
+            yield
+        finally:
+            if parked:
+                # Taking the slot back may briefly exceed the pool size; available() stays at 0 until it drains
+                with self._lock:
+                    self._parked[platform] -= 1
+                    self._busy[platform] += 1
+
+    @staticmethod
+    def _log_failure(future: Future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            logger.debug(f"Download job finished with error: {error}")
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting jobs and drop anything that has not started yet"""
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait, cancel_futures=True)
@@ -0,0 +1,154 @@
+import os
+import re
+from email.utils import formatdate
+from pathlib import Path
+from typing import Optional, Tuple, Dict, Iterator
+from urllib.parse import quote
+
+import aiofiles
+import httpx
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+CHUNK_SIZE = 1024 * 1024
+RANGE_REGEX = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Marks requests relayed from another API node so they are never relayed again
+FORWARDED_HEADER = 'x-medigrabber-forwarded'
+FORWARDED_REQUEST_HEADERS = ('range', 'if-range', 'if-none-match')
+RELAYED_RESPONSE_HEADERS = (
+    'content-type', 'content-length', 'content-range', 'content-disposition',
+    'etag', 'last-modified', 'accept-ranges'
+)
+
+def make_etag(stat_result: os.stat_result) -> str:
+    """Strong ETag derived from file size and modification time"""
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+def content_disposition(filename: str) -> str:
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` range into inclusive offsets; None if unsatisfiable.
+
+    Raises ValueError for headers we do not handle (multiple ranges), in
+    which case the caller serves the whole file.
+    """
+    match = RANGE_REGEX.match(header.strip())
+    if not match:
+        raise ValueError("Unsupported range")
+    start, end = match.groups()
+    if not start and not end:
+        raise ValueError("Unsupported range")
+    if not start:
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            return None
+        return max(size - length, 0), size - 1
+    first = int(start)
+    last = int(end) if end else size - 1
+    if first >= size or last < first:
+        return None
+    return first, min(last, size - 1)
+
+async def _iter_file(path: Path, start: int, length: int):
+    async with aiofiles.open(path, 'rb') as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def accel_redirect_response(relative_path: str, filename: str, prefix: str) -> Response:
+    """Let nginx serve the file from an internal location after we authorized it"""
+    return Response(
+        status_code=200,
+        media_type='application/octet-stream',
+        headers={
+            'X-Accel-Redirect': prefix.rstrip('/') + '/' + quote(relative_path),
+            'Content-Disposition': content_disposition(filename),
+        }
+    )
+
+def ranged_file_response(request: Request, path: Path, filename: str) -> Response:
+    """Serve a file with ETag/If-None-Match and single-range Range support"""
+    stat_result = path.stat()
+    size = stat_result.st_size
+    etag = make_etag(stat_result)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': formatdate(stat_result.st_mtime, usegmt=True),
+        'Accept-Ranges': 'bytes',
+    }
+
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(',')]
+        if etag in tags or '*' in tags:
+            return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    if range_header and (not if_range or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            byte_range = (0, size - 1) if size else None
+        else:
+            if byte_range is None:
+                return Response(status_code=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+
+        if byte_range and byte_range != (0, size - 1):
+            start, end = byte_range
+            length = end - start + 1
+            return StreamingResponse(
+                _iter_file(path, start, length),
+                status_code=206,
+                media_type='application/octet-stream',
+                headers={
+                    **headers,
+                    'Content-Range': f'bytes {start}-{end}/{size}',
+                    'Content-Length': str(length),
+                    'Content-Disposition': content_disposition(filename),
+                }
+            )
+
+    return FileResponse(
+        path=str(path),
+        filename=filename,
+        media_type='application/octet-stream',
+        headers=headers,
+        stat_result=stat_result
+    )
+
+def object_response(status: int, headers: Dict[str, str], body: Iterator[bytes], filename: str) -> StreamingResponse:
+    """Stream an object fetched from object storage through the API"""
+    return StreamingResponse(
+        body,
+        status_code=status,
+        media_type='application/octet-stream',
+        headers={**headers, 'Content-Disposition': content_disposition(filename)}
+    )
+
+async def proxied_response(client: httpx.AsyncClient, url: str, request: Request, params: Dict[str, str]) -> Response:
+    """Relay a file response from the API node that holds the file, keeping Range/ETag semantics"""
+    headers = {FORWARDED_HEADER: '1'}
+    for name in FORWARDED_REQUEST_HEADERS:
+        value = request.headers.get(name)
+        if value:
+            headers[name] = value
+    upstream = await client.send(client.build_request('GET', url, params=params, headers=headers), stream=True)
+    return StreamingResponse(
+        upstream.aiter_raw(),
+        status_code=upstream.status_code,
+        headers={name: value for name, value in upstream.headers.items() if name.lower() in RELAYED_RESPONSE_HEADERS},
+        background=BackgroundTask(upstream.aclose)
+    )
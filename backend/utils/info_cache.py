@@ -0,0 +1,103 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS info (
+    key TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS info_expiry_idx ON info (expires_at);
+"""
+
+class InfoCache:
+    """TTL cache of extracted media metadata (yt-dlp info dicts, Instagram post nodes).
+
+    A small in-memory LRU sits in front of a SQLite table shared by the API
+    and worker processes, so an info lookup from the API warms the cache for
+    the download job that follows. Hit/miss counters are per process.
+
+    Entries are kept serialized and every ``get`` returns a fresh copy, since
+    yt-dlp fills in an info dict while processing it and concurrent jobs
+    must not share one.
+    """
+
+    def __init__(self, path: Path, ttl_seconds: int, memory_entries: int = 256):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def _remember(self, key: str, data: str, expires_at: float):
+        with self._lock:
+            self._memory[key] = (data, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return cached metadata for a key if it has not expired"""
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached and cached[1] > now:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return json.loads(cached[0])
+
+        with self._connect() as conn:
+            row = conn.execute("SELECT data, expires_at FROM info WHERE key = ? AND expires_at > ?", (key, now)).fetchone()
+        if row is None:
+            with self._lock:
+                self._memory.pop(key, None)
+                self.misses += 1
+            return None
+
+        self._remember(key, row[0], row[1])
+        with self._lock:
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, data: Dict[str, Any]):
+        """Store metadata for a key for the configured TTL"""
+        expires_at = time.time() + self.ttl_seconds
+        serialized = json.dumps(data)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO info (key, data, expires_at) VALUES (?, ?, ?)",
+                (key, serialized, expires_at)
+            )
+            conn.execute("DELETE FROM info WHERE expires_at <= ?", (time.time(),))
+        self._remember(key, serialized, expires_at)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for this process"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'memory_entries': len(self._memory),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,280 @@
+import os
+import fcntl
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple, Iterator
+
+from utils.lazy import lazy_import
+
+instaloader = lazy_import('instaloader')
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS budgets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    refilled_at REAL NOT NULL,
+    blocked_until REAL NOT NULL DEFAULT 0,
+    backoff REAL NOT NULL DEFAULT 0,
+    last_used REAL NOT NULL DEFAULT 0
+);
+"""
+
+class SessionUnavailableError(Exception):
+    """Raised when no Instagram session frees up within the checkout timeout"""
+
+class SessionRateLimitedError(Exception):
+    """Raised instead of sleeping when Instagram answers a session with 429"""
+
+def _fail_fast_rate_controller(context: "instaloader.InstaloaderContext") -> "instaloader.RateController":
+    """Keeps Instaloader's query pacing but hands 429s to the pool rather than sleeping for minutes"""
+
+    class FailFastRateController(instaloader.RateController):
+        def handle_429(self, query_type: str) -> None:
+            raise SessionRateLimitedError(f"Instagram rate limited {self._context.username or 'anonymous'} session")
+
+    return FailFastRateController(context)
+
+class InstagramSession:
+    """One long-lived Instaloader; its rate budget and backoff live in the shared budget table"""
+
+    def __init__(self, name: str, username: Optional[str] = None, password: Optional[str] = None):
+        self.name = name
+        self.username = username
+        self.password = password
+        self.loader: Optional["instaloader.Instaloader"] = None
+        self.logged_in = False
+        self.loaded_mtime_ns: Optional[int] = None
+        self.disabled = False
+        self.busy = False
+
+class InstagramSessionPool:
+    """Reusable Instaloader contexts shared by the download jobs of a process.
+
+    Logged-in sessions are created for ``accounts`` and persisted under
+    ``session_dir``, so a restart reuses the login instead of repeating it;
+    ``anonymous`` extra contexts serve posts and reels without spending an
+    account's budget. A job checks out an idle session, preferring the least
+    recently used one to rotate across accounts. Each session may start
+    ``jobs_per_minute`` jobs, and a 429 takes it out of rotation for a
+    backoff that doubles up to ``max_backoff`` seconds while 429s repeat.
+
+    Budgets and backoffs are kept in a SQLite table under ``session_dir``,
+    so every API and worker process on the host spends from the same
+    account budget, and logins and session files are guarded by a file
+    lock per account so only one process logs in.
+    """
+
+    def __init__(self, accounts: List[Tuple[str, str]], session_dir: Path, anonymous: int = 1,
+                 jobs_per_minute: float = 20, backoff_seconds: float = 300, max_backoff: float = 3600,
+                 loader_options: Optional[Dict[str, Any]] = None):
+        self.session_dir = Path(session_dir)
+        self.jobs_per_minute = jobs_per_minute
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff = max_backoff
+        self.loader_options = loader_options or {}
+        self._sessions = [InstagramSession(username, username, password) for username, password in accounts]
+        self._sessions += [InstagramSession(f"anonymous-{index}") for index in range(anonymous)]
+        self._cond = threading.Condition()
+        self._stats = {'checkouts': 0, 'logins': 0, 'rate_limited': 0, 'timeouts': 0}
+        self.session_dir.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            conn.executemany(
+                "INSERT OR IGNORE INTO budgets (name, tokens, refilled_at) VALUES (?, ?, ?)",
+                [(session.name, jobs_per_minute, time.time()) for session in self._sessions]
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.session_dir / 'budgets.db'), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def has_login(self) -> bool:
+        """Whether any account can serve jobs that need authentication (stories)"""
+        return any(s.username and not s.disabled for s in self._sessions)
+
+    def _pick(self, login_required: bool, now: float) -> Tuple[Optional[InstagramSession], float]:
+        """Take a token from an available session, or return None and the seconds until one could be"""
+        idle = {
+            session.name: session for session in self._sessions
+            if not (session.disabled or session.busy or (login_required and not session.username))
+        }
+        if not idle:
+            return None, float('inf')
+
+        rate = self.jobs_per_minute / 60
+        candidates = []
+        wait = float('inf')
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                placeholders = ','.join('?' * len(idle))
+                for row in conn.execute(f"SELECT * FROM budgets WHERE name IN ({placeholders})", list(idle)):
+                    tokens = min(self.jobs_per_minute, row['tokens'] + max(0.0, now - row['refilled_at']) * rate)
+                    if row['blocked_until'] > now:
+                        wait = min(wait, row['blocked_until'] - now)
+                    elif tokens < 1 and self.jobs_per_minute > 0:
+                        wait = min(wait, (1 - tokens) * 60 / self.jobs_per_minute)
+                    else:
+                        candidates.append((idle[row['name']], tokens, row['last_used']))
+                if not candidates:
+                    return None, wait
+                # Anonymous sessions first for public media, then the least recently used account
+                session, tokens, _ = min(candidates, key=lambda c: (login_required or c[0].username is not None, c[2]))
+                conn.execute(
+                    "UPDATE budgets SET tokens = ?, refilled_at = ?, last_used = ? WHERE name = ?",
+                    (tokens - 1, now, now, session.name)
+                )
+            finally:
+                conn.execute("COMMIT")
+        return session, 0.0
+
+    def _record_outcome(self, session: InstagramSession, rate_limited: bool) -> float:
+        """Start or double the session's backoff after a 429, or clear it after a success"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            backoff = conn.execute("SELECT backoff FROM budgets WHERE name = ?", (session.name,)).fetchone()[0]
+            if rate_limited:
+                backoff = min(self.max_backoff, backoff * 2 or self.backoff_seconds)
+                conn.execute(
+                    "UPDATE budgets SET backoff = ?, blocked_until = ? WHERE name = ?",
+                    (backoff, time.time() + backoff, session.name)
+                )
+            elif backoff:
+                backoff = 0.0
+                conn.execute("UPDATE budgets SET backoff = 0 WHERE name = ?", (session.name,))
+            conn.execute("COMMIT")
+        return backoff
+
+    @contextmanager
+    def checkout(self, login_required: bool = False, timeout: float = 30) -> Iterator["instaloader.Instaloader"]:
+        """Borrow an Instaloader for the duration of a job"""
+        from instaloader.exceptions import LoginRequiredException
+
+        # Budgets are shared with other processes (wall clock), which do not notify this one
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                now = time.time()
+                session, wait = self._pick(login_required, now)
+                if session is not None:
+                    break
+                if now >= deadline:
+                    self._stats['timeouts'] += 1
+                    raise SessionUnavailableError("No Instagram session available, all are busy or rate limited")
+                self._cond.wait(min(wait, deadline - now))
+            session.busy = True
+            self._stats['checkouts'] += 1
+
+        try:
+            yield self._prepare(session)
+        except SessionRateLimitedError:
+            backoff = self._record_outcome(session, rate_limited=True)
+            with self._cond:
+                self._stats['rate_limited'] += 1
+            logger.warning(f"Instagram session {session.username or 'anonymous'} rate limited, backing off {backoff:.0f}s")
+            raise
+        except LoginRequiredException:
+            # The persisted login expired; log in again on the next checkout
+            session.logged_in = False
+            self._discard_session_file(session)
+            raise
+        else:
+            self._record_outcome(session, rate_limited=False)
+        finally:
+            with self._cond:
+                session.busy = False
+                self._cond.notify_all()
+
+    def _session_file(self, session: InstagramSession) -> Path:
+        return self.session_dir / f"session-{session.username}"
+
+    @contextmanager
+    def _account_lock(self, session: InstagramSession):
+        """Serialize logins and session file changes of an account across processes"""
+        with open(self.session_dir / f"session-{session.username}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _discard_session_file(self, session: InstagramSession):
+        session_file = self._session_file(session)
+        with self._account_lock(session):
+            try:
+                # Another process may already have replaced the expired login with a fresh one
+                if session_file.stat().st_mtime_ns == session.loaded_mtime_ns:
+                    session_file.unlink()
+            except FileNotFoundError:
+                pass
+
+    def _prepare(self, session: InstagramSession) -> "instaloader.Instaloader":
+        """Create the session's Instaloader on first use and make sure it is logged in"""
+        if session.loader is None:
+            session.loader = instaloader.Instaloader(
+                **self.loader_options, rate_controller=_fail_fast_rate_controller
+            )
+        if session.username and not session.logged_in:
+            self._login(session)
+        return session.loader
+
+    def _login(self, session: InstagramSession):
+        from instaloader.exceptions import BadCredentialsException, TwoFactorAuthRequiredException
+
+        session_file = self._session_file(session)
+        # Another process may be logging in to the same account; wait and reuse its session file
+        with self._account_lock(session):
+            if session_file.exists():
+                try:
+                    mtime_ns = session_file.stat().st_mtime_ns
+                    session.loader.load_session_from_file(session.username, str(session_file))
+                    session.loaded_mtime_ns = mtime_ns
+                    session.logged_in = True
+                    return
+                except Exception as e:
+                    logger.warning(f"Discarding unreadable Instagram session of {session.username}: {e}")
+
+            try:
+                session.loader.login(session.username, session.password)
+            except (BadCredentialsException, TwoFactorAuthRequiredException) as e:
+                # Retrying cannot fix these; keep the account out of rotation
+                session.disabled = True
+                logger.error(f"Instagram login of {session.username} failed, disabling the account: {e}")
+                raise
+            # Write next to the file and swap it in, so readers never see a partial session
+            partial = session_file.with_name(f"{session_file.name}.{os.getpid()}.tmp")
+            session.loader.save_session_to_file(str(partial))
+            os.replace(partial, session_file)
+            session.loaded_mtime_ns = session_file.stat().st_mtime_ns
+            session.logged_in = True
+        with self._cond:
+            self._stats['logins'] += 1
+        logger.info(f"Logged in to Instagram as {session.username}")
+
+    def stats(self) -> Dict[str, Any]:
+        names = [session.name for session in self._sessions]
+        with self._connect() as conn:
+            backing_off = conn.execute(
+                f"SELECT COUNT(*) FROM budgets WHERE blocked_until > ? AND name IN ({','.join('?' * len(names))})",
+                [time.time(), *names]
+            ).fetchone()[0] if names else 0
+        with self._cond:
+            return {
+                'sessions': len(self._sessions),
+                'accounts': sum(1 for s in self._sessions if s.username and not s.disabled),
+                'busy': sum(1 for s in self._sessions if s.busy),
+                'backing_off': backing_off,
+                **self._stats
+            }
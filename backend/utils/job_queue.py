@@ -0,0 +1,317 @@
+import json
+import sqlite3
+import time
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Iterable
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    download_id TEXT NOT NULL UNIQUE,
+    platform TEXT NOT NULL,
+    user_id TEXT,
+    payload TEXT NOT NULL,
+    media_key TEXT,
+    leader_id INTEGER,
+    weight REAL NOT NULL DEFAULT 1,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,
+    lease_until REAL,
+    worker_id TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_pick_idx ON jobs (platform, status, available_at);
+CREATE INDEX IF NOT EXISTS jobs_media_key_idx ON jobs (media_key, status);
+CREATE INDEX IF NOT EXISTS jobs_leader_idx ON jobs (leader_id);
+CREATE INDEX IF NOT EXISTS jobs_user_idx ON jobs (user_id, status);
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    heartbeat_at REAL NOT NULL
+);
+"""
+
+# Columns added after the initial schema, applied to existing queue files on open
+MIGRATIONS = {
+    'media_key': "ALTER TABLE jobs ADD COLUMN media_key TEXT",
+    'leader_id': "ALTER TABLE jobs ADD COLUMN leader_id INTEGER",
+    'user_id': "ALTER TABLE jobs ADD COLUMN user_id TEXT",
+    'weight': "ALTER TABLE jobs ADD COLUMN weight REAL NOT NULL DEFAULT 1",
+}
+
+class JobQueue:
+    """Durable SQLite-backed download queue shared by the API and worker processes.
+
+    Jobs move queued -> leased -> done/failed. A lease that is not renewed
+    before ``lease_until`` makes the job eligible again, so a crashed worker
+    never strands a download.
+
+    Jobs enqueued with the same ``media_key`` as a job that is still queued
+    or running are attached to it as followers instead of being scheduled,
+    so concurrent requests for identical media share a single download.
+
+    Runnable jobs are handed out by fair share rather than FIFO: each user's
+    next job is scored by the user's running jobs divided by the job's
+    ``weight`` (higher for paid plans), minus a credit that grows with the
+    time it has waited (one point per ``aging_seconds``), so heavy users
+    interleave with everyone else and no job waits forever. At most
+    ``per_user_limit`` jobs of one user run at a time, so a large batch
+    cannot occupy every worker.
+    """
+
+    def __init__(self, path: Path, lease_seconds: int = 300, max_attempts: int = 3, retry_backoff: float = 30.0,
+                 per_user_limit: int = 0, aging_seconds: float = 60.0):
+        self.path = Path(path)
+        self.per_user_limit = per_user_limit
+        self.aging_seconds = aging_seconds
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if columns:
+                for column, statement in MIGRATIONS.items():
+                    if column not in columns:
+                        conn.execute(statement)
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _to_job(row: sqlite3.Row) -> Dict[str, Any]:
+        job = dict(row)
+        job['payload'] = json.loads(job['payload'])
+        return job
+
+    def _insert(self, conn: sqlite3.Connection, platform: str, download_id: str, payload: Dict[str, Any],
+                media_key: Optional[str] = None, weight: float = 1, *, now: float) -> bool:
+        leader = None
+        if media_key:
+            leader = conn.execute(
+                "SELECT id FROM jobs WHERE media_key = ? AND leader_id IS NULL AND status IN ('queued', 'leased') "
+                "ORDER BY id LIMIT 1",
+                (media_key,)
+            ).fetchone()
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO jobs (download_id, platform, user_id, payload, media_key, leader_id, weight, status, "
+            "available_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                download_id, platform, payload.get('user_id'), json.dumps(payload), media_key,
+                leader['id'] if leader else None, weight, 'attached' if leader else 'queued',
+                now, now, now
+            )
+        )
+        if cursor.rowcount == 1 and leader:
+            logger.info(f"Download {download_id} attached to in-flight job {leader['id']}")
+        return cursor.rowcount == 1
+
+    def enqueue(self, platform: str, download_id: str, payload: Dict[str, Any], media_key: Optional[str] = None,
+                weight: float = 1) -> bool:
+        """Add a job for a download record; returns False if it is already queued"""
+        with self._transaction() as conn:
+            return self._insert(conn, platform, download_id, payload, media_key, weight, now=time.time())
+
+    def enqueue_many(self, jobs: Iterable[tuple]) -> int:
+        """Add (platform, download_id, payload, media_key[, weight]) jobs in one transaction"""
+        now = time.time()
+        with self._transaction() as conn:
+            return sum(self._insert(conn, *job, now=now) for job in jobs)
+
+    def lease(self, platform: str, worker_id: str, limit: int = 1) -> List[Dict[str, Any]]:
+        """Claim up to ``limit`` runnable jobs for a platform"""
+        if limit <= 0:
+            return []
+        now = time.time()
+        with self._transaction() as conn:
+            running: Dict[str, int] = {
+                row['user_id']: row['n'] for row in conn.execute(
+                    "SELECT user_id, COUNT(*) AS n FROM jobs WHERE status = 'leased' AND lease_until >= ? GROUP BY user_id",
+                    (now,)
+                )
+            }
+            # The oldest few runnable jobs of every user
+            candidates = conn.execute(
+                "SELECT * FROM ("
+                "SELECT *, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY available_at, id) AS position FROM jobs "
+                "WHERE platform = ? AND ((status = 'queued' AND available_at <= ?) OR (status = 'leased' AND lease_until < ?))"
+                ") WHERE position <= ? ORDER BY available_at, id",
+                (platform, now, now, limit)
+            ).fetchall()
+
+            queues: Dict[str, List[sqlite3.Row]] = {}
+            for row in candidates:
+                queues.setdefault(row['user_id'], []).append(row)
+
+            def score(row: sqlite3.Row) -> float:
+                waited = max(0.0, now - row['available_at'])
+                return (running.get(row['user_id'], 0) + 1) / row['weight'] - waited / self.aging_seconds
+
+            rows = []
+            while queues and len(rows) < limit:
+                row = min((queue[0] for queue in queues.values()), key=score)
+                user_id = row['user_id']
+                queue = queues[user_id]
+                queue.pop(0)
+                if not queue:
+                    del queues[user_id]
+                if self.per_user_limit and running.get(user_id, 0) >= self.per_user_limit:
+                    queues.pop(user_id, None)
+                    continue
+                running[user_id] = running.get(user_id, 0) + 1
+                rows.append(row)
+
+            jobs = []
+            for row in rows:
+                if row['status'] == 'leased':
+                    logger.warning(f"Reclaiming expired lease on job {row['id']} from {row['worker_id']}")
+                conn.execute(
+                    "UPDATE jobs SET status = 'leased', worker_id = ?, lease_until = ?, attempts = attempts + 1, updated_at = ? "
+                    "WHERE id = ?",
+                    (worker_id, now + self.lease_seconds, now, row['id'])
+                )
+                job = self._to_job(row)
+                job.pop('position', None)
+                job['attempts'] += 1
+                jobs.append(job)
+            return jobs
+
+    def renew(self, job_ids: Iterable[int], worker_id: str):
+        """Extend the leases a worker still holds"""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return
+        now = time.time()
+        placeholders = ','.join('?' * len(job_ids))
+        with self._transaction() as conn:
+            conn.execute(
+                f"UPDATE jobs SET lease_until = ?, updated_at = ? "
+                f"WHERE worker_id = ? AND status = 'leased' AND id IN ({placeholders})",
+                (now + self.lease_seconds, now, worker_id, *job_ids)
+            )
+
+    def release(self, job_ids: Iterable[int], worker_id: str) -> int:
+        """Hand leased jobs back to the queue without counting the interrupted attempt"""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return 0
+        now = time.time()
+        placeholders = ','.join('?' * len(job_ids))
+        with self._transaction() as conn:
+            return conn.execute(
+                f"UPDATE jobs SET status = 'queued', available_at = ?, lease_until = NULL, worker_id = NULL, "
+                f"attempts = MAX(attempts - 1, 0), updated_at = ? "
+                f"WHERE worker_id = ? AND status = 'leased' AND id IN ({placeholders})",
+                (now, now, worker_id, *job_ids)
+            ).rowcount
+
+    def followers(self, job_id: int) -> List[Dict[str, Any]]:
+        """Jobs attached to a leader job"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM jobs WHERE leader_id = ? ORDER BY id", (job_id,)).fetchall()
+        return [self._to_job(row) for row in rows]
+
+    def complete(self, job_id: int) -> List[Dict[str, Any]]:
+        """Mark a job and its followers as finished, returning the followers it closed"""
+        now = time.time()
+        with self._transaction() as conn:
+            # Read and close the followers atomically, so a job attaching meanwhile is either returned or not attached
+            rows = conn.execute("SELECT * FROM jobs WHERE leader_id = ? ORDER BY id", (job_id,)).fetchall()
+            conn.execute(
+                "UPDATE jobs SET status = 'done', lease_until = NULL, updated_at = ? WHERE id = ? OR leader_id = ?",
+                (now, job_id, job_id)
+            )
+        return [self._to_job(row) for row in rows]
+
+    def fail(self, job_id: int, error: str, retry: bool = True) -> bool:
+        """Record a failed attempt; returns True if the job was rescheduled"""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return False
+            attempts = row['attempts']
+            if retry and attempts < self.max_attempts:
+                delay = self.retry_backoff * (2 ** (attempts - 1))
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', available_at = ?, lease_until = NULL, worker_id = NULL, "
+                    "last_error = ?, updated_at = ? WHERE id = ?",
+                    (now + delay, error, now, job_id)
+                )
+                return True
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', lease_until = NULL, last_error = ?, updated_at = ? "
+                "WHERE id = ? OR leader_id = ?",
+                (error, now, job_id, job_id)
+            )
+            return False
+
+    def depth(self, platform: Optional[str] = None) -> int:
+        """Number of jobs waiting for a worker"""
+        query = "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+        params: tuple = ()
+        if platform:
+            query += " AND platform = ?"
+            params = (platform,)
+        with self._connect() as conn:
+            return conn.execute(query, params).fetchone()[0]
+
+    def heartbeat(self, worker_id: str):
+        """Record that a worker is alive and polling"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO workers (worker_id, heartbeat_at) VALUES (?, ?)", (worker_id, time.time())
+            )
+
+    def deregister(self, worker_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+    def live_workers(self, max_age: float) -> int:
+        """Workers that sent a heartbeat within ``max_age`` seconds"""
+        with self._connect() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM workers WHERE heartbeat_at >= ?", (time.time() - max_age,)
+            ).fetchone()[0]
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Job counts per platform and status"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT platform, status, COUNT(*) AS n FROM jobs GROUP BY platform, status").fetchall()
+        result: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            result.setdefault(row['platform'], {})[row['status']] = row['n']
+        return result
+
+    def prune(self, older_than_seconds: float):
+        """Drop finished jobs older than the given age"""
+        cutoff = time.time() - older_than_seconds
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (cutoff,))
+            conn.execute("DELETE FROM workers WHERE heartbeat_at < ?", (cutoff,))
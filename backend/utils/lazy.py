@@ -0,0 +1,27 @@
+import sys
+import importlib
+import importlib.util
+from types import ModuleType
+from typing import Any
+
+class _LazyModule(ModuleType):
+    """Stand-in that imports the real module when one of its attributes is first used.
+
+    The import goes through the regular import system, whose per-module lock
+    makes concurrent first uses from several threads wait for one import.
+    """
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(importlib.import_module(self.__name__), attr)
+
+def lazy_import(name: str) -> ModuleType:
+    """Module that is only executed when one of its attributes is first used.
+
+    yt-dlp and instaloader take long to import and hold many megabytes of
+    extractors; API processes that never download should not pay for them.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    if importlib.util.find_spec(name) is None:
+        raise ImportError(f"No module named {name!r}")
+    return _LazyModule(name)
@@ -0,0 +1,207 @@
+import os
+import fcntl
+import shutil
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, Iterator
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    platform TEXT NOT NULL,
+    media_id TEXT NOT NULL,
+    variant TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_lru_idx ON entries (last_access);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+class MediaCache:
+    """Shared on-disk cache of downloaded media keyed by platform, media ID and format.
+
+    Entries live under ``root/<key[:2]>/<key>/`` and are put into download
+    storage on a hit (as hardlinks on local disk), so a cache hit costs no
+    transfer from the platform.
+    The SQLite index tracks sizes and access times for LRU eviction and is
+    shared by every worker process.
+
+    Interrupted downloads can be kept under ``root/.partial/<key>/`` so the
+    next attempt at the same key resumes from the partial files; those not
+    touched for ``partial_max_age`` seconds are discarded.
+    """
+
+    def __init__(self, root: Path, max_bytes: int, partial_max_age: float = 86400):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.partial_max_age = partial_max_age
+        self.root.mkdir(parents=True, exist_ok=True)
+        (self.root / '.staging').mkdir(exist_ok=True)
+        (self.root / '.partial').mkdir(exist_ok=True)
+        self.index_path = self.root / 'index.db'
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.index_path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(platform: str, media_id: str, variant: str) -> str:
+        """Content key for a platform media ID downloaded with a given format"""
+        return hashlib.sha256(f"{platform}\0{media_id}\0{variant}".encode()).hexdigest()
+
+    def entry_dir(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def _count(self, conn: sqlite3.Connection, name: str, amount: int = 1):
+        conn.execute(
+            "INSERT INTO counters (name, value) VALUES (?, ?) "
+            "ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """Return the entry directory for a key, or None on a miss"""
+        entry = self.entry_dir(key)
+        with self._connect() as conn:
+            row = conn.execute("SELECT key FROM entries WHERE key = ?", (key,)).fetchone()
+            if row and entry.is_dir() and any(entry.iterdir()):
+                conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+                self._count(conn, 'hits')
+                return entry
+            if row:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self._count(conn, 'misses')
+            return None
+
+    def staging_dir(self, key: str) -> Path:
+        """Fresh private directory to download a new entry into"""
+        return Path(tempfile.mkdtemp(prefix=f"{key[:16]}-", dir=self.root / '.staging'))
+
+    @contextmanager
+    def partial_dir(self, key: str) -> Iterator[Path]:
+        """Directory to download an entry into that survives failed attempts.
+
+        The directory is locked while in use; if another worker is already
+        downloading the same key, a fresh staging directory is used instead.
+        It is removed only by store() or once it goes stale, so a retry picks
+        up the partial files of the previous attempt.
+        """
+        partial = self.root / '.partial' / key
+        fd = None
+        try:
+            partial.mkdir(exist_ok=True)
+            fd = os.open(partial, os.O_RDONLY)
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            if fd is not None:
+                os.close(fd)
+            staging = self.staging_dir(key)
+            try:
+                yield staging
+            finally:
+                shutil.rmtree(staging, ignore_errors=True)
+            return
+        try:
+            if any(partial.iterdir()):
+                logger.info(f"Resuming partial download {key}")
+            os.utime(partial)
+            yield partial
+        finally:
+            os.close(fd)
+
+    def prune_partials(self):
+        """Remove partial downloads that no attempt has touched for partial_max_age"""
+        cutoff = time.time() - self.partial_max_age
+        for partial in (self.root / '.partial').iterdir():
+            try:
+                if partial.stat().st_mtime >= cutoff:
+                    continue
+                fd = os.open(partial, os.O_RDONLY)
+            except OSError:
+                continue
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                shutil.rmtree(partial, ignore_errors=True)
+                logger.info(f"Removed stale partial download {partial.name}")
+            except BlockingIOError:
+                pass
+            finally:
+                os.close(fd)
+
+    def store(self, key: str, platform: str, media_id: str, variant: str, staging: Path) -> Path:
+        """Move a finished staging directory into the cache and index it"""
+        entry = self.entry_dir(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            # Another worker stored the same media first; keep theirs
+            shutil.rmtree(staging, ignore_errors=True)
+
+        size = sum(f.stat().st_size for f in entry.iterdir() if f.is_file())
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries (key, platform, media_id, variant, size, created_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, platform, media_id, variant, size, now, now)
+            )
+            self._count(conn, 'bytes_stored', size)
+
+        self.evict(keep=key)
+        return entry
+
+    def evict(self, keep: Optional[str] = None):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        self.prune_partials()
+        with self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for row in conn.execute("SELECT key, size FROM entries ORDER BY last_access").fetchall():
+                if total <= self.max_bytes:
+                    break
+                if row['key'] == keep:
+                    continue
+                shutil.rmtree(self.entry_dir(row['key']), ignore_errors=True)
+                conn.execute("DELETE FROM entries WHERE key = ?", (row['key'],))
+                self._count(conn, 'evictions')
+                total -= row['size']
+                logger.info(f"Evicted media cache entry {row['key']}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current cache size"""
+        with self._connect() as conn:
+            counters = {row['name']: row['value'] for row in conn.execute("SELECT name, value FROM counters")}
+            entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        hits = counters.get('hits', 0)
+        misses = counters.get('misses', 0)
+        return {
+            'entries': entries,
+            'size_bytes': size,
+            'max_bytes': self.max_bytes,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+            'evictions': counters.get('evictions', 0),
+        }
@@ -0,0 +1,141 @@
+import os
+import time
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterable, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+logger = logging.getLogger(__name__)
+
+# Download stages run from seconds to many minutes
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+STAGE_SECONDS = Histogram(
+    'medigrabber_stage_seconds', 'Time spent in each stage of a download job',
+    ['platform', 'stage'], buckets=STAGE_BUCKETS
+)
+JOB_SECONDS = Histogram(
+    'medigrabber_job_seconds', 'Total run time of download jobs by outcome',
+    ['platform', 'outcome'], buckets=STAGE_BUCKETS
+)
+DB_WRITE_SECONDS = Histogram(
+    'medigrabber_db_write_seconds', 'Duration of bulk download_records writes', ['operation']
+)
+FILE_SERVE_SECONDS = Histogram(
+    'medigrabber_file_serve_seconds', 'Time to authorize and start a file response', ['mode']
+)
+BYTES_DOWNLOADED = Counter('medigrabber_downloaded_bytes', 'Bytes fetched from media platforms', ['platform'])
+BYTES_SERVED = Counter('medigrabber_served_bytes', 'Bytes of finished downloads sent to users', ['mode'])
+EVENT_LOOP_LAG = Histogram(
+    'medigrabber_event_loop_lag_seconds', 'Delay of event loop callbacks in the API process',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+
+@contextmanager
+def stage_timer(platform: str, stage: str):
+    """Record the duration of a block as a download stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(platform, stage).observe(time.perf_counter() - started)
+
+class YtdlpStageTimer:
+    """Splits a yt-dlp run into download and post-processing (ffmpeg merge/convert) time"""
+
+    def __init__(self, platform: str):
+        self.platform = platform
+        self.postprocess_seconds = 0.0
+        self._pp_started: Dict[str, float] = {}
+
+    def postprocessor_hook(self, d: Dict[str, Any]):
+        name = d.get('postprocessor')
+        if d.get('status') == 'started':
+            self._pp_started[name] = time.perf_counter()
+        elif d.get('status') == 'finished' and name in self._pp_started:
+            elapsed = time.perf_counter() - self._pp_started.pop(name)
+            self.postprocess_seconds += elapsed
+            STAGE_SECONDS.labels(self.platform, 'postprocess').observe(elapsed)
+
+    @contextmanager
+    def download(self):
+        """Time a download call, excluding the post-processing that ran inside it"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started - self.postprocess_seconds
+            STAGE_SECONDS.labels(self.platform, 'download').observe(max(0.0, elapsed))
+
+async def monitor_event_loop(interval: float = 0.5):
+    """Measure how late the event loop wakes up from a sleep"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, loop.time() - expected))
+
+class StatsCollector:
+    """Exposes the stats() of queues and caches as gauges at scrape time"""
+
+    def __init__(self, sources: Callable[[], Dict[str, Any]]):
+        self.sources = sources
+
+    def collect(self) -> Iterable:
+        try:
+            stats = self.sources()
+        except Exception as e:
+            logger.warning(f"Error collecting stats for metrics: {e}")
+            return
+
+        depth = GaugeMetricFamily('medigrabber_jobs', 'Jobs in the queue by status', labels=['platform', 'status'])
+        for platform, statuses in (stats.get('jobs') or {}).items():
+            for status, count in statuses.items():
+                depth.add_metric([platform, status], count)
+        yield depth
+
+        lookups = CounterMetricFamily('medigrabber_cache_lookups', 'Cache lookups by result', labels=['cache', 'result'])
+        hit_rate = GaugeMetricFamily('medigrabber_cache_hit_ratio', 'Share of cache lookups that were hits', labels=['cache'])
+        size = GaugeMetricFamily('medigrabber_cache_size', 'Entries held by each cache', labels=['cache'])
+        for cache in ('media_cache', 'info_cache', 'subscription_cache'):
+            cache_stats = stats.get(cache)
+            if not cache_stats:
+                continue
+            for result in ('hits', 'negative_hits', 'misses'):
+                if result in cache_stats:
+                    lookups.add_metric([cache, result], cache_stats[result])
+            hit_rate.add_metric([cache], cache_stats.get('hit_rate', 0.0))
+            size.add_metric([cache], cache_stats.get('entries', 0))
+        yield lookups
+        yield hit_rate
+        yield size
+
+        if stats.get('media_cache'):
+            yield GaugeMetricFamily('medigrabber_media_cache_bytes', 'Size of the media cache', value=stats['media_cache']['size_bytes'])
+        if stats.get('cleanup'):
+            yield GaugeMetricFamily('medigrabber_downloads_bytes', 'Size of user download directories', value=stats['cleanup']['size_bytes'])
+        if stats.get('record_writer'):
+            pending = GaugeMetricFamily('medigrabber_record_writes_pending', 'Buffered download_records writes', labels=['operation'])
+            pending.add_metric(['insert'], stats['record_writer']['pending_inserts'])
+            pending.add_metric(['update'], stats['record_writer']['pending_updates'])
+            yield pending
+
+def render_metrics(collector: StatsCollector) -> Tuple[bytes, str]:
+    """Prometheus exposition of the recorded metrics plus the shared stats.
+
+    With PROMETHEUS_MULTIPROC_DIR set, metrics recorded by every API and
+    worker process are merged; otherwise only this process's are reported.
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    stats_registry = CollectorRegistry()
+    stats_registry.register(collector)
+    return generate_latest(registry) + generate_latest(stats_registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,104 @@
+import copy
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Tuple
+
+from utils.lazy import lazy_import
+
+yt_dlp = lazy_import('yt_dlp')
+
+logger = logging.getLogger(__name__)
+
+def download_options(concurrent_fragments: int, chunk_size_mb: int, aria2c_connections: int) -> Dict[str, Any]:
+    """yt-dlp options for parallel fragment fetching and resumable partial files"""
+    options = {
+        # Fragmented (DASH/HLS) formats fetch this many fragments at once
+        'concurrent_fragment_downloads': max(1, concurrent_fragments),
+        # Keep .part/.ytdl files and continue them on the next attempt
+        'continuedl': True,
+        'nopart': False,
+    }
+    if chunk_size_mb > 0:
+        # Ranged requests avoid throttling of long single connections
+        options['http_chunk_size'] = chunk_size_mb * 1024 * 1024
+    if aria2c_connections > 0:
+        if shutil.which('aria2c'):
+            # Split plain HTTP(S) files into segments fetched over several connections
+            options['external_downloader'] = {'http': 'aria2c'}
+            options['external_downloader_args'] = {'aria2c': [
+                '-x', str(aria2c_connections), '-s', str(aria2c_connections), '-k', '1M', '--file-allocation=none'
+            ]}
+        else:
+            logger.warning("aria2c is not installed, downloading with a single connection per file")
+    return options
+
+class CombinedProgress:
+    """Reports the progress of streams downloaded side by side as one running total"""
+
+    def __init__(self, hooks: List[Callable[[Dict[str, Any]], None]]):
+        self.hooks = hooks
+        self._lock = threading.Lock()
+        self._streams: Dict[str, Tuple[int, int, float]] = {}
+
+    def __call__(self, d: Dict[str, Any]):
+        if d.get('status') not in ('downloading', 'finished'):
+            return
+        total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+        downloaded = d.get('downloaded_bytes') or 0
+        if d['status'] == 'finished':
+            downloaded = total = downloaded or total
+        with self._lock:
+            self._streams[d.get('filename')] = (downloaded, total, (d.get('speed') or 0) if d['status'] == 'downloading' else 0)
+            downloaded = sum(stream[0] for stream in self._streams.values())
+            total = sum(stream[1] for stream in self._streams.values())
+            speed = sum(stream[2] for stream in self._streams.values())
+
+            # A single finished stream is not the end of the job, the merge pass reports that
+            combined = {
+                'status': 'downloading',
+                'downloaded_bytes': downloaded,
+                'total_bytes': total or None,
+                'speed': speed or None,
+                'eta': int((total - downloaded) / speed) if speed and total > downloaded else None,
+            }
+            for hook in self.hooks:
+                hook(combined)
+
+def fetch_streams_concurrently(ydl: "yt_dlp.YoutubeDL", info: Dict[str, Any], max_streams: int = 2) -> bool:
+    """Download the streams of a merged format (``bestvideo+bestaudio``) side by side.
+
+    yt-dlp fetches the video and audio of a merged format one after the
+    other. This resolves the format selection without downloading, then
+    downloads each stream in its own thread to the same part file name
+    yt-dlp uses. The regular download that follows finds the parts complete
+    and only runs the ffmpeg merge. Returns False when there was nothing to
+    download concurrently.
+    """
+    from yt_dlp.downloader import get_suitable_downloader
+    from yt_dlp.downloader.external import FFmpegFD
+    from yt_dlp.utils import DownloadError
+
+    selected = ydl.process_ie_result(copy.deepcopy(info), download=False)
+    streams = selected.get('requested_formats') or []
+    if len(streams) < 2:
+        return False
+    if any(get_suitable_downloader(stream, ydl.params) is FFmpegFD for stream in streams):
+        # ffmpeg fetches and muxes these in one pass already
+        return False
+
+    stem = ydl.prepare_filename(selected, 'temp').rsplit('.', 1)[0]
+    stream_params = {**ydl.params, 'progress_hooks': [CombinedProgress(ydl.params.get('progress_hooks') or [])]}
+
+    def fetch(stream: Dict[str, Any]):
+        stream_info = {key: value for key, value in selected.items() if key != 'requested_formats'}
+        stream_info.update(stream)
+        with yt_dlp.YoutubeDL(stream_params) as stream_ydl:
+            success, _ = stream_ydl.dl(f"{stem}.f{stream['format_id']}.{stream['ext']}", stream_info)
+        if not success:
+            raise DownloadError(f"Failed to download format {stream['format_id']}")
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_streams, len(streams)))) as pool:
+        list(pool.map(fetch, streams))
+    return True
@@ -0,0 +1,207 @@
+import asyncio
+import json
+import sqlite3
+import time
+import logging
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Set, Tuple, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATES = ('completed', 'failed')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS progress (
+    download_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS progress_seq_idx ON progress (seq);
+CREATE INDEX IF NOT EXISTS progress_user_idx ON progress (user_id, seq);
+"""
+
+class ProgressStore:
+    """Latest progress snapshot per download, shared between workers and the API.
+
+    Workers write snapshots here instead of to the database; the API tails
+    the ``seq`` column to push changes to connected clients.
+    """
+
+    def __init__(self, path: Path, retention_seconds: int = 3600):
+        self.path = Path(path)
+        self.retention_seconds = retention_seconds
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_event(row: sqlite3.Row) -> Dict[str, Any]:
+        event = json.loads(row['data'])
+        event['seq'] = row['seq']
+        return event
+
+    def publish(self, targets: Iterable[Tuple[str, str]], event: Dict[str, Any]):
+        """Store an event as the latest snapshot for each (download_id, user_id) target"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM progress").fetchone()[0]
+                for download_id, user_id in targets:
+                    seq += 1
+                    data = json.dumps({**event, 'download_id': download_id, 'timestamp': now})
+                    conn.execute(
+                        "INSERT OR REPLACE INTO progress (download_id, user_id, seq, data, updated_at) VALUES (?, ?, ?, ?, ?)",
+                        (download_id, user_id, seq, data, now)
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def snapshot(self, download_id: str) -> Optional[Dict[str, Any]]:
+        """Latest event for a download"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM progress WHERE download_id = ?", (download_id,)).fetchone()
+        return {**self._to_event(row), 'user_id': row['user_id']} if row else None
+
+    def user_snapshots(self, user_id: str) -> List[Dict[str, Any]]:
+        """Latest event for each of a user's recent downloads"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM progress WHERE user_id = ? ORDER BY seq", (user_id,)).fetchall()
+        return [self._to_event(row) for row in rows]
+
+    def changes_since(self, seq: int) -> List[Tuple[str, Dict[str, Any]]]:
+        """(user_id, event) pairs written after the given sequence number"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT * FROM progress WHERE seq > ? ORDER BY seq", (seq,)).fetchall()
+        return [(row['user_id'], self._to_event(row)) for row in rows]
+
+    def latest_seq(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM progress").fetchone()[0]
+
+    def prune(self):
+        """Forget snapshots that have not changed within the retention window"""
+        cutoff = time.time() - self.retention_seconds
+        with self._connect() as conn:
+            conn.execute("DELETE FROM progress WHERE updated_at < ?", (cutoff,))
+
+class ProgressReporter:
+    """Publishes job progress, throttling repeated updates within the same state"""
+
+    def __init__(self, store: ProgressStore, targets: Callable[[], Iterable[Tuple[str, str]]], min_interval: float = 1.0):
+        self.store = store
+        self.targets = targets
+        self.min_interval = min_interval
+        self._last_state: Optional[str] = None
+        self._last_publish = 0.0
+
+    def __call__(self, state: str, **fields):
+        now = time.monotonic()
+        if state == self._last_state and now - self._last_publish < self.min_interval:
+            return
+        self._last_state = state
+        self._last_publish = now
+        try:
+            self.store.publish(self.targets(), {'status': state, **fields})
+        except Exception as e:
+            # Progress is best effort and must never fail the download
+            logger.warning(f"Failed to publish progress: {e}")
+
+    def ytdlp_hook(self, d: Dict[str, Any]):
+        """yt-dlp progress hook adapter"""
+        if d.get('status') == 'downloading':
+            self(
+                'downloading',
+                downloaded_bytes=d.get('downloaded_bytes'),
+                total_bytes=d.get('total_bytes') or d.get('total_bytes_estimate'),
+                speed=d.get('speed'),
+                eta=d.get('eta')
+            )
+        elif d.get('status') == 'finished':
+            self('processing', downloaded_bytes=d.get('downloaded_bytes') or d.get('total_bytes'))
+
+class ProgressBroker:
+    """In-process pub/sub that tails the progress store and fans events out to subscribers"""
+
+    def __init__(self, store: ProgressStore, poll_interval: float = 0.5, queue_size: int = 100):
+        self.store = store
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self._last_seq = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        self._last_seq = await asyncio.to_thread(self.store.latest_seq)
+        last_prune = time.monotonic()
+        while True:
+            try:
+                if self._subscribers:
+                    for user_id, event in await asyncio.to_thread(self.store.changes_since, self._last_seq):
+                        self._last_seq = event['seq']
+                        self._dispatch(f"download:{event['download_id']}", event)
+                        self._dispatch(f"user:{user_id}", event)
+                else:
+                    latest = await asyncio.to_thread(self.store.latest_seq)
+                    # A subscriber arriving meanwhile must still get events published after it subscribed
+                    if not self._subscribers:
+                        self._last_seq = latest
+                if time.monotonic() - last_prune > 600:
+                    await asyncio.to_thread(self.store.prune)
+                    last_prune = time.monotonic()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Progress broker poll failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def _dispatch(self, topic: str, event: Dict[str, Any]):
+        for queue in self._subscribers.get(topic, ()):
+            if queue.full():
+                # Slow consumer: drop the oldest update, the newest snapshot matters most
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def subscribe(self, topic: str) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[topic].add(queue)
+        return queue
+
+    def unsubscribe(self, topic: str, queue: asyncio.Queue):
+        subscribers = self._subscribers.get(topic)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[topic]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'topics': len(self._subscribers),
+            'subscribers': sum(len(queues) for queues in self._subscribers.values()),
+        }
@@ -0,0 +1,95 @@
+import sqlite3
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS buckets_updated_idx ON buckets (updated_at);
+"""
+
+class RateLimiter:
+    """Token buckets shared by all API processes through a SQLite file.
+
+    Each bucket holds up to ``capacity`` tokens and refills at ``rate``
+    tokens per second. A request may cost more than one token (a batch);
+    it is admitted once each bucket holds ``min(cost, capacity)`` tokens
+    and may drive buckets negative, so later requests wait off the debt.
+    """
+
+    def __init__(self, path: Path, idle_seconds: int = 3600):
+        self.path = Path(path)
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._stats = {'allowed': 0, 'limited': 0}
+        self._last_prune = time.time()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def acquire(self, buckets: List[Tuple[str, float, float, float]]) -> float:
+        """Take tokens from every (key, capacity, rate, cost) bucket, or from none of them.
+
+        Returns 0 when the request is admitted, otherwise the seconds to wait
+        before retrying.
+        """
+        buckets = [bucket for bucket in buckets if bucket[2] > 0]
+        if not buckets:
+            return 0.0
+
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                levels = {}
+                retry_after = 0.0
+                for key, capacity, rate, cost in buckets:
+                    row = conn.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+                    tokens = capacity if row is None else min(capacity, row['tokens'] + (now - row['updated_at']) * rate)
+                    levels[key] = tokens
+                    needed = min(cost, capacity)
+                    if tokens < needed:
+                        retry_after = max(retry_after, (needed - tokens) / rate)
+
+                if retry_after == 0:
+                    for key, _, _, cost in buckets:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?)",
+                            (key, levels[key] - cost, now)
+                        )
+                if now - self._last_prune > self.idle_seconds:
+                    # Idle buckets are full again and need no row
+                    self._last_prune = now
+                    conn.execute("DELETE FROM buckets WHERE updated_at < ?", (now - self.idle_seconds,))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        with self._lock:
+            self._stats['allowed' if retry_after == 0 else 'limited'] += 1
+        return retry_after
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats)
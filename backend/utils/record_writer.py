@@ -0,0 +1,146 @@
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Dict, Any, List, Tuple
+
+from utils.db import PostgrestError
+from utils.metrics import DB_WRITE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+class RecordWriter:
+    """Write-behind buffer for download_records.
+
+    Inserts are group-committed: callers get a future that resolves once
+    their row is part of a bulk insert, so concurrent requests share one
+    round trip while still learning about failures. When the database
+    rejects a batch, its rows are inserted one by one so only the offending
+    row's future fails. Updates are
+    fire-and-forget, coalesced per record and applied in bulk through the
+    ``bulk_update_download_records`` RPC.
+    """
+
+    def __init__(self, client, max_batch: int = 100, flush_interval: float = 0.05, max_retries: int = 5):
+        self.client = client
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._inserts: List[Tuple[Dict[str, Any], Future]] = []
+        self._updates: Dict[str, Dict[str, Any]] = {}
+        self._update_failures: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._stats = {'flushes': 0, 'rows_inserted': 0, 'rows_updated': 0, 'errors': 0}
+        self._thread = threading.Thread(target=self._run, name="record-writer", daemon=True)
+        self._thread.start()
+
+    def insert(self, row: Dict[str, Any]) -> Future:
+        """Queue a row for insertion; the future resolves when it is committed"""
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Record writer is closed")
+            self._inserts.append((row, future))
+            if len(self._inserts) >= self.max_batch:
+                self._wakeup.set()
+        return future
+
+    def update(self, download_id: str, **fields):
+        """Queue changes to a record, merged with any pending changes"""
+        with self._lock:
+            self._updates.setdefault(download_id, {}).update(fields)
+            if len(self._updates) >= self.max_batch:
+                self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+            with self._lock:
+                if self._closed and not self._inserts and not self._updates:
+                    return
+
+    def flush(self):
+        """Write everything buffered so far"""
+        with self._lock:
+            inserts, self._inserts = self._inserts, []
+            updates, self._updates = self._updates, {}
+
+        if inserts:
+            self._flush_inserts(inserts)
+        if updates:
+            self._flush_updates(updates)
+
+    def _flush_inserts(self, inserts: List[Tuple[Dict[str, Any], Future]]):
+        for start in range(0, len(inserts), self.max_batch):
+            self._insert_batch(inserts[start:start + self.max_batch])
+
+    def _insert_batch(self, batch: List[Tuple[Dict[str, Any], Future]]):
+        try:
+            with DB_WRITE_SECONDS.labels('insert').time():
+                self.client.table('download_records').insert([row for row, _ in batch]).execute()
+        except Exception as e:
+            self._stats['errors'] += 1
+            # A constraint violation in one row rejects the whole statement; isolate it
+            if len(batch) > 1 and isinstance(e, PostgrestError) and 400 <= e.status_code < 500:
+                logger.warning(f"Bulk insert of {len(batch)} download records rejected, inserting them one by one: {e}")
+                for item in batch:
+                    self._insert_batch([item])
+                return
+            logger.error(f"Error inserting {len(batch)} download records: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self._stats['flushes'] += 1
+        self._stats['rows_inserted'] += len(batch)
+        for _, future in batch:
+            future.set_result(None)
+
+    def _flush_updates(self, updates: Dict[str, Dict[str, Any]]):
+        items = list(updates.items())
+        for start in range(0, len(items), self.max_batch):
+            batch = items[start:start + self.max_batch]
+            try:
+                with DB_WRITE_SECONDS.labels('update').time():
+                    self.client.rpc('bulk_update_download_records', {
+                        'updates': [{'id': download_id, **fields} for download_id, fields in batch]
+                    }).execute()
+            except Exception as e:
+                logger.error(f"Error updating {len(batch)} download records: {e}")
+                self._stats['errors'] += 1
+                self._requeue_updates(batch)
+                continue
+            self._stats['flushes'] += 1
+            self._stats['rows_updated'] += len(batch)
+            for download_id, _ in batch:
+                self._update_failures.pop(download_id, None)
+
+    def _requeue_updates(self, batch: List[Tuple[str, Dict[str, Any]]]):
+        with self._lock:
+            for download_id, fields in batch:
+                failures = self._update_failures.get(download_id, 0) + 1
+                if failures > self.max_retries:
+                    logger.error(f"Dropping update for download record {download_id} after {failures} attempts")
+                    self._update_failures.pop(download_id, None)
+                    continue
+                self._update_failures[download_id] = failures
+                # Newer pending changes win over the ones being retried
+                self._updates[download_id] = {**fields, **self._updates.get(download_id, {})}
+
+    def close(self, timeout: float = 10.0):
+        """Flush remaining writes and stop the background thread"""
+        with self._lock:
+            self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        """Buffered rows and flush counters"""
+        with self._lock:
+            return {
+                'pending_inserts': len(self._inserts),
+                'pending_updates': len(self._updates),
+                **self._stats,
+            }
@@ -0,0 +1,64 @@
+import copy
+import logging
+import threading
+from typing import Optional, Dict, Any
+
+from utils.lazy import lazy_import
+
+yt_dlp = lazy_import('yt_dlp')
+
+logger = logging.getLogger(__name__)
+
+class FileTooLargeError(Exception):
+    """Raised when a download is, or turns out to be, larger than the allowed size"""
+
+    def __init__(self, size: int, max_bytes: int):
+        super().__init__(f"Download of {size / 1048576:.0f} MB exceeds the {max_bytes / 1048576:.0f} MB limit")
+        self.size = size
+        self.max_bytes = max_bytes
+
+def _format_size(fmt: Dict[str, Any], duration: Optional[float]) -> Optional[int]:
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return int(size)
+    # Fall back to the average bitrate (kbit/s) over the whole video
+    if fmt.get('tbr') and duration:
+        return int(fmt['tbr'] * 125 * duration)
+    return None
+
+def estimate_size(info: Dict[str, Any], format_selector: str) -> Optional[int]:
+    """Expected bytes of the formats a selector picks, or None if the extractor gave no sizes.
+
+    Format selection runs offline on the (cached) extraction, so nothing
+    is fetched from the platform.
+    """
+    with yt_dlp.YoutubeDL({'format': format_selector, 'quiet': True, 'noplaylist': True}) as ydl:
+        selected = ydl.process_ie_result(copy.deepcopy(info), download=False)
+    formats = selected.get('requested_formats') or [selected]
+    sizes = [_format_size(fmt, selected.get('duration')) for fmt in formats]
+    if any(size is None for size in sizes):
+        return None
+    return sum(sizes)
+
+class SizeGuard:
+    """yt-dlp progress hook that aborts a download once it grows past ``max_bytes``.
+
+    Streams of a merged format are counted together, whether they are
+    fetched one after the other or side by side.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._streams: Dict[Optional[str], int] = {}
+
+    def __call__(self, d: Dict[str, Any]):
+        # 'finished' is also reported for parts fetched in an earlier pass, which would count them twice
+        if d.get('status') != 'downloading' or not self.max_bytes:
+            return
+        with self._lock:
+            # An exact size from the server aborts a stream before its bytes arrive
+            self._streams[d.get('filename')] = max(d.get('downloaded_bytes') or 0, d.get('total_bytes') or 0)
+            total = sum(self._streams.values())
+        if total > self.max_bytes:
+            raise FileTooLargeError(total, self.max_bytes)
@@ -0,0 +1,228 @@
+import os
+import shutil
+import socket
+import logging
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Callable, BinaryIO, Iterator, Tuple
+
+from config import settings
+from utils.file_serving import content_disposition
+
+logger = logging.getLogger(__name__)
+
+class StoredFile:
+    """One stored file of a completed download"""
+
+    def __init__(self, key: str, size: int, mtime: float, opener: Callable[[], BinaryIO], path: Optional[Path] = None):
+        self.key = key
+        self.name = key.rsplit('/', 1)[-1]
+        self.size = size
+        self.mtime = mtime
+        self.path = path
+        self._opener = opener
+
+    def open(self) -> BinaryIO:
+        return self._opener()
+
+class LocalStorage:
+    """Completed downloads in a directory tree under ``root``.
+
+    With ``node`` set, the directory is private to this API node and records
+    remember the node URL so other nodes can route file requests to it.
+    Without it, ``root`` is a filesystem mounted on every node (NFS, EFS, ...).
+    """
+    remote = False
+
+    def __init__(self, root: Path, node: Optional[str] = None):
+        self.root = Path(root)
+        self.node = node
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path(self, key: str) -> Optional[Path]:
+        return self.root / key
+
+    def put(self, prefix: str, files: List[Path]):
+        """Store files under a key prefix, hardlinking them when on the same filesystem"""
+        dest_dir = self.root / prefix
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        for source in files:
+            target = dest_dir / source.name
+            if target.exists():
+                continue
+            try:
+                os.link(source, target)
+            except OSError:
+                # Source on a different filesystem (e.g. a shared mount); copy instead
+                shutil.copy2(source, target)
+
+    def files(self, key: str) -> List[StoredFile]:
+        """The file stored at ``key``, or every file under it if it is a prefix"""
+        path = self.root / key
+        if path.is_dir():
+            paths = sorted(f for f in path.iterdir() if f.is_file())
+        elif path.is_file():
+            paths = [path]
+        else:
+            return []
+        stored = []
+        for f in paths:
+            stat = f.stat()
+            stored.append(StoredFile(
+                f.relative_to(self.root).as_posix(), stat.st_size, stat.st_mtime,
+                lambda f=f: open(f, 'rb'), path=f
+            ))
+        return stored
+
+    def delete(self, key: str) -> int:
+        """Remove a file or prefix and its parent directory once empty; returns bytes freed"""
+        path = self.root / key
+        freed = sum(f.size for f in self.files(key))
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        elif path.exists():
+            path.unlink()
+            try:
+                # Single-file results live in a per-download directory
+                path.parent.rmdir()
+            except OSError:
+                pass
+        return freed
+
+    def url(self, key: str, filename: str) -> Optional[str]:
+        return None
+
+    def check(self):
+        if not os.access(self.root, os.W_OK):
+            raise OSError(f"{self.root} is not writable")
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': 'local' if self.node else 'shared', 'root': str(self.root), 'node': self.node}
+
+class S3Storage:
+    """Completed downloads in an S3-compatible bucket (AWS S3, MinIO, ...).
+
+    Workers upload with multipart transfers streamed from disk; the API
+    redirects clients to presigned URLs or streams objects through itself.
+    """
+    remote = True
+    node = None
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, public_endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, access_key_id: Optional[str] = None,
+                 secret_access_key: Optional[str] = None, presign_expires: int = 3600,
+                 multipart_chunk_mb: int = 16, upload_concurrency: int = 4):
+        try:
+            import boto3
+            from boto3.s3.transfer import TransferConfig
+            from botocore.config import Config
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+
+        self.bucket = bucket
+        self.presign_expires = presign_expires
+        session = boto3.session.Session(
+            aws_access_key_id=access_key_id, aws_secret_access_key=secret_access_key, region_name=region
+        )
+        client_config = Config(signature_version='s3v4', max_pool_connections=max(10, upload_concurrency * 2))
+        self.client = session.client('s3', endpoint_url=endpoint_url, config=client_config)
+        # Presigned URLs must name a host the browser can reach, which may differ from the internal endpoint
+        self.presign_client = (
+            session.client('s3', endpoint_url=public_endpoint_url, config=client_config)
+            if public_endpoint_url else self.client
+        )
+        chunk_size = multipart_chunk_mb * 1024 * 1024
+        self.transfer_config = TransferConfig(
+            multipart_threshold=chunk_size, multipart_chunksize=chunk_size, max_concurrency=upload_concurrency
+        )
+
+    def path(self, key: str) -> Optional[Path]:
+        return None
+
+    def put(self, prefix: str, files: List[Path]):
+        for source in files:
+            self.client.upload_file(
+                str(source), self.bucket, f"{prefix}/{source.name}",
+                ExtraArgs={'ContentType': 'application/octet-stream'}, Config=self.transfer_config
+            )
+
+    def _objects(self, key: str) -> List[Dict[str, Any]]:
+        objects = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=key):
+            for obj in page.get('Contents', []):
+                # A prefix match must end at a path separator: user/a1 is not under user/a
+                if obj['Key'] == key or obj['Key'].startswith(key.rstrip('/') + '/'):
+                    objects.append(obj)
+        return objects
+
+    def files(self, key: str) -> List[StoredFile]:
+        """The object stored at ``key``, or every object under it if it is a prefix"""
+        return [
+            StoredFile(
+                obj['Key'], obj['Size'], obj['LastModified'].timestamp(),
+                lambda k=obj['Key']: self.client.get_object(Bucket=self.bucket, Key=k)['Body']
+            )
+            for obj in sorted(self._objects(key), key=lambda o: o['Key'])
+        ]
+
+    def delete(self, key: str) -> int:
+        objects = self._objects(key)
+        for start in range(0, len(objects), 1000):
+            batch = objects[start:start + 1000]
+            self.client.delete_objects(
+                Bucket=self.bucket, Delete={'Objects': [{'Key': obj['Key']} for obj in batch], 'Quiet': True}
+            )
+        return sum(obj['Size'] for obj in objects)
+
+    def url(self, key: str, filename: str) -> Optional[str]:
+        """Presigned GET URL that downloads the object under ``filename``"""
+        return self.presign_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': key, 'ResponseContentDisposition': content_disposition(filename)},
+            ExpiresIn=self.presign_expires
+        )
+
+    def get(self, key: str, byte_range: Optional[str] = None) -> Tuple[int, Dict[str, str], Iterator[bytes]]:
+        """Status, headers and body of an object, honouring a Range header"""
+        params = {'Bucket': self.bucket, 'Key': key}
+        if byte_range:
+            params['Range'] = byte_range
+        response = self.client.get_object(**params)
+        headers = {
+            'Content-Length': str(response['ContentLength']),
+            'ETag': response['ETag'],
+            'Accept-Ranges': 'bytes',
+        }
+        if response.get('ContentRange'):
+            headers['Content-Range'] = response['ContentRange']
+        status = response['ResponseMetadata']['HTTPStatusCode']
+        return status, headers, response['Body'].iter_chunks(1024 * 1024)
+
+    def check(self):
+        self.client.head_bucket(Bucket=self.bucket)
+
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': 's3', 'bucket': self.bucket}
+
+def node_url() -> str:
+    """Base URL other API nodes use to reach this one"""
+    return settings.NODE_URL or f"http://{socket.gethostname()}:{settings.PORT}"
+
+def create_storage():
+    if settings.STORAGE_BACKEND == 's3':
+        return S3Storage(
+            settings.S3_BUCKET,
+            endpoint_url=settings.S3_ENDPOINT_URL,
+            public_endpoint_url=settings.S3_PUBLIC_ENDPOINT_URL,
+            region=settings.S3_REGION,
+            access_key_id=settings.S3_ACCESS_KEY_ID,
+            secret_access_key=settings.S3_SECRET_ACCESS_KEY,
+            presign_expires=settings.S3_PRESIGN_EXPIRES_SECONDS,
+            multipart_chunk_mb=settings.S3_MULTIPART_CHUNK_MB,
+            upload_concurrency=settings.S3_UPLOAD_CONCURRENCY
+        )
+    if settings.STORAGE_BACKEND == 'shared':
+        return LocalStorage(settings.DOWNLOADS_DIR)
+    if settings.STORAGE_BACKEND != 'local':
+        raise ValueError(f"Unknown STORAGE_BACKEND {settings.STORAGE_BACKEND!r}")
+    return LocalStorage(settings.DOWNLOADS_DIR, node=node_url())
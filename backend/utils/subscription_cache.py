@@ -0,0 +1,196 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, Callable, Iterable
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS invalidations (
+    user_id TEXT PRIMARY KEY,
+    invalidated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS invalidations_time_idx ON invalidations (invalidated_at);
+"""
+
+class SubscriptionCache:
+    """In-process TTL+LRU cache of subscription lookups.
+
+    Users without an active subscription are cached too (negative entries,
+    with their own TTL, never longer than the positive one). Invalidations
+    are recorded in a small SQLite table that every API and worker process
+    checks at most once per ``sync_interval``, so a plan change reaches all
+    processes quickly without a lookup on every download.
+
+    Each lookup takes a generation number; an invalidation that lands while
+    the loader is running discards it, so a load that read the old plan
+    cannot overwrite the invalidation.
+    """
+
+    def __init__(self, path: Path, ttl_seconds: int, negative_ttl_seconds: int,
+                 max_entries: int = 10000, sync_interval: float = 1.0):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = min(negative_ttl_seconds, ttl_seconds)
+        self.max_entries = max_entries
+        self.sync_interval = sync_interval
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._loading: Dict[str, int] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._last_sync = time.time()
+        self._stats = {'hits': 0, 'negative_hits': 0, 'misses': 0, 'invalidations': 0, 'evictions': 0}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def _sync_invalidations(self):
+        """Drop entries invalidated by other processes since the last check"""
+        now = time.time()
+        with self._lock:
+            if now - self._last_sync < self.sync_interval:
+                return
+            since, self._last_sync = self._last_sync, now
+
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT user_id FROM invalidations WHERE invalidated_at >= ?", (since - self.sync_interval,)
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Error reading subscription invalidations: {e}")
+            return
+
+        with self._lock:
+            for (user_id,) in rows:
+                self._entries.pop(user_id, None)
+                self._loading.pop(user_id, None)
+
+    def get(self, user_id: str, loader: Callable[[str], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """Return the cached subscription, calling ``loader`` on a miss.
+
+        The loader returns the subscription row, None when the user has no
+        active subscription, and raises on lookup errors (which are not cached).
+        """
+        self._sync_invalidations()
+        now = time.time()
+        with self._lock:
+            cached = self._entries.get(user_id)
+            if cached and cached[1] > now:
+                self._entries.move_to_end(user_id)
+                self._stats['hits' if cached[0] is not None else 'negative_hits'] += 1
+                return cached[0]
+            self._stats['misses'] += 1
+            self._generation += 1
+            generation = self._loading[user_id] = self._generation
+
+        try:
+            subscription = loader(user_id)
+        except Exception:
+            with self._lock:
+                if self._loading.get(user_id) == generation:
+                    del self._loading[user_id]
+            raise
+        ttl = self.ttl_seconds if subscription is not None else self.negative_ttl_seconds
+        with self._lock:
+            if self._loading.get(user_id) != generation:
+                # Invalidated (or reloaded) while loading; don't cache what may be stale
+                return subscription
+            del self._loading[user_id]
+            self._entries[user_id] = (subscription, now + ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+        return subscription
+
+    def invalidate(self, user_id: str):
+        """Forget a user's cached plan in every process"""
+        self.invalidate_many([user_id])
+
+    def invalidate_many(self, user_ids: Iterable[str]):
+        """Forget the cached plans of several users in every process"""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(user_id, None)
+                self._loading.pop(user_id, None)
+            self._stats['invalidations'] += len(user_ids)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.executemany(
+                "INSERT OR REPLACE INTO invalidations (user_id, invalidated_at) VALUES (?, ?)",
+                [(user_id, now) for user_id in user_ids]
+            )
+            conn.execute("DELETE FROM invalidations WHERE invalidated_at < ?", (now - 3600,))
+            conn.execute("COMMIT")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['negative_hits'] + self._stats['misses']
+            hits = self._stats['hits'] + self._stats['negative_hits']
+            return {
+                'entries': len(self._entries),
+                **self._stats,
+                'hit_rate': hits / lookups if lookups else 0.0,
+            }
+
+class SubscriptionChangeFeed:
+    """Invalidates cached plans of subscriptions changed in the database.
+
+    ``subscriptions.updated_at`` is maintained by a trigger, so polling for
+    rows newer than the last one seen catches plan changes made anywhere
+    (billing webhooks, the dashboard, SQL). Every node polls on its own and
+    fans the invalidation out to its processes through the cache's SQLite
+    table. The watermark is a database timestamp, so clock skew between the
+    node and the database does not matter.
+    """
+
+    def __init__(self, client, cache: SubscriptionCache, batch_size: int = 1000):
+        self.client = client
+        self.cache = cache
+        self.batch_size = batch_size
+        self._watermark: Optional[str] = None
+
+    def poll(self) -> int:
+        """Invalidate users whose subscription changed since the last poll; returns how many rows were seen"""
+        if self._watermark is None:
+            # Anything older was loaded after it changed, so start from the newest row
+            rows = self.client.table('subscriptions').select('updated_at').order('updated_at', desc=True).limit(1).execute().data
+            self._watermark = rows[0]['updated_at'] if rows else '1970-01-01T00:00:00+00:00'
+            return 0
+
+        rows = (
+            self.client.table('subscriptions').select('user_id,updated_at')
+            .gt('updated_at', self._watermark).order('updated_at').limit(self.batch_size).execute().data
+        )
+        if rows:
+            self.cache.invalidate_many({row['user_id'] for row in rows})
+            self._watermark = rows[-1]['updated_at']
+        return len(rows)
+
+async def watch_subscription_changes(feed: SubscriptionChangeFeed, interval: float):
+    """Poll for subscription changes in the background of an asyncio application"""
+    while True:
+        try:
+            await asyncio.to_thread(feed.poll)
+        except Exception as e:
+            logger.warning(f"Error polling subscription changes: {e}")
+        await asyncio.sleep(interval)
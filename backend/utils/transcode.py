@@ -0,0 +1,180 @@
+import os
+import json
+import fcntl
+import time
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+class TranscodeError(Exception):
+    """Raised when ffprobe or ffmpeg fails on a downloaded file"""
+
+class TranscodePreset:
+    """Target container and audio encoding of a finished download.
+
+    Streams whose codec the container already accepts are copied (a remux);
+    video is never re-encoded, and audio only when its codec is not in
+    ``copy_audio`` or its bitrate is above ``audio_bitrate`` kbps.
+    """
+
+    def __init__(self, name: str, container: str, audio_codec: str, audio_bitrate: int,
+                 copy_audio: Tuple[str, ...] = (), video: bool = False, copy_video: Tuple[str, ...] = (),
+                 fallback_container: Optional[str] = None):
+        self.name = name
+        self.container = container
+        self.audio_codec = audio_codec
+        self.audio_bitrate = audio_bitrate
+        self.copy_audio = copy_audio
+        self.video = video
+        self.copy_video = copy_video
+        self.fallback_container = fallback_container
+
+PRESETS: Dict[str, TranscodePreset] = {
+    'mp3-128': TranscodePreset('mp3-128', 'mp3', 'libmp3lame', 128, copy_audio=('mp3',)),
+    'mp3-256': TranscodePreset('mp3-256', 'mp3', 'libmp3lame', 256, copy_audio=('mp3',)),
+    'mp3-320': TranscodePreset('mp3-320', 'mp3', 'libmp3lame', 320, copy_audio=('mp3',)),
+    # Video codecs outside MP4 (e.g. VP8) are remuxed into MKV rather than re-encoded
+    'mp4': TranscodePreset(
+        'mp4', 'mp4', 'aac', 192, copy_audio=('aac', 'mp3'), video=True,
+        copy_video=('h264', 'hevc', 'av1', 'vp9'), fallback_container='mkv'
+    ),
+}
+
+def probe(path: Path) -> Dict[str, Any]:
+    """Codec and bitrate (bits/s) of the first video and audio stream of a file"""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_streams', '-show_format', '-of', 'json', str(path)],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise TranscodeError(f"ffprobe failed for {path.name}: {result.stderr.strip()}")
+    data = json.loads(result.stdout)
+    streams: Dict[str, Any] = {}
+    for stream in data.get('streams', []):
+        kind = stream.get('codec_type')
+        if kind in ('video', 'audio') and kind not in streams:
+            streams[kind] = stream
+    # WebM audio streams carry no bitrate of their own, only the container does
+    bitrate = (streams.get('audio') or {}).get('bit_rate') or data.get('format', {}).get('bit_rate')
+    return {
+        'video_codec': (streams.get('video') or {}).get('codec_name'),
+        'audio_codec': (streams.get('audio') or {}).get('codec_name'),
+        'audio_bitrate': int(bitrate) if bitrate else None,
+    }
+
+def plan(source: Dict[str, Any], preset: TranscodePreset) -> Tuple[str, List[str]]:
+    """Output container and ffmpeg codec arguments turning a probed source into a preset"""
+    args: List[str] = []
+    container = preset.container
+    if preset.video and source['video_codec']:
+        args += ['-map', '0:v:0', '-c:v', 'copy']
+        if source['video_codec'] not in preset.copy_video:
+            container = preset.fallback_container or container
+    else:
+        args += ['-vn']
+
+    if source['audio_codec']:
+        args += ['-map', '0:a:0']
+        bitrate = source['audio_bitrate']
+        within_bitrate = bitrate is not None and bitrate <= preset.audio_bitrate * 1000
+        # The fallback container (MKV) accepts any audio codec
+        fits_container = source['audio_codec'] in preset.copy_audio or container != preset.container
+        if fits_container and (preset.video or within_bitrate):
+            args += ['-c:a', 'copy']
+        else:
+            args += ['-c:a', preset.audio_codec, '-b:a', f"{preset.audio_bitrate}k"]
+    elif not preset.video:
+        raise TranscodeError("Source has no audio stream")
+
+    if container == 'mp4':
+        # Let players start before the whole file has arrived
+        args += ['-movflags', '+faststart']
+    return container, args
+
+def is_remux(args: List[str]) -> bool:
+    return '-c:a' not in args or args[args.index('-c:a') + 1] == 'copy'
+
+class HostSlots:
+    """Counting semaphore shared by every process on the host.
+
+    Each slot is a lock file; holding an exclusive flock on one is holding
+    the slot. The kernel drops the lock when a process dies, so a crashed
+    worker never leaks a slot.
+    """
+
+    def __init__(self, directory: Path, slots: int, poll_interval: float = 0.1):
+        self.directory = Path(directory)
+        self.slots = slots
+        self.poll_interval = poll_interval
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def acquire(self):
+        while True:
+            for index in range(self.slots):
+                lock_file = open(self.directory / f"slot-{index}.lock", 'a')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    lock_file.close()
+                    continue
+                try:
+                    yield index
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+                return
+            time.sleep(self.poll_interval)
+
+class Transcoder:
+    """Runs ffmpeg post-processing on its own pool, sized to CPU cores.
+
+    Downloads are network-bound and transcodes CPU-bound; keeping them in
+    separate pools bounds concurrent ffmpeg processes by the cores available
+    no matter how many downloads run at once. With ``slots_dir`` the bound
+    holds for the whole host: every worker process draws from the same
+    ``workers`` lock-file slots.
+    """
+
+    def __init__(self, workers: int = 0, ffmpeg_threads: int = 1, slots_dir: Optional[Path] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self.ffmpeg_threads = ffmpeg_threads
+        self._slots = HostSlots(slots_dir, self.workers) if slots_dir else None
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='transcode')
+
+    def transcode(self, source: Path, preset: TranscodePreset, dest_dir: Path) -> Optional[Path]:
+        """Convert ``source`` into ``dest_dir`` with a preset on the pool, waiting for the result.
+
+        Returns None when the source already is in the preset's format.
+        """
+        return self._pool.submit(self._run_in_slot, source, preset, dest_dir).result()
+
+    def _run_in_slot(self, source: Path, preset: TranscodePreset, dest_dir: Path) -> Optional[Path]:
+        if self._slots is None:
+            return self._run(source, preset, dest_dir)
+        with self._slots.acquire():
+            return self._run(source, preset, dest_dir)
+
+    def _run(self, source: Path, preset: TranscodePreset, dest_dir: Path) -> Optional[Path]:
+        container, args = plan(probe(source), preset)
+        if is_remux(args) and source.suffix == f".{container}":
+            return None
+        target = dest_dir / f"{source.stem}.{container}"
+        command = [
+            'ffmpeg', '-nostdin', '-hide_banner', '-loglevel', 'error', '-y',
+            '-i', str(source), *args, '-threads', str(self.ffmpeg_threads), str(target)
+        ]
+        result = subprocess.run(command, capture_output=True, text=True)
+        if result.returncode != 0:
+            target.unlink(missing_ok=True)
+            raise TranscodeError(f"ffmpeg failed for {source.name} ({preset.name}): {result.stderr.strip()[-500:]}")
+        logger.info(f"{'Remuxed' if is_remux(args) else 'Transcoded'} {source.name} to {target.name} ({preset.name})")
+        return target
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait, cancel_futures=True)
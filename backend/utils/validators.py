@@ -56,4 +56,30 @@ def get_instagram_media_type(url: str) -> Optional[str]:
         return 'reel'
     elif '/stories/' in url:
         return 'story'
-    return None
\ No newline at end of file
+    return None
+
+def extract_youtube_playlist_id(url: str) -> Optional[str]:
+    """Extract playlist ID from a YouTube playlist URL"""
+    parsed_url = urlparse(url)
+    if parsed_url.hostname not in ('www.youtube.com', 'youtube.com', 'm.youtube.com'):
+        return None
+    if parsed_url.path != '/playlist':
+        return None
+    match = re.search(r'(?:^|&)list=([A-Za-z0-9_-]+)', parsed_url.query)
+    return match.group(1) if match else None
+
+def extract_instagram_profile(url: str) -> Optional[str]:
+    """Extract username from an Instagram profile URL"""
+    match = re.match(r'(https?://)?(www\.)?instagram\.com/([A-Za-z0-9_.]+)/?(\?.*)?$', url)
+    if not match or match.group(3) in ('p', 'reel', 'reels', 'stories', 'explore', 'accounts', 'tv'):
+        return None
+    return match.group(3)
+
+def get_platform(url: str) -> Optional[str]:
+    """Determine which platform a URL belongs to"""
+    hostname = (urlparse(url).hostname or '').lower()
+    if hostname in ('youtu.be', 'youtube.com') or hostname.endswith('.youtube.com'):
+        return 'YouTube'
+    if hostname == 'instagram.com' or hostname.endswith('.instagram.com'):
+        return 'Instagram'
+    return None
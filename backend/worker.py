@@ -0,0 +1,209 @@
+import os
+import signal
+import socket
+import logging
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# Workers always download; import the extractors up front rather than on first use in job threads
+import yt_dlp  # noqa: F401
+import instaloader  # noqa: F401
+from fastapi import HTTPException
+from dotenv import load_dotenv
+
+# Settings are read from the environment on import, so .env must be loaded first
+load_dotenv()
+
+from config import settings
+from utils.executor import DownloadExecutor
+from utils.job_queue import JobQueue
+from utils.progress import ProgressReporter
+from utils.storage import node_url
+from utils.metrics import STAGE_SECONDS, JOB_SECONDS
+from main import (
+    db,
+    job_queue,
+    progress_store,
+    record_writer,
+    YouTubeDownloadRequest,
+    InstagramDownloadRequest,
+    download_youtube_video,
+    download_instagram_media,
+    finalize_download,
+    mark_download_failed,
+)
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_INTERVAL = 5.0
+
+JOB_HANDLERS = {
+    'YouTube': (YouTubeDownloadRequest, download_youtube_video),
+    'Instagram': (InstagramDownloadRequest, download_instagram_media),
+}
+
+def recover_orphaned_records(queue: JobQueue) -> int:
+    """Re-enqueue download records of this node left in 'pending' without a queued job"""
+    if not db:
+        return 0
+
+    try:
+        response = db.table('download_records').select(
+            'id, user_id, platform, url, media_type, quality, media_key, job_weight'
+        ).eq('status', 'pending').eq('queue_node', node_url()).execute()
+    except Exception as e:
+        logger.error(f"Error fetching pending download records: {e}")
+        return 0
+
+    recovered = 0
+    for record in response.data or []:
+        if record['platform'] not in JOB_HANDLERS:
+            continue
+        payload = {
+            'url': record['url'],
+            'media_type': record['media_type'],
+            'quality': record.get('quality') or 'standard',
+            'user_id': record['user_id'],
+        }
+        if queue.enqueue(record['platform'], record['id'], payload, record.get('media_key'), record.get('job_weight') or 1):
+            recovered += 1
+
+    if recovered:
+        logger.info(f"Recovered {recovered} orphaned pending downloads")
+    return recovered
+
+class Worker:
+    """Leases jobs from the durable queue and runs them on the download executor"""
+
+    def __init__(self, queue: JobQueue, worker_id: Optional[str] = None, shutdown_grace: Optional[float] = None):
+        self.queue = queue
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.shutdown_grace = settings.WORKER_SHUTDOWN_GRACE_SECONDS if shutdown_grace is None else shutdown_grace
+        self.executor = DownloadExecutor(
+            pool_sizes={
+                'YouTube': settings.YOUTUBE_WORKERS,
+                'Instagram': settings.INSTAGRAM_WORKERS,
+            }
+        )
+        self._running: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def run(self) -> int:
+        """Poll the queue until stopped, then drain running jobs; returns how many had to be released"""
+        logger.info(f"Download worker {self.worker_id} started")
+        self.queue.prune(older_than_seconds=86400)
+        recover_orphaned_records(self.queue)
+
+        last_renewal = time.monotonic()
+        last_heartbeat = time.monotonic() - HEARTBEAT_INTERVAL
+        while not self._stop.is_set():
+            if time.monotonic() - last_heartbeat >= HEARTBEAT_INTERVAL:
+                self.queue.heartbeat(self.worker_id)
+                last_heartbeat = time.monotonic()
+
+            for platform in JOB_HANDLERS:
+                for job in self.queue.lease(platform, self.worker_id, self.executor.available(platform)):
+                    self._start(job)
+
+            last_renewal = self._renew(last_renewal)
+            self._stop.wait(settings.WORKER_POLL_INTERVAL)
+
+        self.queue.deregister(self.worker_id)
+        released = self._drain()
+        logger.info(f"Download worker {self.worker_id} stopped")
+        return released
+
+    def _renew(self, last_renewal: float) -> float:
+        """Extend the leases of running jobs every third of the lease period"""
+        if time.monotonic() - last_renewal < self.queue.lease_seconds / 3:
+            return last_renewal
+        with self._lock:
+            job_ids = list(self._running)
+        self.queue.renew(job_ids, self.worker_id)
+        return time.monotonic()
+
+    def _drain(self) -> int:
+        """Let running jobs finish within the shutdown grace, keeping their leases alive meanwhile.
+
+        Jobs still running after it are released back to the queue, so another
+        worker picks them up right away instead of after their lease expires.
+        """
+        self.executor.shutdown(wait=False)
+        deadline = time.monotonic() + self.shutdown_grace
+        last_renewal = time.monotonic()
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self._running:
+                    return 0
+            last_renewal = self._renew(last_renewal)
+            time.sleep(min(settings.WORKER_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+
+        with self._lock:
+            job_ids = list(self._running)
+        released = self.queue.release(job_ids, self.worker_id)
+        if released:
+            logger.warning(f"Released {released} unfinished jobs after {self.shutdown_grace:.0f}s shutdown grace")
+        return released
+
+    def stop(self, *_):
+        self._stop.set()
+
+    def _start(self, job: Dict[str, Any]):
+        if job['attempts'] == 1:
+            STAGE_SECONDS.labels(job['platform'], 'queued').observe(max(0.0, time.time() - job['created_at']))
+        with self._lock:
+            self._running[job['id']] = job
+        self.executor.submit(job['platform'], self._process, job)
+
+    def _process(self, job: Dict[str, Any]):
+        model, handler = JOB_HANDLERS[job['platform']]
+        download_id = job['download_id']
+        progress = ProgressReporter(progress_store, lambda: self._progress_targets(job), settings.PROGRESS_MIN_INTERVAL)
+        started = time.perf_counter()
+        try:
+            cached_dir = handler(model(**job['payload']), download_id, progress)
+        except Exception as e:
+            JOB_SECONDS.labels(job['platform'], 'failed').observe(time.perf_counter() - started)
+            # Client errors (bad URL, plan restrictions) will not succeed on retry
+            retry = not (isinstance(e, HTTPException) and e.status_code < 500)
+            error = e.detail if isinstance(e, HTTPException) else str(e)
+            if self.queue.fail(job['id'], error, retry=retry):
+                logger.warning(f"Job {job['id']} attempt {job['attempts']} failed, retrying: {error}")
+            else:
+                for follower in [job] + self.queue.followers(job['id']):
+                    mark_download_failed(follower['download_id'], follower['payload']['user_id'], error)
+        else:
+            JOB_SECONDS.labels(job['platform'], 'completed').observe(time.perf_counter() - started)
+            self._complete_followers(self.queue.complete(job['id']), cached_dir)
+        finally:
+            with self._lock:
+                self._running.pop(job['id'], None)
+
+    def _progress_targets(self, job: Dict[str, Any]) -> List[tuple]:
+        """Downloads that should see a job's progress: the job itself and its followers"""
+        jobs = [job] + self.queue.followers(job['id'])
+        return [(j['download_id'], j['payload']['user_id']) for j in jobs]
+
+    def _complete_followers(self, followers: List[Dict[str, Any]], cached_dir: Path):
+        """Complete downloads that were attached to a job from its shared result"""
+        for follower in followers:
+            try:
+                finalize_download(follower['payload']['user_id'], follower['download_id'], cached_dir)
+            except Exception as e:
+                logger.error(f"Failed to complete attached download {follower['download_id']}: {e}")
+                mark_download_failed(follower['download_id'], follower['payload']['user_id'], str(e))
+
+if __name__ == "__main__":
+    worker = Worker(job_queue)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    released = worker.run()
+    if record_writer:
+        record_writer.close()
+    if released:
+        # Threads of the released jobs would hold up interpreter exit; their jobs run again elsewhere
+        logging.shutdown()
+        os._exit(0)
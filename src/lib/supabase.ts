@@ -77,7 +77,7 @@ export type Database = {
           file_path: string | null;
           filename: string | null;
           file_size: number | null;
-          status: 'pending' | 'completed' | 'failed';
+          status: 'pending' | 'completed' | 'failed' | 'expired';
           error_message: string | null;
           created_at: string;
           subscription_id: string | null;
@@ -92,7 +92,7 @@ export type Database = {
           file_path?: string | null;
           filename?: string | null;
           file_size?: number | null;
-          status?: 'pending' | 'completed' | 'failed';
+          status?: 'pending' | 'completed' | 'failed' | 'expired';
           error_message?: string | null;
           created_at?: string;
           subscription_id?: string | null;
@@ -107,7 +107,7 @@ export type Database = {
           file_path?: string | null;
           filename?: string | null;
           file_size?: number | null;
-          status?: 'pending' | 'completed' | 'failed';
+          status?: 'pending' | 'completed' | 'failed' | 'expired';
           error_message?: string | null;
           created_at?: string;
           subscription_id?: string | null;
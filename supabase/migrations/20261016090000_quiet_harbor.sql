@@ -0,0 +1,29 @@
+/*
+  # Bulk download record updates
+
+  1. New Functions
+    - `bulk_update_download_records(updates jsonb)`
+      - Applies a batch of partial updates to `download_records` in one call
+      - Each element is an object with an `id` and any of `status`, `filename`,
+        `file_path`, `file_size`, `error_message`; keys that are absent keep
+        their current value
+
+  2. Security
+    - Only the service role may execute the function; it is used by the
+      backend's write-behind buffer and bypasses per-user policies
+*/
+
+CREATE OR REPLACE FUNCTION bulk_update_download_records(updates jsonb)
+RETURNS void AS $$
+  UPDATE public.download_records AS d SET
+    status = CASE WHEN u.item ? 'status' THEN u.item->>'status' ELSE d.status END,
+    filename = CASE WHEN u.item ? 'filename' THEN u.item->>'filename' ELSE d.filename END,
+    file_path = CASE WHEN u.item ? 'file_path' THEN u.item->>'file_path' ELSE d.file_path END,
+    file_size = CASE WHEN u.item ? 'file_size' THEN (u.item->>'file_size')::bigint ELSE d.file_size END,
+    error_message = CASE WHEN u.item ? 'error_message' THEN u.item->>'error_message' ELSE d.error_message END
+  FROM jsonb_array_elements(updates) AS u(item)
+  WHERE d.id = (u.item->>'id')::uuid;
+$$ LANGUAGE sql;
+
+REVOKE ALL ON FUNCTION bulk_update_download_records(jsonb) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION bulk_update_download_records(jsonb) TO service_role;
@@ -0,0 +1,16 @@
+/*
+  # Batch downloads
+
+  1. Changes
+    - `download_records.batch_id` (uuid, nullable)
+      - Groups the records created by one batch download request
+
+  2. Indexes
+    - Partial index on `batch_id` for batch status and archive lookups
+*/
+
+ALTER TABLE download_records ADD COLUMN IF NOT EXISTS batch_id uuid;
+
+CREATE INDEX IF NOT EXISTS download_records_batch_id_idx
+  ON download_records (batch_id, created_at)
+  WHERE batch_id IS NOT NULL;
@@ -0,0 +1,10 @@
+/*
+  # Index for download cleanup
+
+  1. Indexes
+    - `download_records (created_at)` so the cleanup job can page through
+      expired records without scanning the table
+*/
+
+CREATE INDEX IF NOT EXISTS download_records_created_at_idx
+  ON download_records (created_at);
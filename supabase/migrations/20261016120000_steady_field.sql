@@ -0,0 +1,32 @@
+/*
+  # Download storage location
+
+  1. Changes
+    - `download_records.storage_node` (text, nullable)
+      - Base URL of the API node whose local disk holds the files of a
+        completed download; other nodes relay file requests to it
+      - NULL when files are on storage every node can read (a shared
+        filesystem or an S3 bucket), and for older records
+
+  2. New Functions
+    - `bulk_update_download_records(updates jsonb)` also applies
+      `storage_node`
+*/
+
+ALTER TABLE download_records ADD COLUMN IF NOT EXISTS storage_node text;
+
+CREATE OR REPLACE FUNCTION bulk_update_download_records(updates jsonb)
+RETURNS void AS $$
+  UPDATE public.download_records AS d SET
+    status = CASE WHEN u.item ? 'status' THEN u.item->>'status' ELSE d.status END,
+    filename = CASE WHEN u.item ? 'filename' THEN u.item->>'filename' ELSE d.filename END,
+    file_path = CASE WHEN u.item ? 'file_path' THEN u.item->>'file_path' ELSE d.file_path END,
+    file_size = CASE WHEN u.item ? 'file_size' THEN (u.item->>'file_size')::bigint ELSE d.file_size END,
+    error_message = CASE WHEN u.item ? 'error_message' THEN u.item->>'error_message' ELSE d.error_message END,
+    storage_node = CASE WHEN u.item ? 'storage_node' THEN u.item->>'storage_node' ELSE d.storage_node END
+  FROM jsonb_array_elements(updates) AS u(item)
+  WHERE d.id = (u.item->>'id')::uuid;
+$$ LANGUAGE sql;
+
+REVOKE ALL ON FUNCTION bulk_update_download_records(jsonb) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION bulk_update_download_records(jsonb) TO service_role;
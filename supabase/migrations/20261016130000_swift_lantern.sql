@@ -0,0 +1,12 @@
+/*
+  # Index for download history
+
+  1. Indexes
+    - `download_records (user_id, created_at DESC, id DESC)` covering the
+      columns of the history view, so keyset-paginated history pages are
+      index-only range scans however deep the user pages
+*/
+
+CREATE INDEX IF NOT EXISTS download_records_user_history_idx
+  ON download_records (user_id, created_at DESC, id DESC)
+  INCLUDE (platform, media_type, status, filename, file_path, file_size, error_message);
@@ -0,0 +1,19 @@
+/*
+  # Accepting node of queued downloads
+
+  1. Changes
+    - `download_records.queue_node` (text, nullable)
+      - Base URL of the API node that accepted the download and holds its
+        job in its local queue; a node's workers only re-enqueue pending
+        records of their own node
+      - NULL for older records
+
+  2. Indexes
+    - Pending records per node, scanned when a worker starts
+*/
+
+ALTER TABLE download_records ADD COLUMN IF NOT EXISTS queue_node text;
+
+CREATE INDEX IF NOT EXISTS download_records_pending_node_idx
+  ON download_records (queue_node)
+  WHERE status = 'pending';
@@ -0,0 +1,14 @@
+/*
+  # Scheduling details of queued downloads
+
+  1. Changes
+    - `download_records.media_key` (text, nullable)
+      - Key of the media a download resolves to; jobs recovered from a
+        pending record coalesce with identical in-flight jobs again
+    - `download_records.job_weight` (real, nullable)
+      - Fair-share weight of the user's plan when the download was queued
+      - NULL for older records, which are recovered with weight 1
+*/
+
+ALTER TABLE download_records ADD COLUMN IF NOT EXISTS media_key text;
+ALTER TABLE download_records ADD COLUMN IF NOT EXISTS job_weight real;
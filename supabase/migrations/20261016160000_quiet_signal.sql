@@ -0,0 +1,17 @@
+/*
+  # Subscription change feed
+
+  1. Changes
+    - Make sure `subscriptions.updated_at` is bumped on every update
+      (the trigger from the auth integration migration, recreated idempotently)
+    - Index `subscriptions.updated_at`
+      - API processes poll for subscriptions changed since the last row they
+        saw and invalidate the cached plans of those users
+*/
+
+DROP TRIGGER IF EXISTS update_subscriptions_updated_at ON public.subscriptions;
+CREATE TRIGGER update_subscriptions_updated_at
+  BEFORE UPDATE ON public.subscriptions
+  FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+CREATE INDEX IF NOT EXISTS subscriptions_updated_at_idx ON public.subscriptions (updated_at);
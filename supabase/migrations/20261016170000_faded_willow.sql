@@ -0,0 +1,13 @@
+/*
+  # Expired download status
+
+  1. Changes
+    - `download_records.status` also accepts `expired`
+      - Set by the cleanup job when it evicts a completed download's files to
+        stay within the disk quota; the record stays in the user's history
+        with `file_path` cleared
+*/
+
+ALTER TABLE download_records DROP CONSTRAINT IF EXISTS download_records_status_check;
+ALTER TABLE download_records ADD CONSTRAINT download_records_status_check
+  CHECK (status IN ('pending', 'completed', 'failed', 'expired'));
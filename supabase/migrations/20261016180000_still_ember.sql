@@ -0,0 +1,35 @@
+/*
+  # Download history version
+
+  1. Changes
+    - `download_records.updated_at` (timestamptz), bumped on every update by
+      the shared `update_updated_at_column` trigger function
+    - Index on `(user_id, updated_at DESC)`
+
+  2. New Functions
+    - `download_history_version(p_user_id uuid)`
+      - Number of the user's records and their latest change; the history
+        endpoint derives its ETag from it and answers 304 without reading
+        the page itself
+
+  3. Security
+    - Only the service role may execute the function
+*/
+
+ALTER TABLE download_records ADD COLUMN IF NOT EXISTS updated_at timestamptz DEFAULT now();
+
+DROP TRIGGER IF EXISTS update_download_records_updated_at ON public.download_records;
+CREATE TRIGGER update_download_records_updated_at
+  BEFORE UPDATE ON public.download_records
+  FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
+CREATE INDEX IF NOT EXISTS download_records_user_updated_idx
+  ON download_records (user_id, updated_at DESC);
+
+CREATE OR REPLACE FUNCTION download_history_version(p_user_id uuid)
+RETURNS TABLE (total bigint, last_change timestamptz) AS $$
+  SELECT count(*), max(updated_at) FROM public.download_records WHERE user_id = p_user_id;
+$$ LANGUAGE sql STABLE;
+
+REVOKE ALL ON FUNCTION download_history_version(uuid) FROM PUBLIC, anon, authenticated;
+GRANT EXECUTE ON FUNCTION download_history_version(uuid) TO service_role;